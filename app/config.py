@@ -3,6 +3,7 @@ import os
 import configparser
 from pathlib import Path
 import logging
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
@@ -37,18 +38,93 @@ class Config:
         
         self.config['DATABASE'] = {
             'CSVPath': './data/guests.csv',
-            'BackupDir': './data/backups'
+            'BackupDir': './data/backups',
+            'StaleLockSeconds': '30'
         }
         
         self.config['PATHS'] = {
             'StaticDir': './static',
             'TemplatesDir': './templates',
-            'LogsDir': './logs'
+            'LogsDir': './logs',
+            'AssetCacheDir': './data/asset_cache'
         }
         
         self.config['SECURITY'] = {
             'MaxLoginAttempts': '3',
-            'SessionTimeout': '30'
+            'SessionTimeout': '30',
+            'LoginWindowSeconds': '60',
+            'MaxAttemptsPerIP': '300',
+            'TrustForwardedFor': 'False',
+            'TrustedProxyHops': '1',
+            'RateLimitStore': 'memory',
+            'RateLimitPath': './data/rate_limits.json'
+        }
+
+        self.config['COMPRESSION'] = {
+            'Enabled': 'True',
+            'MinimumSize': '1024',
+            'GzipLevel': '6',
+            'BrotliQuality': '4',
+            'MinifyHTML': 'True'
+        }
+
+        self.config['IMAGES'] = {
+            'CacheDir': './data/image_cache',
+            'Widths': '320,640,960,1280',
+            'WebPQuality': '75',
+            'JPEGQuality': '80'
+        }
+
+        self.config['CACHE'] = {
+            'GuestPageEntries': '500'
+        }
+
+        self.config['PROFILING'] = {
+            'SlowRequestMs': '500',
+            'SlowLogPath': './logs/slow_requests.log',
+            'ProfileDir': './data/profiles',
+            'MaxProfiles': '50'
+        }
+
+        self.config['CHECKIN'] = {
+            'LogPath': './data/checkins.jsonl',
+            'KeyPath': './data/checkin.key'
+        }
+
+        self.config['DUPLICATES'] = {
+            'MinScore': '0.6',
+            'MaxBlockSize': '100',
+            'DismissedPath': './data/duplicates_dismissed.json'
+        }
+
+        self.config['HISTORY'] = {
+            'LogPath': './data/guests_history.jsonl'
+        }
+
+        self.config['OFFLINE'] = {
+            'PrecacheDirs': 'css,js,schedule'
+        }
+
+        self.config['EVENTS'] = {
+            'Enabled': 'False',
+            'Root': './data/events',
+            'DefaultSlug': 'main',
+            'PathPrefix': '/e',
+            'IdleSeconds': '1800',
+            'MaxLoaded': '16'
+        }
+
+        self.config['UPLOADS'] = {
+            'StagingDir': './data/upload_staging',
+            'GuestMaxMB': '100',
+            'AdminMaxMB': '500',
+            'ChunkSizeMB': '4',
+            'ExpireHours': '24'
+        }
+
+        self.config['EXPORT'] = {
+            'JobDir': './data/exports',
+            'ExpireHours': '24'
         }
         
     
@@ -94,4 +170,10 @@ class Config:
             return True
         except Exception as e:
             logger.error(f"Error saving configuration: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+
+
+@lru_cache(maxsize=None)
+def get_config(config_file="config.ini") -> Config:
+    """Shared Config per file, so config.ini is parsed once per process"""
+    return Config(config_file)
@@ -1,64 +1,57 @@
 # app/main.py
 import os
 import logging
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
-from fastapi.middleware.cors import CORSMiddleware
 import time
-import csv
-
-from app.config import Config
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-import logging
+from contextlib import asynccontextmanager
 from datetime import datetime
-from app.services.settings import settings_service
-
-# Load configuration
-config = Config()
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO if not config.getboolean('DEFAULT', 'Debug') else logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(config.get('PATHS', 'LogsDir'), 'application.log')),
-        logging.StreamHandler()
-    ]
-)
 
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.middleware.cors import CORSMiddleware
+
+from app.config import get_config
+from app.services.container import init_services, get_services
+from app.services.metrics import metrics
+from app.services.assets import AssetStaticFiles
+from app.middleware.compression import CompressionMiddleware
+from app.middleware.events import EventMiddleware
+from app.middleware.profiling import ProfilingMiddleware
+
+# Importing this module has no side effects: config.ini is read (and
+# created if missing), directories, logging and services are set up by the
+# lifespan below, and middleware read their settings on first use.
 logger = logging.getLogger(__name__)
 
-# At the beginning of app/main.py after loading config
-# Ensure all required directories exist
-required_directories = [
-    config.get('PATHS', 'LogsDir'),
-    config.get('PATHS', 'StaticDir'),
-    config.get('PATHS', 'TemplatesDir'),
-    os.path.dirname(config.get('DATABASE', 'CSVPath')),
-    config.get('DATABASE', 'BackupDir'),
-    os.path.join(config.get('PATHS', 'StaticDir'), "css"),
-    os.path.join(config.get('PATHS', 'StaticDir'), "js"),
-    os.path.join(config.get('PATHS', 'StaticDir'), "images"),
-    os.path.join(config.get('PATHS', 'StaticDir'), "uploads"),
-    os.path.join(config.get('PATHS', 'StaticDir'), "uploads/presentations"),
-    os.path.join(config.get('PATHS', 'StaticDir'), "uploads/profile_photos"),
-    os.path.join(config.get('PATHS', 'StaticDir'), "qr_codes"),
-    os.path.join(config.get('PATHS', 'StaticDir'), "schedule")
-]
-
-for directory in required_directories:
-    os.makedirs(directory, exist_ok=True)
-
-# No dynamic template directory switching in simplified app
+
+def _configure_logging(config):
+    logs_dir = config.get('PATHS', 'LogsDir')
+    os.makedirs(logs_dir, exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO if not config.getboolean('DEFAULT', 'Debug') else logging.DEBUG,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(os.path.join(logs_dir, 'application.log')),
+            logging.StreamHandler()
+        ]
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    config = get_config()
+    _configure_logging(config)
+    app.version = config.get('DEFAULT', 'SoftwareVersion')
+    init_services(app, config)
+    app.state.start_time = time.time()
+    logger.info("Simplified app started")
+    yield
+
 
 # Create FastAPI application
 app = FastAPI(
     title="Conference Guest Management System",
     description="A comprehensive system for managing conference guests",
-    version=config.get('DEFAULT', 'SoftwareVersion')
+    lifespan=lifespan,
 )
 
 # Minimal app: QR/journey and other advanced features removed
@@ -72,51 +65,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount static files
+# Compress rendered pages and API responses (static assets arrive precompressed)
+app.add_middleware(CompressionMiddleware, config=lambda: init_services(app).config)
+
+# Request metrics (exposed at /metrics for admins)
+REQUEST_LATENCY = metrics.histogram(
+    "http_request_duration_seconds", "Request latency by route template", ("method", "route")
+)
+REQUESTS_TOTAL = metrics.counter(
+    "http_requests_total", "Requests by route template and status code", ("method", "route", "status")
+)
+REQUESTS_IN_PROGRESS = metrics.gauge("http_requests_in_progress", "Requests currently being handled")
+
+
+def _route_label(request: Request) -> str:
+    # Use the route template (e.g. /admin/guest/{guest_id}) so label
+    # cardinality stays bounded; mounts report their mount path.
+    route = request.scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    if request.scope.get("root_path"):
+        return request.scope["root_path"]
+    return "unmatched"
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    REQUESTS_IN_PROGRESS.inc()
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        REQUESTS_IN_PROGRESS.dec()
+        route = _route_label(request)
+        REQUEST_LATENCY.observe(time.perf_counter() - start, method=request.method, route=route)
+        REQUESTS_TOTAL.inc(method=request.method, route=route, status=status)
+
+# Which event a request belongs to (multi-event mode); strips /e/<slug> before routing and metrics
+app.add_middleware(
+    EventMiddleware,
+    registry=lambda: init_services(app).events,
+)
+
+# Outermost: span breakdown for the slow-request log and on-demand cProfile captures
+app.add_middleware(ProfilingMiddleware, profiler=lambda: init_services(app).profiler)
+
+# Mount static files (fingerprinted names and precompressed variants, see app/services/assets.py).
+# The manifest belongs to the services, which exist only once the app has started.
 app.mount(
     "/static",
-    StaticFiles(directory=config.get('PATHS', 'StaticDir')),
+    AssetStaticFiles(
+        manifest=lambda: init_services(app).assets,
+        check_dir=False,
+    ),
     name="static"
 )
 
-# Initialize templates
-from datetime import datetime
-
-# Initialize templates with global variables
-templates = Jinja2Templates(directory=config.get('PATHS', 'TemplatesDir'))
-templates.env.globals["now"] = datetime.now()
-
-# Jinja text normalization filter (fix common dash mojibake)
-import re
-
-def _normalize_dashes(value: str) -> str:
-    if not isinstance(value, str):
-        return value
-    s = value
-    # Fix common UTF-8 -> cp1252 mojibake for dashes
-    s = s.replace("â€“", "–").replace("â€”", "—")
-    # If a stray 'â' accidentally split a range like 12â14, correct to en dash
-    s = re.sub(r"(?<=\d)â(?=\d)", "–", s)
-    # Normalize all long dashes to an en dash
-    s = s.replace("—", "–")
-    # Collapse spaces around dashes used as ranges
-    s = re.sub(r"\s*–\s*", "–", s)
-    return s
-
-templates.env.filters["normalize_dashes"] = _normalize_dashes
-
 # Include only the simplified routes
-from app.routes import simple
+from app.routes import simple, media, api
 app.include_router(simple.router)
+app.include_router(media.router)
+app.include_router(api.router)
 # if os.path.exists(os.path.join(app.config.get('PATHS', 'TemplatesDir'), "faculty")):
 #     from app.routes import faculty
 #     app.include_router(faculty.router)
 
-# Create required directories
-os.makedirs(config.get('PATHS', 'LogsDir'), exist_ok=True)
-os.makedirs(os.path.dirname(config.get('DATABASE', 'CSVPath')), exist_ok=True)
-os.makedirs(config.get('DATABASE', 'BackupDir'), exist_ok=True)
-
 # Root route
 @app.get("/")
 async def root(request: Request):
@@ -129,42 +145,42 @@ async def root(request: Request):
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     """Handle HTTP exceptions"""
-    from datetime import datetime
-    return templates.TemplateResponse(
+    if request.url.path.startswith("/api/"):
+        return JSONResponse({"detail": exc.detail}, status_code=exc.status_code, headers=getattr(exc, "headers", None))
+    services = get_services(request)
+    return services.templates.TemplateResponse(
         "error.html",
         {
             "request": request,
             "message": exc.detail,
             "status_code": exc.status_code,
             "now": datetime.now(),
-            "conference": settings_service.get(),
+            "conference": services.settings.get(),
         },
-        status_code=exc.status_code
+        status_code=exc.status_code,
+        headers=getattr(exc, "headers", None),
     )
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """Handle all other exceptions"""
-    from datetime import datetime
     logger.error(f"Unhandled exception: {str(exc)}", exc_info=True)
-    return templates.TemplateResponse(
+    if request.url.path.startswith("/api/"):
+        return JSONResponse({"detail": "An unexpected error occurred"}, status_code=500)
+    services = get_services(request)
+    return services.templates.TemplateResponse(
         "error.html",
         {
             "request": request,
             "message": "An unexpected error occurred",
             "status_code": 500,
-            "error_details": str(exc) if config.getboolean('DEFAULT', 'Debug') else None,
+            "error_details": str(exc) if services.config.getboolean('DEFAULT', 'Debug') else None,
             "now": datetime.now(),
-            "conference": settings_service.get(),
+            "conference": services.settings.get(),
         },
         status_code=500
     )
 
-@app.on_event("startup")
-async def startup_event():
-    app.state.start_time = time.time()
-    logger.info("Simplified app started")
-
 @app.get("/admin_dashboard")
 async def admin_dashboard_redirect(request: Request):
     # For backward compatibility; redirect to simplified admin
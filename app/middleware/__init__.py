@@ -0,0 +1,5 @@
+"""ASGI middleware for the simplified application."""
+
+__all__ = [
+    "compression",
+]
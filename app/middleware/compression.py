@@ -0,0 +1,184 @@
+import zlib
+import logging
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:  # Optional: brotli is used when installed and accepted by the client
+    import brotli
+except ImportError:  # pragma: no cover - depends on environment
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = (
+    "text/html", "text/plain", "text/css", "text/csv", "text/xml", "text/javascript",
+    "application/json", "application/javascript", "application/xml", "image/svg+xml",
+)
+# Streams that must reach the client event-by-event are left alone.
+EXCLUDED_TYPES = ("text/event-stream",)
+
+
+def _accepts(header: str) -> dict:
+    """Parse Accept-Encoding into {coding: q}."""
+    accepted = {}
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    return accepted
+
+
+class _Encoder:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits=31 -> gzip container
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        # Flush per chunk so streamed responses are not held back in the compressor.
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.finish()
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class CompressionMiddleware:
+    """gzip/brotli response compression with a size threshold and streaming support.
+
+    Responses that are already encoded (e.g. precompressed static assets),
+    partial, too small or of a non-text type pass through untouched.
+
+    ``config`` is an optional zero-argument callable returning the app's
+    ``Config``; its ``[COMPRESSION]`` section replaces the keyword arguments
+    on the first request, so the middleware can be added before the
+    configuration is loaded.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4,
+                 enabled: bool = True, config=None):
+        self.app = app
+        self.enabled = enabled
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self._config = config
+
+    def _configure(self):
+        config, self._config = self._config(), None
+        self.enabled = config.getboolean('COMPRESSION', 'Enabled', fallback=True)
+        self.minimum_size = config.getint('COMPRESSION', 'MinimumSize', fallback=1024)
+        self.gzip_level = config.getint('COMPRESSION', 'GzipLevel', fallback=6)
+        self.brotli_quality = config.getint('COMPRESSION', 'BrotliQuality', fallback=4)
+
+    def _choose_encoding(self, header: str):
+        accepted = _accepts(header)
+        if brotli is not None and accepted.get("br", 0) > 0:
+            return "br"
+        if accepted.get("gzip", accepted.get("*", 0)) > 0:
+            return "gzip"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and self._config is not None:
+            self._configure()
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+        encoding = self._choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(self, send, encoding)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, send, encoding: str):
+        self.middleware = middleware
+        self._send = send
+        self.encoding = encoding
+        self.start_message = None
+        self.encoder = None
+        self.passthrough = False
+
+    def _eligible(self, status: int, headers: MutableHeaders) -> bool:
+        if status < 200 or status in (204, 206, 304):
+            return False
+        if "content-encoding" in headers or "content-range" in headers:
+            return False
+        if "no-transform" in headers.get("cache-control", ""):
+            return False
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type in EXCLUDED_TYPES:
+            return False
+        return content_type in COMPRESSIBLE_TYPES
+
+    def _mark_encoded(self, headers: MutableHeaders):
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            # The encoded bytes differ from the identity representation
+            headers["ETag"] = f"W/{etag}"
+
+    async def send(self, message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            self.start_message = message
+            return
+        if message_type != "http.response.body" or self.passthrough:
+            if self.start_message is not None:
+                await self._send(self.start_message)
+                self.start_message = None
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            start, self.start_message = self.start_message, None
+            if not self._eligible(start["status"], headers) or (not more_body and len(body) < self.middleware.minimum_size):
+                self.passthrough = True
+                await self._send(start)
+                await self._send(message)
+                return
+            self.encoder = _Encoder(self.encoding, self.middleware.gzip_level, self.middleware.brotli_quality)
+            if not more_body:
+                payload = self.encoder.finish(body)
+                if len(payload) >= len(body):
+                    self.passthrough = True
+                    await self._send(start)
+                    await self._send(message)
+                    return
+                self._mark_encoded(headers)
+                headers["Content-Length"] = str(len(payload))
+                await self._send(start)
+                await self._send({"type": "http.response.body", "body": payload})
+                return
+            self._mark_encoded(headers)
+            if "content-length" in headers:
+                del headers["Content-Length"]
+            await self._send(start)
+
+        if more_body:
+            await self._send({"type": "http.response.body", "body": self.encoder.chunk(body), "more_body": True})
+        else:
+            await self._send({"type": "http.response.body", "body": self.encoder.finish(body)})
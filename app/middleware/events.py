@@ -0,0 +1,70 @@
+import logging
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import cookie_parser
+from starlette.responses import PlainTextResponse, RedirectResponse
+
+logger = logging.getLogger(__name__)
+
+EVENT_COOKIE = "event"
+
+
+class EventMiddleware:
+    """Selects the event a request belongs to (multi-event deployments).
+
+    In order: a host listed in an event's ``event.ini``; a path prefix
+    ``/e/<slug>/...``, which is stripped before routing; the ``event``
+    cookie, which a prefixed request sets so the site's absolute links
+    (``/guest``, ``/admin/...``) stay in that event. Redirects of prefixed
+    requests keep the prefix. The default event's slug (``main``) selects
+    the default event explicitly. The choice is put in ``scope["state"]``
+    for ``get_services``. ``registry`` is a callable returning the
+    ``EventRegistry``, or None when multi-event mode is off; the prefix is
+    the registry's ``path_prefix`` (``[EVENTS] PathPrefix``).
+    """
+
+    def __init__(self, app, registry):
+        self.app = app
+        self._registry = registry
+
+    async def __call__(self, scope, receive, send):
+        registry = self._registry() if scope["type"] == "http" else None
+        if registry is None:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        slug, prefixed = registry.for_host(headers.get("host", "")), None
+        path = scope["path"]
+        if slug is None and path.startswith(f"{registry.path_prefix}/"):
+            prefixed, _, rest = path[len(registry.path_prefix) + 1:].partition("/")
+            if prefixed != registry.default_slug and not registry.exists(prefixed):
+                await PlainTextResponse("Event not found", status_code=404)(scope, receive, send)
+                return
+            if not rest and not path.endswith("/"):
+                await RedirectResponse(f"{path}/", status_code=307)(scope, receive, send)
+                return
+            scope = dict(scope, path=f"/{rest}", raw_path=f"/{rest}".encode("utf-8"))
+            slug = prefixed
+        elif slug is None:
+            cookie = cookie_parser(headers.get("cookie", "")).get(EVENT_COOKIE)
+            if cookie and (cookie == registry.default_slug or registry.exists(cookie)):
+                slug = cookie
+        if slug == registry.default_slug:
+            slug = None
+        scope = dict(scope, state={**(scope.get("state") or {}), "event": slug})
+        if prefixed is None:
+            await self.app(scope, receive, send)
+            return
+
+        base = f"{registry.path_prefix}/{prefixed}"
+
+        async def prefixed_send(message):
+            if message["type"] == "http.response.start":
+                response_headers = MutableHeaders(scope=message)
+                location = response_headers.get("location", "")
+                if location.startswith("/") and not location.startswith(("//", f"{base}/")):
+                    response_headers["location"] = f"{base}{location}"
+                response_headers.append("set-cookie", f"{EVENT_COOKIE}={prefixed}; Path=/; HttpOnly; SameSite=Lax")
+            await send(message)
+
+        await self.app(scope, receive, prefixed_send)
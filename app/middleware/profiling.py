@@ -0,0 +1,54 @@
+import time
+import logging
+
+from starlette.datastructures import Headers
+
+from app.services.profiling import start_trace, end_trace
+
+logger = logging.getLogger(__name__)
+
+
+def _route(scope) -> str:
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    return scope.get("root_path") or "unmatched"
+
+
+class ProfilingMiddleware:
+    """Times every request with a span breakdown and runs the on-demand profiler.
+
+    Outermost middleware, so the measured time includes compression and the
+    ``response_write`` span covers handing the (compressed) body to the server.
+    ``profiler`` is a callable returning the ``RequestProfiler``, because the
+    services only exist once the application has started.
+    """
+
+    def __init__(self, app, profiler):
+        self.app = app
+        self._profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        profiler = self._profiler()
+        trace, token = start_trace()
+        profile = profiler.claim(scope["path"], Headers(scope=scope))
+        status = 500
+        started = time.perf_counter()
+
+        async def timed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            sent = time.perf_counter()
+            await send(message)
+            trace.add("response_write", time.perf_counter() - sent)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            end_trace(token)
+            profiler.finish(scope["method"], scope["path"], _route(scope), status,
+                            time.perf_counter() - started, trace, profile)
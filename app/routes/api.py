@@ -0,0 +1,442 @@
+from fastapi import APIRouter, Request, Depends, HTTPException, Body
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from typing import Optional
+import base64
+import binascii
+import os
+import secrets
+import logging
+from datetime import datetime
+
+from app.routes.simple import (
+    _find_guest_by_id, _find_guest_by_phone, _guest_upload_dir, _guest_row_errors, _normalize_phone,
+    _read_guests, _unique_phone,
+)
+from app.services.container import Services, get_services
+from app.services.csv_db import row_version
+from app.services.guests import GUEST_FIELDS
+from app.services.history import set_actor
+from app.services.http_cache import make_etag, etag_matches, not_modified, cache_headers
+from app.services.rate_limit import charge_failure, rate_limit
+from app.services.uploads import UploadError
+
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/v1")
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# JSON name -> CSV column; guests may not change their phone (it is their login)
+API_FIELDS = {
+    "name": "Name", "email": "Email", "institution": "Institution", "phone": "Phone",
+    "field1": "Field1", "field2": "Field2", "field3": "Field3", "field4": "Field4", "field5": "Field5",
+}
+GUEST_EDITABLE = set(API_FIELDS) - {"phone"}
+
+
+# --- representations ----------------------------------------------------
+def _guest_json(row) -> dict:
+    return {
+        "id": row.get('ID', ''),
+        "name": row.get('Name', ''),
+        "email": row.get('Email', ''),
+        "institution": row.get('Institution', ''),
+        "phone": row.get('Phone', ''),
+        **{f"field{i}": row.get(f'Field{i}', '') or '' for i in range(1, 6)},
+        "created_at": row.get('CreatedAt', '') or None,
+        "updated_at": row.get('UpdatedAt', '') or None,
+        "version": row_version(row),
+    }
+
+
+def _guest_etag(row) -> str:
+    # The row version changes on every committed edit, so it alone identifies the representation
+    return make_etag("guest", row.get('ID', ''), row_version(row))
+
+
+def _guest_response(request: Request, row):
+    etag = _guest_etag(row)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    return JSONResponse(_guest_json(row), headers=cache_headers(etag))
+
+
+def _file_entries(services: Services, guest_id: str) -> list:
+    entries = []
+    with os.scandir(_guest_upload_dir(services, guest_id)) as it:
+        for entry in it:
+            if entry.is_file():
+                st = entry.stat()
+                entries.append({
+                    "name": entry.name,
+                    "size": st.st_size,
+                    "modified": datetime.fromtimestamp(st.st_mtime).isoformat(timespec="seconds"),
+                })
+    return sorted(entries, key=lambda e: e["name"])
+
+
+def _files_response(request: Request, services: Services, guest_id: str):
+    files = _file_entries(services, guest_id)
+    etag = make_etag("files", guest_id, *((f["name"], f["size"], f["modified"]) for f in files))
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    return JSONResponse({"guest_id": guest_id, "files": files}, headers=cache_headers(etag))
+
+
+# --- authentication -----------------------------------------------------
+def _api_session(services: Services, request: Request, role: str) -> dict:
+    """Session from ``Authorization: Bearer <token>`` (apps) or the session cookie (browsers)"""
+    auth = request.headers.get("authorization", "")
+    token = auth[7:].strip() if auth[:7].lower() == "bearer " else request.cookies.get("session_id")
+    session = services.auth.validate_session(token)
+    if not session or session["role"] != role:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    set_actor("admin" if role == "admin" else f"guest:{session['user_id']}")
+    return session
+
+
+def _token_response(services: Services, user_id: str, role: str):
+    token = services.auth.create_session(user_id, role)
+    return JSONResponse(
+        {"token": token, "role": role, "expires_in": services.auth.session_timeout_minutes * 60},
+        headers={"Cache-Control": "no-store"},
+    )
+
+
+@router.post("/guest/session", dependencies=[Depends(rate_limit("guest_login", "phone", _normalize_phone))])
+async def api_guest_session(phone: str = Body(..., embed=True), services: Services = Depends(get_services)):
+    guest = _find_guest_by_phone(services, phone)
+    if not guest:
+        raise HTTPException(status_code=404, detail="No guest is registered with this phone number")
+    return _token_response(services, guest['ID'], 'guest')
+
+
+@router.post("/admin/session", dependencies=[Depends(rate_limit("admin_login", failures_only=True))])
+async def api_admin_session(request: Request, password: str = Body(..., embed=True), services: Services = Depends(get_services)):
+    conf_pw = services.auth.admin_password
+    if not secrets.compare_digest(password.encode("utf-8"), conf_pw.encode("utf-8")):
+        logger.warning("API admin login failed: bad password")
+        charge_failure(request)
+        raise HTTPException(status_code=401, detail="Invalid password")
+    return _token_response(services, "admin", 'admin')
+
+
+# --- updates ------------------------------------------------------------
+def _api_changes(payload: dict, allowed) -> dict:
+    unknown = sorted(set(payload) - set(allowed))
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown or read-only fields: {', '.join(unknown)}")
+    changes = {}
+    for key, value in payload.items():
+        value = '' if value is None else str(value)
+        if key == "phone":
+            value = _normalize_phone(value)
+        elif key in ("name", "email", "institution"):
+            value = value.strip()
+        changes[API_FIELDS[key]] = value
+    return changes
+
+
+async def _patch_guest(request: Request, services: Services, guest_id: str, payload: dict, allowed):
+    """Apply a partial update; ``If-Match`` (an ETag from a GET) makes it a compare-and-swap."""
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=422, detail="Expected a JSON object of fields to change")
+    changes = _api_changes(payload, allowed)
+    expected_version = None
+    if_match = request.headers.get("if-match")
+    if if_match and if_match.strip() != "*":
+        current = _find_guest_by_id(services, guest_id)
+        if current is None:
+            raise HTTPException(status_code=404, detail="Guest not found")
+        if not etag_matches(if_match, _guest_etag(current)):
+            return JSONResponse({"detail": "Guest changed since it was fetched", "guest": _guest_json(current)},
+                                status_code=412, headers=cache_headers(_guest_etag(current)))
+        expected_version = row_version(current)
+    try:
+        (result,) = await run_in_threadpool(
+            services.guests_db.update_many, [(guest_id, changes, expected_version)], fieldnames=GUEST_FIELDS,
+            validate=_guest_row_errors, unique_by=_unique_phone, touch={'UpdatedAt': datetime.now().isoformat()},
+        )
+    except TimeoutError:
+        raise HTTPException(status_code=503, detail="Database busy, please retry", headers={"Retry-After": "1"})
+    status = result["status"]
+    if status == "not_found":
+        raise HTTPException(status_code=404, detail="Guest not found")
+    if status == "conflict":
+        return JSONResponse({"detail": "Guest changed since it was fetched", "guest": _guest_json(result["row"])},
+                            status_code=412, headers=cache_headers(_guest_etag(result["row"])))
+    if status == "invalid":
+        return JSONResponse({"detail": result["errors"]}, status_code=422)
+    if status == "duplicate":
+        return JSONResponse({"detail": "Phone number already belongs to another guest"}, status_code=409)
+    if status == "updated":
+        logger.info(f"Guest {guest_id} updated via API")
+    return JSONResponse(_guest_json(result["row"]), headers=cache_headers(_guest_etag(result["row"])))
+
+
+# --- guest endpoints ----------------------------------------------------
+@router.get("/me")
+async def api_me(request: Request, services: Services = Depends(get_services)):
+    session = _api_session(services, request, 'guest')
+    guest = _find_guest_by_id(services, session["user_id"])
+    if guest is None:
+        raise HTTPException(status_code=404, detail="Guest not found")
+    return _guest_response(request, guest)
+
+
+@router.patch("/me")
+async def api_me_update(request: Request, payload: dict = Body(...), services: Services = Depends(get_services)):
+    session = _api_session(services, request, 'guest')
+    return await _patch_guest(request, services, session["user_id"], payload, GUEST_EDITABLE)
+
+
+@router.get("/me/files")
+async def api_me_files(request: Request, services: Services = Depends(get_services)):
+    session = _api_session(services, request, 'guest')
+    return _files_response(request, services, session["user_id"])
+
+
+# --- resumable uploads --------------------------------------------------
+UPLOAD_ERROR_STATUS = {
+    "not_found": 404, "invalid": 422, "too_large": 413, "offset_mismatch": 409, "busy": 409,
+    "incomplete": 409, "checksum_mismatch": 422,
+}
+
+
+def _upload_error(e: UploadError):
+    body, headers = {"detail": e.detail}, {"Cache-Control": "no-store"}
+    if e.offset is not None:
+        body["offset"] = e.offset
+        headers["Upload-Offset"] = str(e.offset)
+    return JSONResponse(body, status_code=UPLOAD_ERROR_STATUS.get(e.status, 400), headers=headers)
+
+
+def _upload_response(status: dict, status_code: int = 200, headers: Optional[dict] = None):
+    return JSONResponse(status, status_code=status_code,
+                        headers={"Upload-Offset": str(status["offset"]), "Cache-Control": "no-store", **(headers or {})})
+
+
+def _upload_create(request: Request, services: Services, guest_id: str, role: str, filename: str, size: int):
+    try:
+        status = services.uploads.create(guest_id, role, filename, size)
+    except UploadError as e:
+        return _upload_error(e)
+    return _upload_response(status, 201, {"Location": f"{request.url.path}/{status['id']}"})
+
+
+def _upload_status(services: Services, upload_id: str, guest_id: str):
+    try:
+        return _upload_response(services.uploads.status(upload_id, guest_id))
+    except UploadError as e:
+        return _upload_error(e)
+
+
+async def _upload_chunk(request: Request, services: Services, upload_id: str, guest_id: str):
+    """Body bytes go to disk as they arrive; ``Upload-Offset`` says where they start"""
+    try:
+        offset = int(request.headers.get("upload-offset", ""))
+    except ValueError:
+        return JSONResponse({"detail": "Upload-Offset header required"}, status_code=400)
+    try:
+        status = await services.uploads.append(
+            upload_id, guest_id, offset, request.stream(), request.headers.get("upload-checksum", ""))
+    except UploadError as e:
+        return _upload_error(e)
+    except ClientDisconnect:
+        # Nobody is listening; the client asks for the offset when it reconnects
+        return Response(status_code=400)
+    return _upload_response(status)
+
+
+async def _upload_complete(services: Services, upload_id: str, guest_id: str, sha256: str):
+    try:
+        stored = await run_in_threadpool(
+            services.uploads.complete, upload_id, guest_id, _guest_upload_dir(services, guest_id), sha256)
+    except UploadError as e:
+        return _upload_error(e)
+    if stored.pop("new"):
+        services.guest_stats.record_upload()
+    services.guest_pages.invalidate(guest_id)
+    logger.info(f"Guest {guest_id} file {stored['name']} stored from a resumable upload ({stored['size']} bytes)")
+    return JSONResponse(stored, status_code=201, headers={"Cache-Control": "no-store"})
+
+
+def _upload_cancel(services: Services, upload_id: str, guest_id: str):
+    try:
+        services.uploads.cancel(upload_id, guest_id)
+    except UploadError as e:
+        return _upload_error(e)
+    return Response(status_code=204)
+
+
+@router.post("/me/uploads")
+async def api_me_upload_create(request: Request, filename: str = Body(...), size: int = Body(...),
+                               services: Services = Depends(get_services)):
+    session = _api_session(services, request, 'guest')
+    return _upload_create(request, services, session["user_id"], 'guest', filename, size)
+
+
+@router.get("/me/uploads/{upload_id}")
+async def api_me_upload_status(request: Request, upload_id: str, services: Services = Depends(get_services)):
+    session = _api_session(services, request, 'guest')
+    return _upload_status(services, upload_id, session["user_id"])
+
+
+@router.patch("/me/uploads/{upload_id}")
+async def api_me_upload_chunk(request: Request, upload_id: str, services: Services = Depends(get_services)):
+    session = _api_session(services, request, 'guest')
+    return await _upload_chunk(request, services, upload_id, session["user_id"])
+
+
+@router.post("/me/uploads/{upload_id}/complete")
+async def api_me_upload_complete(request: Request, upload_id: str, sha256: str = Body("", embed=True),
+                                 services: Services = Depends(get_services)):
+    session = _api_session(services, request, 'guest')
+    return await _upload_complete(services, upload_id, session["user_id"], sha256)
+
+
+@router.delete("/me/uploads/{upload_id}")
+async def api_me_upload_cancel(request: Request, upload_id: str, services: Services = Depends(get_services)):
+    session = _api_session(services, request, 'guest')
+    return _upload_cancel(services, upload_id, session["user_id"])
+
+
+# --- check-in -----------------------------------------------------------
+@router.post("/checkin")
+async def api_checkin(request: Request, code: str = Body(...), gate: str = Body(""),
+                      services: Services = Depends(get_services)):
+    """Check a guest in from a scanned badge. Verifies the signature only: no guest-table access."""
+    _api_session(services, request, 'admin')
+    result = await run_in_threadpool(services.checkin.scan, code, gate.strip()[:40])
+    if result["status"] == "invalid":
+        return JSONResponse({**result, "detail": "Not a valid badge code"}, status_code=422)
+    return JSONResponse(result, headers={"Cache-Control": "no-store"})
+
+
+@router.get("/checkins")
+async def api_checkins(request: Request, services: Services = Depends(get_services)):
+    _api_session(services, request, 'admin')
+    entries = await run_in_threadpool(services.checkin.checked_in)
+    # The log is append-only, so its length and last entry identify the list
+    etag = make_etag("checkins", len(entries), *(entries[-1].values() if entries else ()))
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    return JSONResponse({"total": len(entries), "items": entries}, headers=cache_headers(etag))
+
+
+# --- admin endpoints ----------------------------------------------------
+def _encode_cursor(position: int, last_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{position}:{last_id}".encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str, guests) -> int:
+    """Index of the first row after the cursor; survives rows inserted or removed before it."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        position, last_id = raw.split(":", 1)
+        position = int(position)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Malformed cursor")
+    if 0 < position <= len(guests) and guests[position - 1].get('ID') == last_id:
+        return position
+    for index, guest in enumerate(guests):
+        if guest.get('ID') == last_id:
+            return index + 1
+    raise HTTPException(status_code=410, detail="Cursor no longer valid; restart from the first page")
+
+
+@router.get("/guests")
+async def api_guests(request: Request, cursor: Optional[str] = None, limit: int = DEFAULT_PAGE_SIZE,
+                     services: Services = Depends(get_services)):
+    """Guests in registration order, ``limit`` per page; follow ``next_cursor`` until it is null."""
+    _api_session(services, request, 'admin')
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    guests = _read_guests(services)
+    start = _decode_cursor(cursor, guests) if cursor else 0
+    page = guests[start:start + limit]
+    end = start + len(page)
+    next_cursor = _encode_cursor(end, page[-1].get('ID', '')) if page and end < len(guests) else None
+    # Page validator from the row versions it contains: no serialization needed for a 304
+    etag = make_etag("guests", start, next_cursor, *((g.get('ID', ''), row_version(g)) for g in page))
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    return JSONResponse({"items": [_guest_json(g) for g in page], "next_cursor": next_cursor, "total": len(guests)},
+                        headers=cache_headers(etag))
+
+
+@router.get("/guests/by-phone/{phone}")
+async def api_guest_by_phone(request: Request, phone: str, services: Services = Depends(get_services)):
+    _api_session(services, request, 'admin')
+    guest = _find_guest_by_phone(services, phone)
+    if guest is None:
+        raise HTTPException(status_code=404, detail="Guest not found")
+    return _guest_response(request, guest)
+
+
+@router.get("/guests/{guest_id}")
+async def api_guest(request: Request, guest_id: str, services: Services = Depends(get_services)):
+    _api_session(services, request, 'admin')
+    guest = _find_guest_by_id(services, guest_id)
+    if guest is None:
+        raise HTTPException(status_code=404, detail="Guest not found")
+    return _guest_response(request, guest)
+
+
+@router.patch("/guests/{guest_id}")
+async def api_guest_update(request: Request, guest_id: str, payload: dict = Body(...),
+                           services: Services = Depends(get_services)):
+    _api_session(services, request, 'admin')
+    return await _patch_guest(request, services, guest_id, payload, API_FIELDS)
+
+
+@router.get("/guests/{guest_id}/files")
+async def api_guest_files(request: Request, guest_id: str, services: Services = Depends(get_services)):
+    _api_session(services, request, 'admin')
+    if _find_guest_by_id(services, guest_id) is None:
+        raise HTTPException(status_code=404, detail="Guest not found")
+    return _files_response(request, services, guest_id)
+
+
+@router.post("/guests/{guest_id}/uploads")
+async def api_guest_upload_create(request: Request, guest_id: str, filename: str = Body(...), size: int = Body(...),
+                                  services: Services = Depends(get_services)):
+    _api_session(services, request, 'admin')
+    if _find_guest_by_id(services, guest_id) is None:
+        raise HTTPException(status_code=404, detail="Guest not found")
+    return _upload_create(request, services, guest_id, 'admin', filename, size)
+
+
+@router.get("/guests/{guest_id}/uploads/{upload_id}")
+async def api_guest_upload_status(request: Request, guest_id: str, upload_id: str,
+                                  services: Services = Depends(get_services)):
+    _api_session(services, request, 'admin')
+    return _upload_status(services, upload_id, guest_id)
+
+
+@router.patch("/guests/{guest_id}/uploads/{upload_id}")
+async def api_guest_upload_chunk(request: Request, guest_id: str, upload_id: str,
+                                 services: Services = Depends(get_services)):
+    _api_session(services, request, 'admin')
+    return await _upload_chunk(request, services, upload_id, guest_id)
+
+
+@router.post("/guests/{guest_id}/uploads/{upload_id}/complete")
+async def api_guest_upload_complete(request: Request, guest_id: str, upload_id: str,
+                                    sha256: str = Body("", embed=True), services: Services = Depends(get_services)):
+    _api_session(services, request, 'admin')
+    return await _upload_complete(services, upload_id, guest_id, sha256)
+
+
+@router.delete("/guests/{guest_id}/uploads/{upload_id}")
+async def api_guest_upload_cancel(request: Request, guest_id: str, upload_id: str,
+                                  services: Services = Depends(get_services)):
+    _api_session(services, request, 'admin')
+    return _upload_cancel(services, upload_id, guest_id)
@@ -0,0 +1,90 @@
+from fastapi import APIRouter, Request, HTTPException, Depends
+from fastapi.responses import FileResponse, Response
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+import json
+import logging
+
+from app.services.container import Services, get_services
+from app.services.http_cache import make_etag, not_modified, cache_headers
+from app.services.images import FORMATS
+
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get("/img/{path:path}")
+async def image_variant(request: Request, path: str, w: int = 640, fmt: Optional[str] = None, v: Optional[str] = None,
+                        services: Services = Depends(get_services)):
+    """Resized image variant; `fmt` defaults to WebP when the browser accepts it."""
+    image_service = services.images
+    source = image_service.source_path(path)
+    if source is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    if not image_service.available:
+        return FileResponse(source, headers={"Cache-Control": "public, max-age=3600"})
+
+    negotiated = fmt is None
+    if negotiated:
+        fmt = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail="Unsupported image format")
+
+    width = image_service.closest_width(w)
+    try:
+        # Decoding/resizing (and hashing the source) is CPU-bound; keep it off the event loop
+        result = await run_in_threadpool(image_service.variant, path, width, fmt)
+    except Exception as e:
+        logger.error(f"Image variant failed for {path}: {e}")
+        if image_service.source_path(path) is None:
+            raise HTTPException(status_code=404, detail="Image not found")
+        return FileResponse(source, headers={"Cache-Control": "public, max-age=300"})
+    if result is None:
+        # The source was removed after it was resolved above
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    file_path, media_type, digest = result
+    # Versioned URLs (as produced by img_srcset/img_url) never change content
+    if v and digest.startswith(v):
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "public, max-age=3600"
+    headers = {"Cache-Control": cache_control}
+    if negotiated:
+        headers["Vary"] = "Accept"
+    return FileResponse(file_path, media_type=media_type, headers=headers)
+
+
+SERVICE_WORKER = "js/sw.js"
+# (source, asset version, precache dirs) -> (etag, body); a deploy changes the asset version
+_service_workers = {}
+
+
+def _service_worker(services: Services):
+    entry, _ = services.assets.lookup(SERVICE_WORKER)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    directories = tuple(d.strip() for d in services.config.get('OFFLINE', 'PrecacheDirs', fallback='css,js,schedule').split(',') if d.strip())
+    key = (entry.source, services.assets.version, directories)
+    cached = _service_workers.get(key)
+    if cached is None:
+        worker_urls = {services.assets.url(SERVICE_WORKER), f"/static/{SERVICE_WORKER}"}
+        precache = [url for url in services.assets.urls(directories, plain_suffixes=(".js",)) if url not in worker_urls]
+        with open(entry.source, encoding="utf-8") as f:
+            source = f.read()
+        config = {"version": services.assets.version, "precache": precache}
+        body = f"self.SW_CONFIG = {json.dumps(config)};\n{source}"
+        cached = _service_workers[key] = (make_etag("service_worker", body), body)
+    return cached
+
+
+@router.get("/sw.js")
+async def service_worker(request: Request, services: Services = Depends(get_services)):
+    """The service worker, served from the site root so its scope covers every page."""
+    etag, body = _service_worker(services)
+    cached = not_modified(request, etag, cache_control="no-cache")
+    if cached is not None:
+        return cached
+    return Response(body, media_type="application/javascript", headers=cache_headers(etag, "no-cache"))
@@ -1,115 +1,73 @@
 from fastapi import APIRouter, Request, Depends, Form, UploadFile, File, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, PlainTextResponse, JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from typing import Optional, List
+import asyncio
+import json
 import os
 import mimetypes
 import csv
 import io
-import re
 import uuid
+import secrets
 import logging
 from datetime import datetime
 
-from app.config import Config
-from app.services.csv_db import CSVDatabase
-from app.services.auth import auth_service
-from app.services.settings import settings_service
+from app.services.container import Services, get_services
+from app.services.csv_db import VersionConflictError, row_version
+from app.services.duplicates import merge_changes as merge_guest_changes
+from app.services.exports import ExportChanged
+from app.services.guests import GUEST_FIELDS, normalize_phone as _normalize_phone, validate_guest as _validate_guest
+from app.services.history import set_actor
+from app.services.http_cache import byte_range, make_etag, not_modified, cache_headers
+from app.services.metrics import metrics
+from app.services.profiling import span
+from app.services.rate_limit import charge_failure, rate_limit
 
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-config = Config()
-templates = Jinja2Templates(directory=config.get('PATHS', 'TemplatesDir'))
-
-# Register shared Jinja filters (keep in sync with app/main.py)
-def _normalize_dashes(value: str) -> str:
-    if not isinstance(value, str):
-        return value
-    s = value
-    s = s.replace("â€“", "–").replace("â€”", "—")
-    import re as _re
-    s = _re.sub(r"(?<=\d)â(?=\d)", "–", s)
-    s = s.replace("—", "–")
-    s = _re.sub(r"\s*–\s*", "–", s)
-    return s
-
-templates.env.filters["normalize_dashes"] = _normalize_dashes
-
-guests_db = CSVDatabase(
-    config.get('DATABASE', 'CSVPath'),
-    config.get('DATABASE', 'BackupDir')
-)
-
-GUEST_FIELDS = [
-    'ID', 'Name', 'Email', 'Institution', 'Phone',
-    'Field1', 'Field2', 'Field3', 'Field4', 'Field5',
-    'CreatedAt', 'UpdatedAt'
-]
-
-UPLOAD_ROOT = os.path.join(config.get('PATHS', 'StaticDir'), 'uploads')
-os.makedirs(UPLOAD_ROOT, exist_ok=True)
-
-
-def _normalize_phone(phone: str) -> str:
-    return re.sub(r"\D", "", phone or "")
-
-
-def _validate_guest(name: str, email: str, institution: str, phone: str, extra: List[str]) -> List[str]:
-    errors = []
-    if not name or len(name.strip()) < 2:
-        errors.append("Name is required (min 2 characters).")
-    if not email or not re.match(r"^[^@\s]+@[^@\s]+\.[^@\s]+$", email):
-        errors.append("Valid email is required.")
-    if not institution or len(institution.strip()) < 2:
-        errors.append("Institution is required.")
-    phone_n = _normalize_phone(phone)
-    if not phone_n or len(phone_n) < 7:
-        errors.append("Valid phone number is required.")
-    if len(extra) < 5:
-        errors.append("Internal error: extra fields missing.")
-    return errors
-
-
-def _read_guests() -> List[dict]:
-    guests = guests_db.read_all()
+
+
+def _read_guests(services: Services) -> List[dict]:
+    guests = services.guests_db.read_all()
     return guests
 
 
-def _normalize_record(rec: dict) -> dict:
-    """Keep only allowed fields and ensure all keys exist for CSV writes."""
-    return {k: rec.get(k, "") for k in GUEST_FIELDS}
+def _unique_phone(rec: dict) -> str:
+    return _normalize_phone(rec.get('Phone', ''))
 
 
-def _write_guests(guests: List[dict]):
-    cleaned = [_normalize_record(g) for g in guests]
-    guests_db.write_all(cleaned, fieldnames=GUEST_FIELDS)
+def _find_guest_by_phone(services: Services, phone: str) -> Optional[dict]:
+    with span("guest_lookup"):
+        return services.guests_db.lookup('Phone', phone)
 
 
-def _find_guest_by_phone(phone: str) -> Optional[dict]:
-    phone_n = _normalize_phone(phone)
-    for g in _read_guests():
-        if _normalize_phone(g.get('Phone', '')) == phone_n:
-            return g
-    return None
+def _find_guest_by_id(services: Services, guest_id: str) -> Optional[dict]:
+    with span("guest_lookup"):
+        return services.guests_db.lookup('ID', guest_id)
 
 
-def _find_guest_by_id(guest_id: str) -> Optional[dict]:
-    for g in _read_guests():
-        if g.get('ID') == guest_id:
-            return g
-    return None
+CONFLICT_MESSAGE = "These details were changed by someone else while you were editing. The latest version is shown; please review and save again."
 
 
-def _guest_upload_dir(guest_id: str) -> str:
-    d = os.path.join(UPLOAD_ROOT, guest_id)
+def _expected_version(version: str) -> Optional[int]:
+    """Version token posted by an edit form; None skips the check (e.g. forms rendered before versioning)."""
+    try:
+        return int(version) if version.strip() else None
+    except ValueError:
+        return None
+
+
+def _guest_upload_dir(services: Services, guest_id: str) -> str:
+    d = os.path.join(services.upload_root, guest_id)
     os.makedirs(d, exist_ok=True)
     return d
 
 
-def _list_guest_files(guest_id: str) -> List[str]:
-    d = _guest_upload_dir(guest_id)
+def _list_guest_files(services: Services, guest_id: str) -> List[str]:
+    d = _guest_upload_dir(services, guest_id)
     files = []
     if os.path.isdir(d):
         for f in os.listdir(d):
@@ -119,69 +77,85 @@ def _list_guest_files(guest_id: str) -> List[str]:
     return sorted(files)
 
 
-def _save_upload(guest_id: str, file: UploadFile):
+def _guest_files_version(services: Services, guest_id: str) -> int:
+    """Upload-directory mtime: uploads land via rename, so every new or replaced file moves it"""
+    return os.stat(_guest_upload_dir(services, guest_id)).st_mtime_ns
+
+
+def _save_upload(services: Services, guest_id: str, file: UploadFile):
     # Max 2MB
     data = file.file.read()
     if len(data) > 2 * 1024 * 1024:
         raise HTTPException(status_code=400, detail="File exceeds 2MB limit")
     safe_name = os.path.basename(file.filename or '') or f"upload_{uuid.uuid4().hex}"
-    path = os.path.join(_guest_upload_dir(guest_id), safe_name)
-    with open(path, 'wb') as f:
-        f.write(data)
+    path = os.path.join(_guest_upload_dir(services, guest_id), safe_name)
+    is_new = not os.path.exists(path)
+    temp = f"{path}.{uuid.uuid4().hex}.part"
+    try:
+        with open(temp, 'wb') as f:
+            f.write(data)
+        os.replace(temp, path)
+    except OSError:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    if is_new:
+        services.guest_stats.record_upload()
+    services.guest_pages.invalidate(guest_id)
     logger.info(f"Guest {guest_id} uploaded file {safe_name} ({len(data)} bytes)")
 
 
-def _template_ctx(request: Request, user_role: Optional[str] = None, active: str = ""):
+def _template_ctx(services: Services, request: Request, user_role: Optional[str] = None, active: str = ""):
     return {
         "request": request,
         "user_role": user_role,
         "active_page": active,
-        "conference": settings_service.get(),
+        "conference": services.settings.get(),
+        # Per event (the template globals belong to the default event)
+        "badge_code": services.checkin.badge_code,
+        "badge_images": services.checkin.images_available,
+        "upload_max_mb": services.uploads.max_size('guest') // (1024 * 1024),
     }
 
 
-def _set_session_cookie(resp, sid: str):
+def _set_session_cookie(services: Services, resp, sid: str):
     # Respect configured session timeout and secure cookie setting
-    try:
-        timeout_min = Config().getint('SECURITY', 'SessionTimeout', fallback=10) or 10
-    except Exception:
-        timeout_min = 10
-    max_age = timeout_min * 60
-    secure = Config().getboolean('SECURITY', 'CookieSecure', fallback=False)
+    max_age = services.auth.session_timeout_minutes * 60
+    secure = services.config.getboolean('SECURITY', 'CookieSecure', fallback=False)
     resp.set_cookie("session_id", sid, httponly=True, max_age=max_age, samesite="lax", secure=secure)
 
 
 @router.get("/login", response_class=HTMLResponse)
-async def login_page(request: Request):
+async def login_page(request: Request, services: Services = Depends(get_services)):
     logger.debug("Render login page")
-    return templates.TemplateResponse("simple/login.html", _template_ctx(request, None, "login"))
+    return services.templates.TemplateResponse("simple/login.html", _template_ctx(services, request, None, "login"))
 
 
-@router.post("/guest/login")
-async def guest_login(request: Request, phone: str = Form(...)):
+@router.post("/guest/login", dependencies=[Depends(rate_limit("guest_login", "phone", _normalize_phone))])
+async def guest_login(request: Request, phone: str = Form(...), services: Services = Depends(get_services)):
     logger.info(f"Guest login attempt with phone ending {_normalize_phone(phone)[-4:]}" )
-    guest = _find_guest_by_phone(phone)
+    guest = _find_guest_by_phone(services, phone)
     if not guest:
         # Redirect to register with prefilled phone
         url = f"/register?phone={_normalize_phone(phone)}"
         return RedirectResponse(url=url, status_code=303)
-    sid = auth_service.create_session(guest['ID'], 'guest')
+    sid = services.auth.create_session(guest['ID'], 'guest')
     resp = RedirectResponse(url="/guest", status_code=303)
-    _set_session_cookie(resp, sid)
+    _set_session_cookie(services, resp, sid)
     return resp
 
 
 @router.get("/register", response_class=HTMLResponse)
-async def register_page(request: Request, phone: Optional[str] = None):
-    conf = settings_service.get()
-    return templates.TemplateResponse("simple/register.html", {
-        **_template_ctx(request, None, "register"),
+async def register_page(request: Request, phone: Optional[str] = None, services: Services = Depends(get_services)):
+    conf = services.settings.get()
+    return services.templates.TemplateResponse("simple/register.html", {
+        **_template_ctx(services, request, None, "register"),
         "prefill_phone": phone or "",
         "registration_closed": not conf.get("registration_open", True),
     })
 
 
-@router.post("/register")
+@router.post("/register", dependencies=[Depends(rate_limit("register", "phone", _normalize_phone))])
 async def register_submit(
     request: Request,
     name: str = Form(...),
@@ -193,10 +167,11 @@ async def register_submit(
     field3: str = Form("") ,
     field4: str = Form("") ,
     field5: str = Form("") ,
+    services: Services = Depends(get_services),
 ):
-    if not settings_service.get().get("registration_open", True):
-        return templates.TemplateResponse("simple/register.html", {
-            **_template_ctx(request, None, "register"),
+    if not services.settings.get().get("registration_open", True):
+        return services.templates.TemplateResponse("simple/register.html", {
+            **_template_ctx(services, request, None, "register"),
             "errors": ["Registration is currently closed."],
             "form": {
                 "name": name, "email": email, "institution": institution, "phone": phone,
@@ -208,8 +183,8 @@ async def register_submit(
     errors = _validate_guest(name, email, institution, phone, extras)
     if errors:
         logger.debug(f"Registration validation errors: {errors}")
-        return templates.TemplateResponse("simple/register.html", {
-            **_template_ctx(request, None, "register"),
+        return services.templates.TemplateResponse("simple/register.html", {
+            **_template_ctx(services, request, None, "register"),
             "errors": errors,
             "form": {
                 "name": name, "email": email, "institution": institution, "phone": phone,
@@ -217,10 +192,10 @@ async def register_submit(
             }
         }, status_code=400)
 
-    if _find_guest_by_phone(phone):
+    if _find_guest_by_phone(services, phone):
         errors = ["Phone already registered. Use login instead."]
-        return templates.TemplateResponse("simple/register.html", {
-            **_template_ctx(request, None, "register"),
+        return services.templates.TemplateResponse("simple/register.html", {
+            **_template_ctx(services, request, None, "register"),
             "errors": errors,
             "form": {
                 "name": name, "email": email, "institution": institution, "phone": phone,
@@ -228,7 +203,6 @@ async def register_submit(
             }
         }, status_code=400)
 
-    guests = _read_guests()
     guest_id = uuid.uuid4().hex[:8]
     record = {
         'ID': guest_id,
@@ -240,34 +214,70 @@ async def register_submit(
         'CreatedAt': datetime.now().isoformat(),
         'UpdatedAt': "",
     }
-    guests.append(record)
-    _write_guests(guests)
+    set_actor(f"guest:{guest_id}")
+    try:
+        # Duplicate check is repeated under the write lock to close the race
+        # between the lookup above and the append.
+        added = await run_in_threadpool(
+            services.guests_db.append, [record], fieldnames=GUEST_FIELDS, unique_by=_unique_phone,
+        )
+    except TimeoutError:
+        added = None
+    if not added:
+        errors = ["Phone already registered. Use login instead."] if added is not None else ["The system is busy. Please try again in a moment."]
+        return services.templates.TemplateResponse("simple/register.html", {
+            **_template_ctx(services, request, None, "register"),
+            "errors": errors,
+            "form": {
+                "name": name, "email": email, "institution": institution, "phone": phone,
+                "field1": field1, "field2": field2, "field3": field3, "field4": field4, "field5": field5,
+            }
+        }, status_code=400 if added is not None else 503)
     logger.info(f"New guest registered {guest_id} : {name}")
 
-    sid = auth_service.create_session(guest_id, 'guest')
+    sid = services.auth.create_session(guest_id, 'guest')
     resp = RedirectResponse(url="/guest", status_code=303)
-    _set_session_cookie(resp, sid)
+    _set_session_cookie(services, resp, sid)
     return resp
 
 
-def _require_guest(request: Request) -> dict:
+def _require_guest(services: Services, request: Request) -> dict:
     sid = request.cookies.get("session_id")
-    session = auth_service.validate_session(sid)
+    session = services.auth.validate_session(sid)
     if not session or session["role"] != "guest":
         raise HTTPException(status_code=401, detail="Not authenticated")
-    guest = _find_guest_by_id(session["user_id"]) or {}
+    guest = _find_guest_by_id(services, session["user_id"])
+    if guest is None:
+        # Removed (e.g. merged into another record) since the session started
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    set_actor(f"guest:{guest['ID']}")
     return guest
 
 
+def _guest_dashboard_etag(services: Services, guest) -> str:
+    return make_etag(
+        "guest_dashboard", guest['ID'], guest.get('UpdatedAt', ''), row_version(guest),
+        _guest_files_version(services, guest['ID']), services.settings.version(), services.render_version,
+    )
+
+
 @router.get("/guest", response_class=HTMLResponse)
-async def guest_home(request: Request):
-    guest = _require_guest(request)
-    files = _list_guest_files(guest['ID'])
-    return templates.TemplateResponse("simple/guest_dashboard.html", {
-        **_template_ctx(request, 'guest', 'profile'),
-        "guest": guest,
-        "files": files,
-    })
+async def guest_home(request: Request, services: Services = Depends(get_services)):
+    guest = _require_guest(services, request)
+    # Validator first: a 304 or a cache hit needs neither the directory listing nor a render
+    etag = _guest_dashboard_etag(services, guest)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    body = services.guest_pages.get(guest['ID'], etag)
+    if body is None:
+        body = services.templates.TemplateResponse("simple/guest_dashboard.html", {
+            **_template_ctx(services, request, 'guest', 'profile'),
+            "guest": guest,
+            "files": _list_guest_files(services, guest['ID']),
+        }).body
+        services.guest_pages.put(guest['ID'], etag, body)
+    return HTMLResponse(body, headers=cache_headers(etag))
 
 
 @router.post("/guest/update")
@@ -281,37 +291,51 @@ async def guest_update(
     field3: str = Form("") ,
     field4: str = Form("") ,
     field5: str = Form("") ,
+    version: str = Form("") ,
+    guest_id: str = Form("") ,
+    services: Services = Depends(get_services),
 ):
-    guest = _require_guest(request)
+    guest = _require_guest(services, request)
+    # An edit queued offline may be sent after someone else signed in on the same device
+    if guest_id and guest_id != guest['ID']:
+        logger.warning(f"Guest update for {guest_id} rejected: session belongs to {guest['ID']}")
+        raise HTTPException(status_code=403, detail="These changes were made for a different guest")
     errors = _validate_guest(name, email, institution, guest.get('Phone', ''), [field1, field2, field3, field4, field5])
     if errors:
-        files = _list_guest_files(guest['ID'])
-        return templates.TemplateResponse("simple/guest_dashboard.html", {
-            **_template_ctx(request, 'guest', 'profile'),
+        files = _list_guest_files(services, guest['ID'])
+        return services.templates.TemplateResponse("simple/guest_dashboard.html", {
+            **_template_ctx(services, request, 'guest', 'profile'),
             "guest": {**guest, 'Name': name, 'Email': email, 'Institution': institution, 'Field1': field1, 'Field2': field2, 'Field3': field3, 'Field4': field4, 'Field5': field5},
             "files": files,
             "errors": errors,
         }, status_code=400)
 
-    guests = _read_guests()
-    for g in guests:
-        if g['ID'] == guest['ID']:
-            g['Name'] = name.strip()
-            g['Email'] = email.strip()
-            g['Institution'] = institution.strip()
-            g['Field1'] = field1
-            g['Field2'] = field2
-            g['Field3'] = field3
-            g['Field4'] = field4
-            g['Field5'] = field5
-            g['UpdatedAt'] = datetime.now().isoformat()
-            break
+    changes = {
+        'Name': name.strip(),
+        'Email': email.strip(),
+        'Institution': institution.strip(),
+        'Field1': field1, 'Field2': field2, 'Field3': field3, 'Field4': field4, 'Field5': field5,
+        'UpdatedAt': datetime.now().isoformat(),
+    }
     try:
-        _write_guests(guests)
+        await run_in_threadpool(
+            services.guests_db.update, guest['ID'], changes,
+            expected_version=_expected_version(version), fieldnames=GUEST_FIELDS,
+        )
+    except VersionConflictError as e:
+        logger.info(f"Guest {guest['ID']} update rejected: record changed since it was loaded")
+        return services.templates.TemplateResponse("simple/guest_dashboard.html", {
+            **_template_ctx(services, request, 'guest', 'profile'),
+            "guest": e.current,
+            "files": _list_guest_files(services, guest['ID']),
+            "errors": [CONFLICT_MESSAGE],
+        }, status_code=409)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Guest not found")
     except TimeoutError:
-        files = _list_guest_files(guest['ID'])
-        return templates.TemplateResponse("simple/guest_dashboard.html", {
-            **_template_ctx(request, 'guest', 'profile'),
+        files = _list_guest_files(services, guest['ID'])
+        return services.templates.TemplateResponse("simple/guest_dashboard.html", {
+            **_template_ctx(services, request, 'guest', 'profile'),
             "guest": guest,
             "files": files,
             "errors": ["The system is busy. Please try again in a moment."],
@@ -321,24 +345,24 @@ async def guest_update(
 
 
 @router.post("/guest/upload")
-async def guest_upload(request: Request, file: UploadFile = File(...)):
-    guest = _require_guest(request)
+async def guest_upload(request: Request, file: UploadFile = File(...), services: Services = Depends(get_services)):
+    guest = _require_guest(services, request)
     try:
-        _save_upload(guest['ID'], file)
+        _save_upload(services, guest['ID'], file)
     except TimeoutError:
-        return templates.TemplateResponse("simple/guest_dashboard.html", {
-            **_template_ctx(request, 'guest', 'profile'),
+        return services.templates.TemplateResponse("simple/guest_dashboard.html", {
+            **_template_ctx(services, request, 'guest', 'profile'),
             "guest": guest,
-            "files": _list_guest_files(guest['ID']),
+            "files": _list_guest_files(services, guest['ID']),
             "errors": ["The system is busy. Please try again in a moment."],
         }, status_code=503)
     return RedirectResponse(url="/guest", status_code=303)
 
 
 @router.get("/guest/download/{filename}")
-async def guest_download(request: Request, filename: str):
-    guest = _require_guest(request)
-    path = os.path.join(_guest_upload_dir(guest['ID']), os.path.basename(filename))
+async def guest_download(request: Request, filename: str, services: Services = Depends(get_services)):
+    guest = _require_guest(services, request)
+    path = os.path.join(_guest_upload_dir(services, guest['ID']), os.path.basename(filename))
     if not os.path.exists(path):
         raise HTTPException(status_code=404, detail="File not found")
     media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
@@ -350,51 +374,120 @@ async def guest_download(request: Request, filename: str):
     )
 
 
+def _badge_response(services: Services, guest_id: str):
+    path = services.checkin.badge_png(guest_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Badge images are not available on this server")
+    # The image for a guest never changes while the signing key stays the same
+    return FileResponse(path, media_type="image/png", headers={"Cache-Control": "private, max-age=86400"})
+
+
+@router.get("/guest/badge.png")
+async def guest_badge(request: Request, services: Services = Depends(get_services)):
+    guest = _require_guest(services, request)
+    return await run_in_threadpool(_badge_response, services, guest['ID'])
+
+
 @router.get("/admin/login", response_class=HTMLResponse)
-async def admin_login_page(request: Request):
-    return templates.TemplateResponse("simple/admin_login.html", _template_ctx(request, None, "admin_login"))
+async def admin_login_page(request: Request, services: Services = Depends(get_services)):
+    return services.templates.TemplateResponse("simple/admin_login.html", _template_ctx(services, request, None, "admin_login"))
 
 
-@router.post("/admin/login")
-async def admin_login(request: Request, password: str = Form(...)):
-    conf_pw = config.get('DEFAULT', 'AdminPassword')
-    if password != conf_pw:
+@router.post("/admin/login", dependencies=[Depends(rate_limit("admin_login", failures_only=True))])
+async def admin_login(request: Request, password: str = Form(...), services: Services = Depends(get_services)):
+    conf_pw = services.auth.admin_password
+    if not secrets.compare_digest(password.encode("utf-8"), conf_pw.encode("utf-8")):
         logger.warning("Admin login failed: bad password")
-        return templates.TemplateResponse("simple/admin_login.html", {**_template_ctx(request, None, "admin_login"), "error": "Invalid password"}, status_code=401)
-    sid = auth_service.create_session("admin", "admin")
+        charge_failure(request)
+        return services.templates.TemplateResponse("simple/admin_login.html", {**_template_ctx(services, request, None, "admin_login"), "error": "Invalid password"}, status_code=401)
+    sid = services.auth.create_session("admin", "admin")
     resp = RedirectResponse(url="/admin", status_code=303)
-    _set_session_cookie(resp, sid)
+    _set_session_cookie(services, resp, sid)
     return resp
 
 
-def _require_admin(request: Request):
+def _require_admin(services: Services, request: Request):
     sid = request.cookies.get("session_id")
-    if not auth_service.require_admin(sid):
+    if not services.auth.require_admin(sid):
         raise HTTPException(status_code=401, detail="Not authorized")
+    set_actor("admin")
 
 
 @router.get("/admin", response_class=HTMLResponse)
-async def admin_home(request: Request):
-    _require_admin(request)
-    guests = _read_guests()
-    return templates.TemplateResponse("simple/admin_dashboard.html", {**_template_ctx(request, 'admin', 'admin'), "count": len(guests)})
+async def admin_home(request: Request, services: Services = Depends(get_services)):
+    _require_admin(services, request)
+    stats = services.guest_stats.snapshot()
+    return services.templates.TemplateResponse("simple/admin_dashboard.html", {**_template_ctx(services, request, 'admin', 'admin'), "count": stats["total"], "stats": stats})
+
+
+STATS_POLL_SECONDS = 1.0
+STATS_KEEPALIVE_SECONDS = 15.0
+
+
+@router.get("/admin/stats")
+async def admin_stats(request: Request, services: Services = Depends(get_services)):
+    _require_admin(services, request)
+    return JSONResponse(await run_in_threadpool(services.guest_stats.snapshot), headers={"Cache-Control": "no-store"})
+
+
+@router.get("/admin/stats/stream")
+async def admin_stats_stream(request: Request, services: Services = Depends(get_services)):
+    """Server-Sent Events: a ``stats`` event whenever the dashboard aggregates change."""
+    _require_admin(services, request)
+    sid = request.cookies.get("session_id")
+
+    async def events():
+        last_version, idle = None, 0.0
+        yield f"retry: {int(STATS_POLL_SECONDS * 3000)}\n\n"
+        while not await request.is_disconnected() and services.auth.require_admin(sid):
+            # Snapshot is in-memory unless another worker changed the file
+            stats = await run_in_threadpool(services.guest_stats.snapshot)
+            if stats["version"] != last_version:
+                last_version, idle = stats["version"], 0.0
+                yield f"event: stats\ndata: {json.dumps(stats)}\n\n"
+            elif idle >= STATS_KEEPALIVE_SECONDS:
+                idle = 0.0
+                yield ": keepalive\n\n"
+            await asyncio.sleep(STATS_POLL_SECONDS)
+            idle += STATS_POLL_SECONDS
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # stop reverse proxies from buffering the stream
+    })
 
 
 @router.get("/admin/guests", response_class=HTMLResponse)
-async def admin_guests(request: Request):
-    _require_admin(request)
-    guests = _read_guests()
-    return templates.TemplateResponse("simple/admin_guests.html", {**_template_ctx(request, 'admin', 'guests'), "guests": guests})
+async def admin_guests(request: Request, services: Services = Depends(get_services)):
+    _require_admin(services, request)
+    guests = _read_guests(services)
+    return services.templates.TemplateResponse("simple/admin_guests.html", {**_template_ctx(services, request, 'admin', 'guests'), "guests": guests})
 
 
 @router.get("/admin/guest/{guest_id}", response_class=HTMLResponse)
-async def admin_guest_view(request: Request, guest_id: str):
-    _require_admin(request)
-    g = _find_guest_by_id(guest_id)
+async def admin_guest_view(request: Request, guest_id: str, services: Services = Depends(get_services)):
+    _require_admin(services, request)
+    g = _find_guest_by_id(services, guest_id)
     if not g:
         raise HTTPException(status_code=404, detail="Guest not found")
-    files = _list_guest_files(guest_id)
-    return templates.TemplateResponse("simple/admin_guest_view.html", {**_template_ctx(request, 'admin', 'guests'), "guest": g, "files": files})
+    files = _list_guest_files(services, guest_id)
+    return services.templates.TemplateResponse("simple/admin_guest_view.html", {**_template_ctx(services, request, 'admin', 'guests'), "guest": g, "files": files})
+
+
+@router.get("/admin/guest/{guest_id}/history", response_class=HTMLResponse)
+async def admin_guest_history(request: Request, guest_id: str, services: Services = Depends(get_services)):
+    _require_admin(services, request)
+    entries = await run_in_threadpool(services.history.history, guest_id)
+    guest = _find_guest_by_id(services, guest_id)
+    # Deleted (e.g. merged) guests keep their history
+    if guest is None and not entries:
+        raise HTTPException(status_code=404, detail="Guest not found")
+    return services.templates.TemplateResponse("simple/admin_guest_history.html", {
+        **_template_ctx(services, request, 'admin', 'guests'),
+        "guest_id": guest_id,
+        "guest": guest,
+        "entries": list(reversed(entries)),
+    })
 
 
 @router.post("/admin/guest/{guest_id}/update")
@@ -410,45 +503,286 @@ async def admin_guest_update(
     field3: str = Form("") ,
     field4: str = Form("") ,
     field5: str = Form("") ,
+    version: str = Form("") ,
+    services: Services = Depends(get_services),
 ):
-    _require_admin(request)
+    _require_admin(services, request)
     errors = _validate_guest(name, email, institution, phone, [field1, field2, field3, field4, field5])
     if errors:
         g = {
             'ID': guest_id,
             'Name': name, 'Email': email, 'Institution': institution, 'Phone': phone,
             'Field1': field1, 'Field2': field2, 'Field3': field3, 'Field4': field4, 'Field5': field5,
+            'Version': version,
         }
-        files = _list_guest_files(guest_id)
-        return templates.TemplateResponse("simple/admin_guest_view.html", {**_template_ctx(request, 'admin', 'guests'), "guest": g, "files": files, "errors": errors}, status_code=400)
+        files = _list_guest_files(services, guest_id)
+        return services.templates.TemplateResponse("simple/admin_guest_view.html", {**_template_ctx(services, request, 'admin', 'guests'), "guest": g, "files": files, "errors": errors}, status_code=400)
 
-    guests = _read_guests()
-    for g in guests:
-        if g['ID'] == guest_id:
-            g['Name'] = name.strip()
-            g['Email'] = email.strip()
-            g['Institution'] = institution.strip()
-            g['Phone'] = _normalize_phone(phone)
-            g['Field1'] = field1
-            g['Field2'] = field2
-            g['Field3'] = field3
-            g['Field4'] = field4
-            g['Field5'] = field5
-            g['UpdatedAt'] = templates.env.globals.get("now")().isoformat() if callable(templates.env.globals.get("now")) else ""
-            break
+    changes = {
+        'Name': name.strip(),
+        'Email': email.strip(),
+        'Institution': institution.strip(),
+        'Phone': _normalize_phone(phone),
+        'Field1': field1, 'Field2': field2, 'Field3': field3, 'Field4': field4, 'Field5': field5,
+        'UpdatedAt': datetime.now().isoformat(),
+    }
     try:
-        _write_guests(guests)
+        await run_in_threadpool(
+            services.guests_db.update, guest_id, changes,
+            expected_version=_expected_version(version), fieldnames=GUEST_FIELDS,
+        )
+    except VersionConflictError as e:
+        logger.info(f"Admin update of guest {guest_id} rejected: record changed since it was loaded")
+        files = _list_guest_files(services, guest_id)
+        return services.templates.TemplateResponse("simple/admin_guest_view.html", {**_template_ctx(services, request, 'admin', 'guests'), "guest": e.current, "files": files, "errors": [CONFLICT_MESSAGE]}, status_code=409)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Guest not found")
     except TimeoutError:
-        files = _list_guest_files(guest_id)
-        return templates.TemplateResponse("simple/admin_guest_view.html", {**_template_ctx(request, 'admin', 'guests'), "guest": g, "files": files, "errors": ["The system is busy. Please try again in a moment."]}, status_code=503)
+        files = _list_guest_files(services, guest_id)
+        g = {'ID': guest_id, **changes, 'Version': version}
+        return services.templates.TemplateResponse("simple/admin_guest_view.html", {**_template_ctx(services, request, 'admin', 'guests'), "guest": g, "files": files, "errors": ["The system is busy. Please try again in a moment."]}, status_code=503)
     logger.info(f"Admin updated guest {guest_id}")
     return RedirectResponse(url=f"/admin/guest/{guest_id}", status_code=303)
 
 
+# Columns an admin batch edit may change; ID selects the row and Version is the optional CAS token
+BATCH_EDITABLE_FIELDS = ['Name', 'Email', 'Institution', 'Phone', 'Field1', 'Field2', 'Field3', 'Field4', 'Field5']
+BATCH_STATUS_MESSAGES = {
+    "not_found": "Guest not found.",
+    "conflict": "Changed by someone else since this version; reload and retry.",
+    "duplicate": "Phone number already belongs to another guest.",
+    "skipped": "Not applied because other rows in this batch failed.",
+}
+
+
+class BatchEditError(ValueError):
+    """A batch edit request that cannot be applied at all (bad format or unknown columns)"""
+
+
+def _batch_field(name: str) -> Optional[str]:
+    """Canonical column name for a case-insensitive patch header or JSON key"""
+    lookup = {f.lower(): f for f in ['ID', 'Version'] + BATCH_EDITABLE_FIELDS}
+    return lookup.get((name or '').strip().lower())
+
+
+def _batch_changes(raw: dict) -> dict:
+    changes = {}
+    for key, value in raw.items():
+        field = _batch_field(key)
+        if field not in BATCH_EDITABLE_FIELDS:
+            raise BatchEditError(f"Unknown or read-only column: {key}")
+        value = '' if value is None else str(value)
+        if field == 'Phone':
+            value = _normalize_phone(value)
+        elif field in ('Name', 'Email', 'Institution'):
+            value = value.strip()
+        changes[field] = value
+    return changes
+
+
+def _parse_batch_json(payload) -> List[tuple]:
+    """``{"updates": [{"id": ..., "version": ..., "changes": {...}}, ...]}`` -> update tuples"""
+    items = payload.get("updates") if isinstance(payload, dict) else None
+    if not isinstance(items, list):
+        raise BatchEditError('Expected {"updates": [{"id": ..., "changes": {...}}]}')
+    updates = []
+    for n, item in enumerate(items, start=1):
+        if not isinstance(item, dict) or not item.get("id") or not isinstance(item.get("changes"), dict):
+            raise BatchEditError(f"Update {n}: needs an id and a changes object")
+        version = item.get("version")
+        updates.append((str(item["id"]), _batch_changes(item["changes"]), _expected_version(str(version)) if version is not None else None))
+    return updates
+
+
+def _parse_batch_csv(data: str) -> List[tuple]:
+    """CSV patch: an ID column, an optional Version column and the columns to change.
+
+    Every listed column is applied as given (an empty cell clears the field),
+    so a patch only names the columns it means to edit.
+    """
+    reader = csv.reader(io.StringIO(data))
+    header = next(reader, None)
+    if not header:
+        raise BatchEditError("The patch file is empty.")
+    fields = [_batch_field(h) for h in header]
+    unknown = [h for h, f in zip(header, fields) if f is None]
+    if unknown:
+        raise BatchEditError(f"Unknown columns: {', '.join(unknown)}")
+    if 'ID' not in fields:
+        raise BatchEditError("The patch needs an ID column.")
+    updates = []
+    for values in reader:
+        if not any(v.strip() for v in values):
+            continue
+        row = dict(zip(fields, values))
+        raw = {f: v for f, v in row.items() if f not in ('ID', 'Version')}
+        updates.append((row.get('ID', '').strip(), _batch_changes(raw), _expected_version(row.get('Version', ''))))
+    return updates
+
+
+def _guest_row_errors(row) -> List[str]:
+    return _validate_guest(row.get('Name', ''), row.get('Email', ''), row.get('Institution', ''), row.get('Phone', ''),
+                           [row.get(f'Field{i}', '') for i in range(1, 6)])
+
+
+def _batch_summary(results: List[dict]) -> dict:
+    rows = []
+    for n, r in enumerate(results, start=1):
+        errors = r["errors"] or ([BATCH_STATUS_MESSAGES[r["status"]]] if r["status"] in BATCH_STATUS_MESSAGES else [])
+        rows.append({"row": n, "id": r["key"], "status": r["status"], "version": r["version"], "errors": errors})
+    counts = {}
+    for r in rows:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    return {"counts": counts, "results": rows}
+
+
+@router.post("/admin/guests/batch")
+async def admin_guests_batch(request: Request, services: Services = Depends(get_services)):
+    """Apply many guest edits in one transaction; JSON body or a multipart ``patch_file`` CSV."""
+    _require_admin(services, request)
+    wants_json = request.headers.get("content-type", "").startswith("application/json") \
+        or "application/json" in request.headers.get("accept", "")
+
+    def page(status_code: int, errors=None, batch=None):
+        return services.templates.TemplateResponse("simple/admin_guests.html", {**_template_ctx(services, request, 'admin', 'guests'), "guests": _read_guests(services), "errors": errors or [], "batch": batch}, status_code=status_code)
+
+    try:
+        if request.headers.get("content-type", "").startswith("application/json"):
+            try:
+                payload = await request.json()
+            except ValueError:
+                raise BatchEditError("Request body is not valid JSON.")
+            updates = _parse_batch_json(payload)
+            atomic = bool(payload.get("atomic"))
+        else:
+            form = await request.form()
+            patch = form.get("patch_file")
+            if patch is None or not hasattr(patch, "read"):
+                raise BatchEditError("Upload a CSV patch file as patch_file.")
+            updates = _parse_batch_csv((await patch.read()).decode("utf-8-sig", errors="replace"))
+            atomic = str(form.get("atomic", "")).lower() in ("1", "true", "on", "yes")
+    except BatchEditError as e:
+        if wants_json:
+            return JSONResponse({"detail": str(e)}, status_code=400)
+        return page(400, errors=[str(e)])
+
+    try:
+        results = await run_in_threadpool(
+            services.guests_db.update_many, updates, fieldnames=GUEST_FIELDS, validate=_guest_row_errors,
+            unique_by=_unique_phone, touch={'UpdatedAt': datetime.now().isoformat()}, atomic=atomic,
+        )
+    except TimeoutError:
+        if wants_json:
+            return JSONResponse({"detail": "Database busy, please retry."}, status_code=503)
+        return page(503, errors=["Batch edit paused: database busy, please retry."])
+    summary = _batch_summary(results)
+    logger.info(f"Admin batch edit of {len(updates)} rows: {summary['counts']}")
+    if wants_json:
+        return JSONResponse(summary)
+    return page(200, batch=summary)
+
+
+@router.get("/admin/guest/{guest_id}/badge.png")
+async def admin_guest_badge(request: Request, guest_id: str, services: Services = Depends(get_services)):
+    _require_admin(services, request)
+    if _find_guest_by_id(services, guest_id) is None:
+        raise HTTPException(status_code=404, detail="Guest not found")
+    return await run_in_threadpool(_badge_response, services, guest_id)
+
+
+MERGE_FIELDS = ['Name', 'Email', 'Institution', 'Field1', 'Field2', 'Field3', 'Field4', 'Field5']
+DUPLICATES_PAGE_SIZE = 200
+
+
+def _duplicates_page(services: Services, request: Request, status_code: int = 200, errors=None, notice=None):
+    result = services.duplicates.candidates()
+    return services.templates.TemplateResponse("simple/admin_duplicates.html", {
+        **_template_ctx(services, request, 'admin', 'guests'),
+        "pairs": result["pairs"][:DUPLICATES_PAGE_SIZE],
+        "result": result,
+        "fields": ['ID', 'Name', 'Email', 'Phone', 'Institution', 'CreatedAt'],
+        "errors": errors,
+        "notice": notice,
+    }, status_code=status_code)
+
+
+def _move_guest_files(services: Services, from_id: str, to_id: str) -> int:
+    """Move uploads between guest folders; name clashes get the old guest ID appended"""
+    source = os.path.join(services.upload_root, from_id)
+    if not os.path.isdir(source):
+        return 0
+    target = _guest_upload_dir(services, to_id)
+    moved = 0
+    for name in os.listdir(source):
+        path = os.path.join(source, name)
+        if not os.path.isfile(path):
+            continue
+        dest = os.path.join(target, name)
+        if os.path.exists(dest):
+            stem, ext = os.path.splitext(name)
+            dest = os.path.join(target, f"{stem}-{from_id}{ext}")
+        os.replace(path, dest)
+        moved += 1
+    try:
+        os.rmdir(source)
+    except OSError:
+        pass
+    services.guest_pages.invalidate(to_id)
+    return moved
+
+
+@router.get("/admin/duplicates", response_class=HTMLResponse)
+async def admin_duplicates(request: Request, merged: Optional[str] = None, services: Services = Depends(get_services)):
+    _require_admin(services, request)
+    notice = f"Merged into guest {merged}." if merged else None
+    return await run_in_threadpool(_duplicates_page, services, request, notice=notice)
+
+
+@router.post("/admin/duplicates/merge")
+async def admin_duplicates_merge(
+    request: Request,
+    keep_id: str = Form(...),
+    drop_id: str = Form(...),
+    keep_version: str = Form(""),
+    drop_version: str = Form(""),
+    services: Services = Depends(get_services),
+):
+    _require_admin(services, request)
+    keep, drop = _find_guest_by_id(services, keep_id), _find_guest_by_id(services, drop_id)
+    if keep is None or drop is None or keep_id == drop_id:
+        return await run_in_threadpool(_duplicates_page, services, request, 404, ["One of these guests no longer exists."])
+    changes = merge_guest_changes(keep, drop, MERGE_FIELDS)
+    changes['UpdatedAt'] = datetime.now().isoformat()
+    try:
+        await run_in_threadpool(
+            services.guests_db.merge, keep_id, drop_id, changes,
+            (_expected_version(keep_version), _expected_version(drop_version)), GUEST_FIELDS,
+        )
+    except VersionConflictError:
+        return await run_in_threadpool(_duplicates_page, services, request, 409, [CONFLICT_MESSAGE])
+    except KeyError:
+        return await run_in_threadpool(_duplicates_page, services, request, 404, ["One of these guests no longer exists."])
+    except TimeoutError:
+        return await run_in_threadpool(_duplicates_page, services, request, 503, ["Database busy, please retry."])
+    moved = await run_in_threadpool(_move_guest_files, services, drop_id, keep_id)
+    logger.info(f"Admin merged guest {drop_id} into {keep_id} ({len(changes) - 1} fields filled, {moved} files moved)")
+    return RedirectResponse(url=f"/admin/duplicates?merged={keep_id}", status_code=303)
+
+
+@router.post("/admin/duplicates/dismiss")
+async def admin_duplicates_dismiss(request: Request, a: str = Form(...), b: str = Form(...), services: Services = Depends(get_services)):
+    _require_admin(services, request)
+    try:
+        await run_in_threadpool(services.duplicates.dismiss, a, b)
+    except TimeoutError:
+        return await run_in_threadpool(_duplicates_page, services, request, 503, ["Database busy, please retry."])
+    return RedirectResponse(url="/admin/duplicates", status_code=303)
+
+
 @router.get("/admin/guest/{guest_id}/download/{filename}")
-async def admin_guest_download(request: Request, guest_id: str, filename: str):
-    _require_admin(request)
-    path = os.path.join(_guest_upload_dir(guest_id), os.path.basename(filename))
+async def admin_guest_download(request: Request, guest_id: str, filename: str, services: Services = Depends(get_services)):
+    _require_admin(services, request)
+    path = os.path.join(_guest_upload_dir(services, guest_id), os.path.basename(filename))
     if not os.path.exists(path):
         raise HTTPException(status_code=404, detail="File not found")
     media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
@@ -460,14 +794,86 @@ async def admin_guest_download(request: Request, guest_id: str, filename: str):
     )
 
 
+def _export_selection(guests: List[dict], guest_ids: str, q: str) -> List[tuple]:
+    """``(id, name)`` of the guests an export covers: listed IDs and/or a text match, or everyone"""
+    wanted = {i for i in guest_ids.replace(",", " ").split() if i}
+    needle = q.strip().lower()
+    selected = []
+    for g in guests:
+        if wanted and g.get('ID') not in wanted:
+            continue
+        if needle and not any(needle in (g.get(f) or '').lower() for f in ('Name', 'Email', 'Institution')):
+            continue
+        selected.append((g.get('ID', ''), g.get('Name', '')))
+    return selected
+
+
+@router.post("/admin/export/files")
+async def admin_export_files(request: Request, guest_ids: str = Form(""), q: str = Form(""), types: str = Form(""),
+                             services: Services = Depends(get_services)):
+    """Fix the file list of an export job, then send the browser to its (resumable) download"""
+    _require_admin(services, request)
+    extensions = {f".{t.strip().lstrip('.').lower()}" for t in types.replace(",", " ").split() if t.strip()}
+    selection = _export_selection(_read_guests(services), guest_ids, q)
+    job = await run_in_threadpool(
+        services.exports.create, selection, {"guest_ids": guest_ids, "q": q, "types": types}, extensions,
+    )
+    if not job["files"]:
+        return services.templates.TemplateResponse("simple/admin_guests.html", {
+            **_template_ctx(services, request, 'admin', 'guests'),
+            "guests": _read_guests(services),
+            "errors": ["No uploaded files match this selection."],
+        }, status_code=404)
+    logger.info(f"Admin export {job['id']} created: {job['files']} files, {job['total']} bytes")
+    return RedirectResponse(url=f"/admin/export/files/{job['id']}.zip", status_code=303)
+
+
+@router.get("/admin/export/files/{job_id}.zip")
+async def admin_export_download(request: Request, job_id: str, services: Services = Depends(get_services)):
+    """The job's ZIP, generated while it is sent; ``Range`` continues an interrupted download"""
+    _require_admin(services, request)
+    job = services.exports.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export not found or expired; start a new one")
+    changed = await run_in_threadpool(services.exports.changed, job)
+    if changed:
+        raise HTTPException(status_code=409, detail=f"{len(changed)} file(s) changed since this export was created "
+                                                    f"(e.g. {changed[0]}); start a new export")
+    etag = make_etag("export", job["id"])
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, no-store",
+        "Content-Disposition": f'attachment; filename="guest-files-{job["id"][:8]}.zip"',
+    }
+    try:
+        requested = byte_range(request, etag, job["total"])
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{job['total']}"})
+    start, end = requested or (0, job["total"] - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if requested:
+        headers["Content-Range"] = f"bytes {start}-{end}/{job['total']}"
+
+    def body():
+        try:
+            yield from services.exports.stream(job, start, end)
+        except ExportChanged as e:
+            # Headers are gone already; the client sees a short download and can retry the range
+            logger.warning(f"Export {job['id']} aborted: {e} changed during the download")
+            raise
+
+    return StreamingResponse(body(), status_code=206 if requested else 200, media_type="application/zip",
+                             headers=headers)
+
+
 @router.post("/admin/bulk_upload")
-async def admin_bulk_upload(request: Request, csv_file: UploadFile = File(...)):
-    _require_admin(request)
-    data = csv_file.file.read().decode("utf-8", errors="ignore")
+async def admin_bulk_upload(request: Request, csv_file: UploadFile = File(...), services: Services = Depends(get_services)):
+    _require_admin(services, request)
+    data = (await csv_file.read()).decode("utf-8", errors="ignore")
     reader = csv.DictReader(io.StringIO(data))
-    guests = _read_guests()
-    existing_phones = {_normalize_phone(g.get('Phone', '')) for g in guests}
-    added = 0
+    existing_phones = {_unique_phone(g) for g in _read_guests(services)}
+    new_guests = []
     for row in reader:
         name = (row.get('Name') or row.get('name') or '').strip()
         email = (row.get('Email') or row.get('email') or '').strip()
@@ -486,7 +892,7 @@ async def admin_bulk_upload(request: Request, csv_file: UploadFile = File(...)):
             logger.debug("Skipping duplicate phone in bulk upload")
             continue
         guest_id = uuid.uuid4().hex[:8]
-        guests.append({
+        new_guests.append({
             'ID': guest_id,
             'Name': name,
             'Email': email,
@@ -497,33 +903,37 @@ async def admin_bulk_upload(request: Request, csv_file: UploadFile = File(...)):
             'UpdatedAt': "",
         })
         existing_phones.add(phone)
-        added += 1
     try:
-        _write_guests(guests)
+        # Re-checks phones under the write lock, so registrations that landed
+        # while the upload was being parsed are neither lost nor duplicated.
+        added = len(await run_in_threadpool(
+            services.guests_db.append, new_guests, fieldnames=GUEST_FIELDS, unique_by=_unique_phone,
+        )) if new_guests else 0
     except TimeoutError:
-        return templates.TemplateResponse("simple/admin_guests.html", {**_template_ctx(request, 'admin', 'guests'), "guests": _read_guests(), "errors": ["Bulk upload paused: database busy, please retry."]}, status_code=503)
+        return services.templates.TemplateResponse("simple/admin_guests.html", {**_template_ctx(services, request, 'admin', 'guests'), "guests": _read_guests(services), "errors": ["Bulk upload paused: database busy, please retry."]}, status_code=503)
     logger.info(f"Admin bulk upload added {added} guests")
     return RedirectResponse(url="/admin/guests", status_code=303)
 
 
 @router.post("/admin/clear_database")
-async def admin_clear_db(request: Request, password: str = Form(...)):
-    _require_admin(request)
-    if password != config.get('DEFAULT', 'AdminPassword'):
+async def admin_clear_db(request: Request, password: str = Form(...), services: Services = Depends(get_services)):
+    _require_admin(services, request)
+    if not secrets.compare_digest(password.encode("utf-8"), services.auth.admin_password.encode("utf-8")):
         raise HTTPException(status_code=403, detail="Invalid confirmation password")
     # Write empty CSV with header
     try:
-        guests_db.write_all([], fieldnames=GUEST_FIELDS)
+        await run_in_threadpool(services.guests_db.write_all, [], fieldnames=GUEST_FIELDS)
     except TimeoutError:
-        return templates.TemplateResponse("simple/admin_dashboard.html", {**_template_ctx(request, 'admin', 'admin'), "count": len(_read_guests()), "errors": ["Database busy. Try clearing again in a moment."]}, status_code=503)
+        stats = await run_in_threadpool(services.guest_stats.snapshot)
+        return services.templates.TemplateResponse("simple/admin_dashboard.html", {**_template_ctx(services, request, 'admin', 'admin'), "count": stats["total"], "stats": stats, "errors": ["Database busy. Try clearing again in a moment."]}, status_code=503)
     logger.warning("Admin cleared entire guest database")
     return RedirectResponse(url="/admin", status_code=303)
 
 
 @router.get("/admin/settings", response_class=HTMLResponse)
-async def admin_settings_page(request: Request):
-    _require_admin(request)
-    return templates.TemplateResponse("simple/admin_settings.html", {**_template_ctx(request, 'admin', 'settings'), "settings": settings_service.get()})
+async def admin_settings_page(request: Request, services: Services = Depends(get_services)):
+    _require_admin(services, request)
+    return services.templates.TemplateResponse("simple/admin_settings.html", {**_template_ctx(services, request, 'admin', 'settings'), "settings": services.settings.get()})
 
 
 @router.post("/admin/settings")
@@ -545,9 +955,10 @@ async def admin_settings_submit(
     show_secretary_phone: str = Form(None),
     show_scientific_chair_phone: str = Form(None),
     registration_open: str = Form(None),
+    services: Services = Depends(get_services),
 ):
-    _require_admin(request)
-    settings_service.update(
+    _require_admin(services, request)
+    services.settings.update(
         name=name,
         dates=dates,
         contact_name=contact_name,
@@ -568,6 +979,57 @@ async def admin_settings_submit(
     return RedirectResponse(url="/admin/settings", status_code=303)
 
 
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint(request: Request, services: Services = Depends(get_services)):
+    _require_admin(services, request)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+MAX_ARMED_REQUESTS = 100
+
+
+def _profiling_page(services: Services, request: Request, status_code: int = 200):
+    profiler = services.profiler
+    return services.templates.TemplateResponse("simple/admin_profiling.html", {
+        **_template_ctx(services, request, 'admin', 'admin'),
+        "armed": profiler.armed,
+        "max_armed": MAX_ARMED_REQUESTS,
+        "token": profiler.make_token(),
+        "token_minutes": profiler.token_ttl_seconds // 60,
+        "slow_ms": profiler.slow_ms,
+        "profiles": profiler.list_profiles(),
+        "slow_requests": profiler.recent_slow(),
+    }, status_code=status_code, headers={"Cache-Control": "no-store"})
+
+
+@router.get("/admin/profiling", response_class=HTMLResponse)
+async def admin_profiling(request: Request, services: Services = Depends(get_services)):
+    _require_admin(services, request)
+    return _profiling_page(services, request)
+
+
+@router.post("/admin/profiling/arm")
+async def admin_profiling_arm(request: Request, count: int = Form(...), services: Services = Depends(get_services)):
+    _require_admin(services, request)
+    services.profiler.arm(max(0, min(count, MAX_ARMED_REQUESTS)))
+    return RedirectResponse(url="/admin/profiling", status_code=303)
+
+
+@router.get("/admin/profiling/{name}")
+async def admin_profile_download(request: Request, name: str, format: str = "prof", services: Services = Depends(get_services)):
+    """The raw ``.prof`` (for pstats/snakeviz) or, with ``?format=text``, the top functions by cumulative time"""
+    _require_admin(services, request)
+    if format == "text":
+        text = await run_in_threadpool(services.profiler.profile_text, name)
+        if text is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return PlainTextResponse(text)
+    path = services.profiler.profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
+
+
 @router.get("/logout")
 async def logout(request: Request):
     resp = RedirectResponse(url="/login", status_code=303)
@@ -8,4 +8,6 @@ __all__ = [
     "csv_db",
     "auth",
     "settings",
+    "container",
+    "guests",
 ]
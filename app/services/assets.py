@@ -0,0 +1,280 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+import time
+import logging
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+
+try:  # Optional: brotli variants are only produced when the package is installed
+    import brotli
+except ImportError:  # pragma: no cover - depends on environment
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Text formats worth precompressing; images/PDFs are already compressed.
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".mjs", ".json", ".svg", ".txt", ".html", ".map", ".xml", ".webmanifest"}
+# User content and generated files must not be fingerprinted.
+EXCLUDED_DIRS = {"uploads", "qr_codes"}
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+
+
+class AssetEntry:
+    __slots__ = ("path", "source", "digest", "fingerprinted", "media_type", "size", "mtime", "variants")
+
+    def __init__(self, path, source, digest, fingerprinted, media_type, size, mtime):
+        self.path = path
+        self.source = source
+        self.digest = digest
+        self.fingerprinted = fingerprinted
+        self.media_type = media_type
+        self.size = size
+        self.mtime = mtime
+        self.variants = {}  # encoding -> file path
+
+    def is_current(self) -> bool:
+        try:
+            st = os.stat(self.source)
+        except OSError:
+            return False
+        return st.st_size == self.size and st.st_mtime == self.mtime
+
+
+def _fingerprint(rel_path: str, digest: str) -> str:
+    base, ext = os.path.splitext(rel_path)
+    return f"{base}.{digest}{ext}"
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        if not token:
+            continue
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(token.strip().lower())
+    return accepted
+
+
+class AssetManifest:
+    """Content-hashed manifest of static assets with precompressed variants.
+
+    Built once at startup. Templates call ``asset_url('css/styles.css')`` to
+    get ``/static/css/styles.<hash>.css``; the hashed URL is served with an
+    immutable cache header, so browsers never revalidate it. A file edited
+    after startup is re-indexed under a new hash the next time it is
+    requested (see ``refresh``).
+    """
+
+    def __init__(self, static_dir: str, cache_dir: str, url_prefix: str = "/static", digest_size: int = 10):
+        self.static_dir = static_dir
+        self.cache_dir = cache_dir
+        self.url_prefix = url_prefix.rstrip("/")
+        self.digest_size = digest_size
+        self._lock = threading.Lock()
+        self._by_path = {}
+        self._by_fingerprint = {}
+        self.built = False
+        # Digest over every fingerprinted URL; changes when any asset changes
+        self.version = ""
+
+    def build(self):
+        start = time.perf_counter()
+        by_path, by_fingerprint = {}, {}
+        compressed = 0
+        for root, dirs, files in os.walk(self.static_dir):
+            rel_root = os.path.relpath(root, self.static_dir)
+            if rel_root == ".":
+                dirs[:] = [d for d in dirs if d not in EXCLUDED_DIRS and not d.startswith(".")]
+            for name in files:
+                if name.startswith("."):
+                    continue
+                source = os.path.join(root, name)
+                rel = os.path.normpath(os.path.join(rel_root, name)).replace(os.sep, "/")
+                entry = self._index_file(rel, source)
+                if entry is None:
+                    continue
+                compressed += self._precompress(entry)
+                by_path[rel] = entry
+                by_fingerprint[entry.fingerprinted] = entry
+        with self._lock:
+            self._by_path = by_path
+            self._by_fingerprint = by_fingerprint
+            self.version = self._version(by_path)
+            self.built = True
+        logger.info(
+            f"Asset manifest built: {len(by_path)} files, {compressed} new compressed variants "
+            f"in {(time.perf_counter() - start) * 1000:.1f} ms"
+        )
+        return self
+
+    @staticmethod
+    def _version(by_path) -> str:
+        return hashlib.sha1("\n".join(sorted(e.fingerprinted for e in by_path.values())).encode("utf-8")).hexdigest()[:12]
+
+    def refresh(self, entry: AssetEntry):
+        """Re-index an asset that was edited or removed after the build; returns its current entry or None.
+
+        The edited file gets a new fingerprint, which ``url`` returns from
+        then on. Its old fingerprinted URL still resolves (pages rendered
+        earlier reference it), but ``lookup`` no longer reports it as
+        fingerprinted, so it is not served as immutable.
+        """
+        fresh = self._index_file(entry.path, entry.source) if os.path.isfile(entry.source) else None
+        if fresh is not None:
+            self._precompress(fresh)
+        with self._lock:
+            current = self._by_path.get(entry.path)
+            if current is not entry:
+                return current  # refreshed by a concurrent request
+            by_path, by_fingerprint = dict(self._by_path), dict(self._by_fingerprint)
+            if fresh is None:
+                del by_path[entry.path]
+                by_fingerprint = {fp: e for fp, e in by_fingerprint.items() if e is not entry}
+            else:
+                by_path[entry.path] = fresh
+                by_fingerprint = {fp: (fresh if e is entry else e) for fp, e in by_fingerprint.items()}
+                by_fingerprint[fresh.fingerprinted] = fresh
+            self._by_path, self._by_fingerprint = by_path, by_fingerprint
+            self.version = self._version(by_path)
+        logger.info(f"Asset {entry.path} changed after startup; now {fresh.fingerprinted if fresh else 'removed'}")
+        return fresh
+
+    def _index_file(self, rel: str, source: str):
+        try:
+            st = os.stat(source)
+            h = hashlib.sha256()
+            with open(source, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(chunk)
+        except OSError as e:
+            logger.warning(f"Skipping asset {rel}: {e}")
+            return None
+        digest = h.hexdigest()[: self.digest_size]
+        media_type = mimetypes.guess_type(rel)[0] or "application/octet-stream"
+        return AssetEntry(rel, source, digest, _fingerprint(rel, digest), media_type, st.st_size, st.st_mtime)
+
+    def _precompress(self, entry: AssetEntry) -> int:
+        """Write .gz/.br siblings into the cache dir; returns count created."""
+        if os.path.splitext(entry.path)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+            return 0
+        created = 0
+        encoders = [("gzip", ".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            encoders.append(("br", ".br", lambda data: brotli.compress(data, quality=11)))
+        data = None
+        for encoding, suffix, encode in encoders:
+            target = os.path.join(self.cache_dir, entry.fingerprinted + suffix)
+            if not os.path.exists(target):
+                if data is None:
+                    with open(entry.source, "rb") as f:
+                        data = f.read()
+                payload = encode(data)
+                if len(payload) >= len(data):
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                tmp = f"{target}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(payload)
+                os.replace(tmp, target)
+                created += 1
+            entry.variants[encoding] = target
+        return created
+
+    def url(self, path: str) -> str:
+        path = path.lstrip("/")
+        entry = self._by_path.get(path)
+        if entry is None:
+            return f"{self.url_prefix}/{path}"
+        return f"{self.url_prefix}/{entry.fingerprinted}"
+
+    def urls(self, directories, plain_suffixes=()) -> list:
+        """Fingerprinted URLs of every asset below ``directories`` (e.g. a service worker's precache list).
+
+        Files ending in ``plain_suffixes`` are listed under their plain URL
+        too: ES modules import their siblings by name (``./utils.js``).
+        """
+        prefixes = tuple(d.strip("/") + "/" for d in directories)
+        urls = []
+        for path, entry in sorted(self._by_path.items()):
+            if path.startswith(prefixes):
+                urls.append(f"{self.url_prefix}/{entry.fingerprinted}")
+                if path.endswith(tuple(plain_suffixes)):
+                    urls.append(f"{self.url_prefix}/{path}")
+        return urls
+
+    def lookup(self, path: str):
+        """Return (entry, is_fingerprinted) for a request path below the mount."""
+        path = path.lstrip("/")
+        entry = self._by_fingerprint.get(path)
+        if entry is not None:
+            # False for the old hash of a file edited since (see ``refresh``)
+            return entry, entry.fingerprinted == path
+        return self._by_path.get(path), False
+
+
+class AssetStaticFiles(StaticFiles):
+    """StaticFiles that understands fingerprinted names and precompressed variants.
+
+    ``manifest`` is an AssetManifest or a zero-argument callable returning
+    one, so the mount can be declared before the services exist. Without a
+    ``directory``, files outside the manifest are served from the
+    manifest's static dir.
+    """
+
+    def __init__(self, *, manifest, **kwargs):
+        super().__init__(**kwargs)
+        self._manifest = manifest
+
+    @property
+    def manifest(self) -> AssetManifest:
+        return self._manifest if isinstance(self._manifest, AssetManifest) else self._manifest()
+
+    async def get_response(self, path: str, scope):
+        if not self.all_directories:
+            self.directory = self.manifest.static_dir
+            self.all_directories = [self.directory]
+        entry, fingerprinted = self.manifest.lookup(path)
+        if entry is None or scope["method"] not in ("GET", "HEAD"):
+            return await super().get_response(path, scope)
+
+        if not entry.is_current():
+            # Edited after the build: give it a new hash instead of serving new bytes under the old one
+            entry = await run_in_threadpool(self.manifest.refresh, entry)
+            if entry is None:
+                return await super().get_response(path, scope)
+            fingerprinted = entry.fingerprinted == path.lstrip("/")
+
+        request_headers = Headers(scope=scope)
+        file_path, encoding = entry.source, None
+        if entry.variants:
+            accepted = _accepted_encodings(request_headers.get("accept-encoding", ""))
+            for candidate in ("br", "gzip"):
+                if candidate in accepted and candidate in entry.variants and os.path.exists(entry.variants[candidate]):
+                    file_path, encoding = entry.variants[candidate], candidate
+                    break
+        try:
+            stat_result = os.stat(file_path)
+        except OSError:
+            return await super().get_response(path, scope)
+
+        headers = {
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL if fingerprinted else REVALIDATE_CACHE_CONTROL,
+        }
+        if entry.variants:
+            headers["Vary"] = "Accept-Encoding"
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        response = FileResponse(file_path, headers=headers, media_type=entry.media_type, stat_result=stat_result)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
@@ -4,6 +4,8 @@ import threading
 from datetime import datetime, timedelta
 from fastapi import Request, HTTPException
 from app.config import Config
+from app.services.metrics import metrics
+from app.services.profiling import span
 
 # First, define the class
 class AuthService:
@@ -21,13 +23,14 @@ class AuthService:
             cls._instance = cls(admin_password)
         return cls._instance
     
-    def __init__(self, admin_password):
+    def __init__(self, admin_password, session_timeout_minutes=None):
         self.admin_password = admin_password
         self.sessions = {}  # In-memory session store
         self._lock = threading.Lock()
-        cfg = Config()
+        if session_timeout_minutes is None:
+            session_timeout_minutes = Config().getint('SECURITY', 'SessionTimeout', fallback=10)
         # Session timeout in minutes (default 10)
-        self.session_timeout_minutes = cfg.getint('SECURITY', 'SessionTimeout', fallback=10) or 10
+        self.session_timeout_minutes = session_timeout_minutes or 10
     
     def create_session(self, user_id, role):
         """Create a new session for a user"""
@@ -45,7 +48,7 @@ class AuthService:
         """Validate a session and return user information"""
         if not session_id:
             return None
-        with self._lock:
+        with span("auth"), self._lock:
             session = self.sessions.get(session_id)
             if not session:
                 return None
@@ -57,6 +60,15 @@ class AuthService:
                 return None
             return dict(session)
     
+    def active_session_count(self):
+        """Count unexpired sessions, pruning expired ones as a side effect"""
+        now = datetime.now()
+        with self._lock:
+            expired = [sid for sid, s in self.sessions.items() if now > s["expires"]]
+            for sid in expired:
+                del self.sessions[sid]
+            return len(self.sessions)
+
     def require_admin(self, session_id):
         """Check if the session has admin privileges"""
         session = self.validate_session(session_id)
@@ -71,9 +83,7 @@ class AuthService:
             return False
         return True
 
-# Initialize the singleton instance
-config = Config()
-auth_service = AuthService.get_instance(config.get('DEFAULT', 'AdminPassword'))
+ACTIVE_SESSIONS = metrics.gauge("auth_active_sessions", "Unexpired sessions held by this worker")
 
 # Function to get current admin from request
 async def get_current_admin(request: Request):
@@ -82,7 +92,8 @@ async def get_current_admin(request: Request):
     if not session_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    session = auth_service.validate_session(session_id)
+    from app.services.container import get_services  # container imports this module
+    session = get_services(request).auth.validate_session(session_id)
     if not session or session["role"] != "admin":
         raise HTTPException(status_code=401, detail="Not authorized")
         
@@ -0,0 +1,183 @@
+"""Badge QR codes and the gate check-in log.
+
+A badge carries ``G1.<guest id>.<signature>``: an HMAC of the guest ID, so a
+scanner can trust a code without reading ``guests.csv``. Check-ins go to
+their own append-only JSON-lines file, never to the guest table, so busy
+gates do not contend with registrations and edits for the CSV write lock.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+from datetime import datetime
+import logging
+
+from app.services.metrics import metrics
+
+try:  # Optional: without it badges are shown as text codes only
+    import qrcode
+except ImportError:  # pragma: no cover - depends on environment
+    qrcode = None
+
+logger = logging.getLogger(__name__)
+
+CHECKIN_SCANS = metrics.counter("checkin_scans_total", "Badge scans by outcome", ("result",))
+
+BADGE_PREFIX = "G1"
+_DEFAULT_SECRET = "generate_random_secret_key_here"
+
+
+def _load_key(secret: str, key_path: str, context: str = "") -> bytes:
+    """Signing key shared by every worker and stable across restarts.
+
+    Derived from ``SecretKey`` (and ``context``, e.g. an event) when one is
+    configured; otherwise a random key is created once in ``key_path``
+    (badges already printed must keep working).
+    """
+    if secret and secret != _DEFAULT_SECRET:
+        label = f"checkin:{context}:{secret}" if context else f"checkin:{secret}"
+        return hashlib.sha256(label.encode("utf-8")).digest()
+    try:
+        with open(key_path, "rb") as f:
+            key = f.read()
+        if len(key) >= 32:
+            return key
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(key_path) or ".", exist_ok=True)
+    try:
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another worker created it first
+        with open(key_path, "rb") as f:
+            return f.read()
+    with os.fdopen(fd, "wb") as f:
+        key = secrets.token_bytes(32)
+        f.write(key)
+    logger.info(f"Created badge signing key {key_path}")
+    return key
+
+
+class CheckinService:
+    """Signs and verifies badge codes and keeps the check-in log.
+
+    Every worker holds ``{guest id: first check-in}`` in memory. Before each
+    scan it reads only the bytes other workers appended since its last look
+    (one ``fstat`` when nothing changed), so a repeat scan at any gate is
+    answered as "already checked in" without writing. Two workers scanning
+    the same badge at the same instant may both append; readers keep the
+    first entry, so the log stays correct.
+    """
+
+    def __init__(self, log_path: str, qr_dir: str, secret: str = "", key_path: str = "./data/checkin.key",
+                 context: str = ""):
+        self.log_path = log_path
+        self.qr_dir = qr_dir
+        self._key = _load_key(secret, key_path, context)
+        self._lock = threading.Lock()
+        self._checked_in = {}
+        self._offset = 0
+        self._partial = b""
+
+    @property
+    def images_available(self) -> bool:
+        return qrcode is not None
+
+    # --- badge codes ----------------------------------------------------
+    def _signature(self, guest_id: str) -> str:
+        digest = hmac.new(self._key, f"badge:{guest_id}".encode("utf-8"), hashlib.sha256).digest()[:16]
+        return base64.urlsafe_b64encode(digest).decode("ascii").rstrip("=")
+
+    def badge_code(self, guest_id: str) -> str:
+        return f"{BADGE_PREFIX}.{guest_id}.{self._signature(guest_id)}"
+
+    def verify(self, code: str):
+        """Guest ID of a genuine badge code, else None. Pure computation: no file access."""
+        prefix, _, rest = (code or "").strip().partition(".")
+        guest_id, _, signature = rest.rpartition(".")
+        if prefix != BADGE_PREFIX or not guest_id:
+            return None
+        return guest_id if hmac.compare_digest(signature, self._signature(guest_id)) else None
+
+    def badge_png(self, guest_id: str):
+        """Path of the badge QR image, rendered once into ``qr_dir``; None without ``qrcode``"""
+        if qrcode is None:
+            return None
+        code = self.badge_code(guest_id)
+        # Named after the signed code, so files under /static are not guessable from a guest ID
+        path = os.path.join(self.qr_dir, f"{hashlib.sha256(code.encode('utf-8')).hexdigest()[:32]}.png")
+        if not os.path.exists(path):
+            os.makedirs(self.qr_dir, exist_ok=True)
+            temp = f"{path}.{os.getpid()}.tmp"
+            qrcode.make(code, box_size=8, border=2).save(temp)
+            os.replace(temp, path)
+        return path
+
+    # --- check-in log ---------------------------------------------------
+    def _sync(self):
+        """Fold in entries appended (by any worker) since the last call; caller holds the lock."""
+        try:
+            f = open(self.log_path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size < self._offset:
+                # Log was truncated or replaced: start over
+                self._checked_in.clear()
+                self._offset, self._partial = 0, b""
+            if size == self._offset:
+                return
+            f.seek(self._offset)
+            data = self._partial + f.read(size - self._offset)
+            self._offset = size
+        *lines, self._partial = data.split(b"\n")
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logger.warning("Skipping malformed check-in log line")
+                continue
+            self._checked_in.setdefault(entry.get("guest_id"), entry)
+
+    def _append(self, entry: dict):
+        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+        line = (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8")
+        # One O_APPEND write per event: concurrent workers never interleave within a line
+        fd = os.open(self.log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def scan(self, code: str, gate: str = "") -> dict:
+        """Check a guest in from a scanned badge code.
+
+        Returns ``{"status": "checked_in" | "already_checked_in" | "invalid", ...}``
+        with the guest ID, time and gate of the (first) check-in.
+        """
+        guest_id = self.verify(code)
+        if guest_id is None:
+            CHECKIN_SCANS.inc(result="invalid")
+            return {"status": "invalid"}
+        with self._lock:
+            self._sync()
+            existing = self._checked_in.get(guest_id)
+            if existing is not None:
+                CHECKIN_SCANS.inc(result="duplicate")
+                return {"status": "already_checked_in", **existing}
+            entry = {"guest_id": guest_id, "at": datetime.now().isoformat(timespec="seconds"), "gate": gate}
+            # Our own line comes back through the next _sync; setdefault keeps this entry
+            self._append(entry)
+            self._checked_in[guest_id] = entry
+        CHECKIN_SCANS.inc(result="checked_in")
+        return {"status": "checked_in", **entry}
+
+    def checked_in(self) -> list:
+        """Every first check-in, in log order"""
+        with self._lock:
+            self._sync()
+            return list(self._checked_in.values())
@@ -0,0 +1,255 @@
+import os
+import threading
+import time
+import logging
+
+from fastapi import Request, HTTPException
+
+from app.config import Config, get_config
+from app.services.assets import AssetManifest
+from app.services.checkin import CheckinService
+from app.services.auth import AuthService, ACTIVE_SESSIONS
+from app.services.csv_db import CSVDatabase
+from app.services.duplicates import DuplicateReview
+from app.services.events import EventRegistry
+from app.services.exports import FileExports
+from app.services.guest_records import GuestRecord
+from app.services.guest_stats import GuestStats
+from app.services.guests import normalize_phone
+from app.services.history import ChangeLog
+from app.services.http_cache import make_etag
+from app.services.images import ImageService
+from app.services.metrics import metrics
+from app.services.page_cache import GuestPageCache
+from app.services.profiling import RequestProfiler
+from app.services.rate_limit import LoginRateLimits
+from app.services.settings import SettingsService
+from app.services.templating import build_templates
+from app.services.uploads import ChunkedUploads
+
+logger = logging.getLogger(__name__)
+
+STARTUP_SECONDS = metrics.gauge("app_startup_seconds", "Time taken to build and start the application services")
+
+_init_lock = threading.Lock()
+
+
+def ensure_directories(config: Config):
+    static_dir = config.get('PATHS', 'StaticDir')
+    for directory in (
+        config.get('PATHS', 'LogsDir'),
+        static_dir,
+        config.get('PATHS', 'TemplatesDir'),
+        os.path.dirname(config.get('DATABASE', 'CSVPath')),
+        config.get('DATABASE', 'BackupDir'),
+        os.path.join(static_dir, "css"),
+        os.path.join(static_dir, "js"),
+        os.path.join(static_dir, "images"),
+        os.path.join(static_dir, "uploads"),
+        os.path.join(static_dir, "uploads/presentations"),
+        os.path.join(static_dir, "uploads/profile_photos"),
+        os.path.join(static_dir, "qr_codes"),
+        os.path.join(static_dir, "schedule"),
+    ):
+        os.makedirs(directory, exist_ok=True)
+
+
+def _tree_signature(root: str) -> list:
+    """(path, mtime_ns) of every file under ``root``, for deploy-level validators"""
+    signature = []
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(dirpath, name)
+            signature.append((os.path.relpath(path, root), os.stat(path).st_mtime_ns))
+    return sorted(signature)
+
+
+def _data_paths(config: Config, event=None) -> dict:
+    """Where one event keeps its data: the configured paths, or files inside the event's directory"""
+    if event is None:
+        return {
+            'csv': config.get('DATABASE', 'CSVPath'),
+            'backups': config.get('DATABASE', 'BackupDir'),
+            'settings': './data/settings.json',
+            'uploads': os.path.join(config.get('PATHS', 'StaticDir'), 'uploads'),
+            'history': config.get('HISTORY', 'LogPath', fallback='./data/guests_history.jsonl'),
+            'dismissed': config.get('DUPLICATES', 'DismissedPath', fallback='./data/duplicates_dismissed.json'),
+            'checkins': config.get('CHECKIN', 'LogPath', fallback='./data/checkins.jsonl'),
+            'checkin_key': config.get('CHECKIN', 'KeyPath', fallback='./data/checkin.key'),
+            'upload_staging': config.get('UPLOADS', 'StagingDir', fallback='./data/upload_staging'),
+            'exports': config.get('EXPORT', 'JobDir', fallback='./data/exports'),
+        }
+    return {
+        'csv': event.path('guests.csv'),
+        'backups': event.path('backups'),
+        'settings': event.path('settings.json'),
+        'uploads': event.path('uploads'),
+        'history': event.path('guests_history.jsonl'),
+        'dismissed': event.path('duplicates_dismissed.json'),
+        'checkins': event.path('checkins.jsonl'),
+        'checkin_key': event.path('checkin.key'),
+        'upload_staging': event.path('upload_staging'),
+        'exports': event.path('exports'),
+    }
+
+
+class Services:
+    """Long-lived services shared by every request of one worker.
+
+    Built once by the application lifespan (see ``init_services``) and handed
+    to route handlers with ``Depends(get_services)``, so importing the app
+    never touches config files, data files or directories.
+
+    With ``event`` (an ``EventSpec``) the instance serves one event of a
+    multi-event deployment: guest store, settings, uploads, history and
+    check-ins live in the event's directory, while assets, images,
+    templates, rate limits and the profiler are taken from ``shared`` (the
+    default event's services), so loading an event costs no asset scan.
+    """
+
+    def __init__(self, config: Config, event=None, shared: "Services" = None, auth: AuthService = None):
+        self.config = config
+        self.event = event
+        paths = _data_paths(config, event)
+        self.upload_root = paths['uploads']
+        self.settings = SettingsService(paths['settings'])
+        self.auth = auth or AuthService(
+            event.admin_password if event and event.admin_password else config.get('DEFAULT', 'AdminPassword'),
+            config.getint('SECURITY', 'SessionTimeout', fallback=10),
+        )
+        self.guests_db = CSVDatabase(
+            paths['csv'],
+            paths['backups'],
+            record_type=GuestRecord,
+            index_fields={'ID': None, 'Phone': normalize_phone},
+            snapshot_reads=True,
+            stale_lock_seconds=float(config.get('DATABASE', 'StaleLockSeconds', fallback='30')),
+        )
+        self.history = ChangeLog(self.guests_db, paths['history'])
+        self.guest_stats = GuestStats(self.guests_db, self.upload_root)
+        mb = 1024 * 1024
+        self.uploads = ChunkedUploads(
+            paths['upload_staging'],
+            {
+                'guest': int(float(config.get('UPLOADS', 'GuestMaxMB', fallback='100')) * mb),
+                'admin': int(float(config.get('UPLOADS', 'AdminMaxMB', fallback='500')) * mb),
+            },
+            chunk_size=int(float(config.get('UPLOADS', 'ChunkSizeMB', fallback='4')) * mb),
+            expire_seconds=float(config.get('UPLOADS', 'ExpireHours', fallback='24')) * 3600,
+        )
+        self.exports = FileExports(
+            paths['exports'],
+            self.upload_root,
+            expire_seconds=float(config.get('EXPORT', 'ExpireHours', fallback='24')) * 3600,
+        )
+        self.duplicates = DuplicateReview(
+            self.guests_db,
+            paths['dismissed'],
+            min_score=float(config.get('DUPLICATES', 'MinScore', fallback='0.6')),
+            max_block=config.getint('DUPLICATES', 'MaxBlockSize', fallback=100),
+        )
+        self.guest_pages = GuestPageCache(self.guests_db, config.getint('CACHE', 'GuestPageEntries', fallback=500))
+        static_dir = config.get('PATHS', 'StaticDir')
+        self.checkin = CheckinService(
+            paths['checkins'],
+            os.path.join(static_dir, 'qr_codes'),
+            secret=config.get('DEFAULT', 'SecretKey', fallback=''),
+            key_path=paths['checkin_key'],
+            # Badges of one event must not verify at another
+            context=event.slug if event else "",
+        )
+        # Multi-event mode: set on the default event's services by init_services
+        self.events = None
+        if shared is not None:
+            self.assets = shared.assets
+            self.images = shared.images
+            self.rate_limits = shared.rate_limits
+            self.profiler = shared.profiler
+            self.templates = shared.templates
+            self.render_version = shared.render_version
+            return
+        self.assets = AssetManifest(
+            static_dir,
+            config.get('PATHS', 'AssetCacheDir', fallback='./data/asset_cache'),
+        )
+        self.images = ImageService(
+            static_dir,
+            config.get('IMAGES', 'CacheDir', fallback='./data/image_cache'),
+            widths=[int(w) for w in config.get('IMAGES', 'Widths', fallback='320,640,960,1280').split(',') if w.strip()],
+            webp_quality=config.getint('IMAGES', 'WebPQuality', fallback=75),
+            jpeg_quality=config.getint('IMAGES', 'JPEGQuality', fallback=80),
+        )
+        self.rate_limits = LoginRateLimits(config)
+        self.profiler = RequestProfiler(
+            config.get('PROFILING', 'ProfileDir', fallback='./data/profiles'),
+            config.get('PROFILING', 'SlowLogPath', fallback='./logs/slow_requests.log'),
+            slow_ms=float(config.get('PROFILING', 'SlowRequestMs', fallback='500')),
+            max_profiles=config.getint('PROFILING', 'MaxProfiles', fallback=50),
+            secret=config.get('DEFAULT', 'SecretKey', fallback=''),
+        )
+        self.templates = build_templates(config, self.assets, self.images, self.checkin)
+        # Part of every rendered-page validator: changes when a deploy changes templates or assets
+        self.render_version = ""
+
+    def start(self):
+        self.assets.build()
+        self.render_version = make_etag(
+            self.config.get('DEFAULT', 'SoftwareVersion', fallback=''),
+            self.assets.version,
+            *_tree_signature(self.config.get('PATHS', 'TemplatesDir')),
+        )
+        ACTIVE_SESSIONS.set_function(self.auth.active_session_count)
+        return self
+
+
+def _event_registry(config: Config, default: Services) -> EventRegistry:
+    registry = EventRegistry(
+        config.get('EVENTS', 'Root', fallback='./data/events'),
+        lambda spec, auth: Services(config, event=spec, shared=default, auth=auth),
+        default_slug=config.get('EVENTS', 'DefaultSlug', fallback='main'),
+        idle_seconds=float(config.get('EVENTS', 'IdleSeconds', fallback='1800')),
+        max_loaded=config.getint('EVENTS', 'MaxLoaded', fallback=16),
+        path_prefix=config.get('EVENTS', 'PathPrefix', fallback='/e'),
+    )
+    ACTIVE_SESSIONS.set_function(
+        lambda: default.auth.active_session_count() + sum(a.active_session_count() for a in registry.sessions())
+    )
+    return registry
+
+
+def init_services(app, config: Config = None) -> Services:
+    """Build and start the app's services once; later calls return the same instance."""
+    services = getattr(app.state, "services", None)
+    if services is not None:
+        return services
+    with _init_lock:
+        services = getattr(app.state, "services", None)
+        if services is None:
+            start = time.perf_counter()
+            config = config or get_config()
+            ensure_directories(config)
+            services = Services(config).start()
+            if config.getboolean('EVENTS', 'Enabled', fallback=False):
+                services.events = _event_registry(config, services)
+            app.state.services = services
+            STARTUP_SECONDS.set(time.perf_counter() - start)
+            logger.info(f"Services initialized in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return services
+
+
+def get_services(request: Request) -> Services:
+    """FastAPI dependency returning the app's services.
+
+    Normally the lifespan has already built them; apps driven without a
+    lifespan (e.g. a bare TestClient) initialize on first use instead.
+    In multi-event mode these are the services of the event that
+    ``EventMiddleware`` selected for the request.
+    """
+    services = init_services(request.app)
+    slug = getattr(request.state, "event", None)
+    if slug is None or services.events is None:
+        return services
+    event_services = services.events.get(slug)
+    if event_services is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    return event_services
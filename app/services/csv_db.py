@@ -7,92 +7,543 @@ import shutil
 from datetime import datetime
 import logging
 
+from app.services import file_lock
+from app.services.csv_index import RowOffsetIndex
+from app.services.metrics import metrics
+from app.services.profiling import span
+
 logger = logging.getLogger(__name__)
 
+CSV_READ_SECONDS = metrics.histogram("csv_read_seconds", "Time spent reading and parsing the CSV file", ("store",))
+CSV_ROWS = metrics.gauge("csv_rows", "Rows returned by the most recent full read", ("store",))
+CSV_WRITE_SECONDS = metrics.histogram("csv_write_seconds", "Time spent writing the CSV file (excluding backup)", ("store",))
+CSV_BACKUP_SECONDS = metrics.histogram("csv_backup_seconds", "Time spent copying the CSV file to a backup", ("store",))
+CSV_LOCK_WAIT_SECONDS = metrics.histogram("csv_lock_wait_seconds", "Time spent waiting for the cross-process lock file", ("store", "op"))
+CSV_LOCK_TIMEOUTS = metrics.counter("csv_lock_timeouts_total", "Lock waits that gave up before the lock was released", ("store", "op"))
+CSV_SNAPSHOT_READS = metrics.counter("csv_snapshot_reads_total", "Snapshot reads by whether the committed snapshot was current or the file had to be parsed", ("store", "result"))
+CSV_VERSION_CONFLICTS = metrics.counter("csv_version_conflicts_total", "Keyed updates rejected because the row version changed", ("store",))
+
+
+class VersionConflictError(Exception):
+    """Raised by CSVDatabase.update when the stored row version differs from the expected one"""
+
+    def __init__(self, key, expected_version, current):
+        super().__init__(f"Record {key} changed: expected version {expected_version}, found {row_version(current)}")
+        self.key = key
+        self.expected_version = expected_version
+        self.current = current
+
+
+class ChangeEvent:
+    """A committed mutation, passed to CSVDatabase listeners.
+
+    ``rows`` is the full file content after the write. ``before_stat`` and
+    ``after_stat`` are file signatures (see ``CSVDatabase.file_stat``) so a
+    listener can tell whether its state already reflected the file before
+    this write or whether another process changed it in between.
+    """
+
+    __slots__ = ("op", "rows", "before_stat", "after_stat", "added", "old", "new", "updated", "removed", "previous")
+
+    def __init__(self, op, rows, before_stat, after_stat, added=(), old=None, new=None, updated=(), removed=(),
+                 previous=()):
+        self.op = op  # "append", "update", "update_many", "merge" or "replace"
+        self.rows = rows
+        self.before_stat = before_stat
+        self.after_stat = after_stat
+        self.added = added
+        self.old = old
+        self.new = new
+        self.updated = updated  # (old, new) pairs for "update_many"
+        self.removed = removed  # rows deleted by "merge"
+        self.previous = previous  # rows before a "replace"
+
+
+def row_version(row, version_field='Version') -> int:
+    """Integer version of a row; rows written before versioning count as 0"""
+    try:
+        return int((row or {}).get(version_field) or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
 class CSVDatabase:
-    """Thread-safe CSV database operations with automatic backups"""
+    """Thread-safe CSV database operations with automatic backups.
+
+    Rows are keyed by ``key_field`` and carry an integer ``version_field``
+    that ``update`` uses as a compare-and-swap token, so concurrent edits
+    from different workers are detected instead of silently overwritten.
+
+    ``record_type`` (e.g. ``GuestRecord``) replaces the per-row dicts of
+    ``csv.DictReader`` with a compact mapping built by
+    ``record_type.row_builder(header)``.
+
+    ``index_fields`` (column -> optional normalizer) enables ``lookup``:
+    point reads through a persisted row-offset index instead of a full parse.
+
+    With ``snapshot_reads`` the store keeps the last committed file version
+    in memory. ``read_all`` serves it without waiting for writers (their
+    ``os.replace`` is atomic, so the file on disk is always a committed
+    version) and only re-parses when another process replaced the file.
+    Writers publish the rows they wrote as the new snapshot right after the
+    replace. Rows returned from a snapshot are shared and must not be
+    mutated; ``update`` and ``write_all`` are the way to change them.
+    """
     
-    def __init__(self, file_path, backup_dir):
+    def __init__(self, file_path, backup_dir, key_field='ID', version_field='Version', record_type=None,
+                 index_fields=None, snapshot_reads=False, stale_lock_seconds=30.0):
         self.file_path = file_path
         self.backup_dir = backup_dir
-        self.lock = threading.Lock()
+        self.key_field = key_field
+        self.version_field = version_field
+        self.record_type = record_type
+        # Re-entrant: keyed updates hold it across read, backup and write
+        self.lock = threading.RLock()
         self.lock_file = f"{self.file_path}.lock"
+        self.stale_lock_seconds = stale_lock_seconds
+        # Token written into the lock file by the thread holding it
+        self._lock_owner = threading.local()
+        self.store_name = os.path.basename(file_path)
+        self._listeners = []
+        self.index = RowOffsetIndex(file_path, index_fields, self.store_name) if index_fields else None
+        self.snapshot_reads = snapshot_reads
+        # (file signature, header, rows) of the last committed version; replaced as a whole, never mutated
+        self._snapshot = None
+        self._snapshot_load_lock = threading.Lock()
         
         # Ensure directories exist
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
         os.makedirs(backup_dir, exist_ok=True)
 
     def _acquire_file_lock(self, timeout=3.0, poll=0.02):
-        """Cross-process lock using a lock file. Returns True if acquired."""
-        start = time.time()
-        while time.time() - start < timeout:
+        """Cross-process lock using a lock file. Returns True if acquired.
+
+        A lock left by a writer that died, or held longer than
+        ``stale_lock_seconds``, is taken over (see ``app.services.file_lock``).
+        """
+        wait_start = time.perf_counter()
+        try:
+            token = file_lock.acquire(self.lock_file, timeout, poll, self.stale_lock_seconds)
+        except OSError as e:
+            logger.warning(f"Lock acquire unexpected error: {e}")
+            token = None
+        CSV_LOCK_WAIT_SECONDS.observe(time.perf_counter() - wait_start, store=self.store_name, op="write")
+        if token is None:
+            CSV_LOCK_TIMEOUTS.inc(store=self.store_name, op="write")
+            return False
+        self._lock_owner.token = token
+        return True
+
+    def add_listener(self, listener):
+        """Call ``listener(ChangeEvent)`` after every mutation this instance commits."""
+        self._listeners.append(listener)
+
+    def _notify(self, event):
+        for listener in self._listeners:
             try:
-                # O_CREAT|O_EXCL ensures atomic creation; fails if exists
-                fd = os.open(self.lock_file, os.O_CREAT | os.O_EXCL | os.O_RDWR)
-                with os.fdopen(fd, 'w') as f:
-                    f.write(f"locked {datetime.now().isoformat()}\n")
-                return True
-            except FileExistsError:
-                time.sleep(poll)
+                listener(event)
             except Exception as e:
-                logger.warning(f"Lock acquire unexpected error: {e}")
-                time.sleep(poll)
-        return False
+                logger.error(f"CSV change listener failed: {e}", exc_info=True)
+
+    def file_stat(self):
+        """Signature of the file on disk; changes whenever any process replaces it"""
+        try:
+            st = os.stat(self.file_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
 
     def _release_file_lock(self):
+        token = getattr(self._lock_owner, 'token', None)
+        self._lock_owner.token = None
+        if token is None:
+            return
         try:
-            if os.path.exists(self.lock_file):
-                os.remove(self.lock_file)
+            file_lock.release(self.lock_file, token)
         except Exception:
             pass
     
     def read_all(self):
         """Read all records from CSV file with proper error handling"""
+        if self.snapshot_reads:
+            return list(self._current_snapshot()[2])
         try:
             # If a writer holds lock, wait briefly to avoid partial reads
             start = time.time()
-            while os.path.exists(self.lock_file) and (time.time() - start) < 1.0:
-                time.sleep(0.02)
+            if os.path.exists(self.lock_file):
+                wait_start = time.perf_counter()
+                while os.path.exists(self.lock_file) and (time.time() - start) < 1.0:
+                    time.sleep(0.02)
+                CSV_LOCK_WAIT_SECONDS.observe(time.perf_counter() - wait_start, store=self.store_name, op="read")
+                if os.path.exists(self.lock_file):
+                    CSV_LOCK_TIMEOUTS.inc(store=self.store_name, op="read")
             with self.lock:
-                if not os.path.exists(self.file_path):
-                    return []
-                with open(self.file_path, mode='r', newline='', encoding='utf-8-sig') as file:
-                    reader = csv.DictReader(file)
-                    return list(reader)
+                return self._read_rows()[1]
         except Exception as e:
             logger.error(f"Error reading from CSV: {str(e)}")
             raise
-    
-    def write_all(self, data, fieldnames=None):
-        """Write all records to CSV file with backup creation"""
-        try:
-            # Try to acquire cross-process lock
-            if not self._acquire_file_lock(timeout=3.0, poll=0.02):
-                logger.warning("CSV lock busy: write_all timed out")
-                raise TimeoutError("Database is busy. Please try again.")
 
-            # Create backup first
-            self.create_backup()
-            with self.lock:
-                if not fieldnames and data:
-                    fieldnames = list(data[0].keys())
-                temp_file = f"{self.file_path}.tmp"
+    def lookup(self, field, value):
+        """Return the first row whose ``field`` matches ``value``, or None.
+
+        Indexed fields compare normalized values and parse only the matching
+        record; anything else falls back to scanning ``read_all()``.
+        """
+        if self.index is None or field not in self.index.fields:
+            return next((row for row in self.read_all() if row.get(field) == value), None)
+        found = self.index.lookup(field, value)
+        if found is None:
+            return None
+        header, values = found
+        if self.record_type is not None:
+            return self.record_type.row_builder(header)(values)
+        return dict(zip(header, values))
+
+    def _read_rows(self):
+        """Parse the file; returns (fieldnames, rows). Caller holds self.lock."""
+        if self.snapshot_reads:
+            _, header, rows = self._current_snapshot()
+            # Fresh list: writers replace changed rows with copies, never mutate shared ones
+            return header, list(rows)
+        if not os.path.exists(self.file_path):
+            return [], []
+        with open(self.file_path, mode='r', newline='', encoding='utf-8-sig') as file:
+            return self._parse(file)
+
+    def _parse(self, file):
+        with CSV_READ_SECONDS.time(store=self.store_name), span("csv_parse"):
+            if self.record_type is None:
+                reader = csv.DictReader(file)
+                rows = list(reader)
+                fieldnames = list(reader.fieldnames or [])
+            else:
+                reader = csv.reader(file)
+                fieldnames = next(reader, [])
+                build = self.record_type.row_builder(fieldnames)
+                # Skip blank lines like DictReader does
+                rows = [build(values) for values in reader if values]
+        CSV_ROWS.set(len(rows), store=self.store_name)
+        return fieldnames, rows
+
+    # --- snapshots ------------------------------------------------------
+    def _current_snapshot(self):
+        """The committed (stat, header, rows); parses only if the file changed since."""
+        stat = self.file_stat()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot[0] == stat:
+            CSV_SNAPSHOT_READS.inc(store=self.store_name, result="hit")
+            return snapshot
+        # Readers never wait on writers, only on another reader already parsing the same change
+        with self._snapshot_load_lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot[0] == self.file_stat():
+                CSV_SNAPSHOT_READS.inc(store=self.store_name, result="hit")
+                return snapshot
+            CSV_SNAPSHOT_READS.inc(store=self.store_name, result="load")
+            try:
+                file = open(self.file_path, mode='r', newline='', encoding='utf-8-sig')
+            except FileNotFoundError:
+                snapshot = (None, [], [])
+            else:
+                with file:
+                    # Signature of the file actually parsed, even if it is replaced meanwhile
+                    st = os.fstat(file.fileno())
+                    header, rows = self._parse(file)
+                snapshot = ((st.st_ino, st.st_size, st.st_mtime_ns), header, rows)
+            self._snapshot = snapshot
+            return snapshot
+
+    def _publish_snapshot(self, fieldnames, rows):
+        """Make the rows just written the snapshot readers see. Caller holds both locks.
+
+        Rows taken unchanged from the previous snapshot are reused; other
+        rows are converted to exactly what a re-read of the file would give.
+        """
+        if not self.snapshot_reads:
+            return rows
+        previous = self._snapshot
+        fieldnames = list(fieldnames or [])
+        reuse = {id(r) for r in previous[2]} if previous and previous[1] == fieldnames else set()
+        if self.record_type is not None:
+            build = self.record_type.row_builder(fieldnames)
+        else:
+            def build(values):
+                return dict(zip(fieldnames, values))
+        committed = [
+            row if id(row) in reuse else build(['' if v is None else str(v) for v in map(row.get, fieldnames)])
+            for row in rows
+        ]
+        self._snapshot = (self.file_stat(), fieldnames, committed)
+        return committed
+
+    def _write_rows(self, data, fieldnames, extrasaction='raise'):
+        """Backup, then atomically replace the file. Caller holds both locks."""
+        self.create_backup()
+        if not fieldnames and data:
+            fieldnames = list(data[0].keys())
+        temp_file = f"{self.file_path}.tmp"
+        try:
+            with CSV_WRITE_SECONDS.time(store=self.store_name):
                 with open(temp_file, mode='w', newline='', encoding='utf-8') as file:
-                    writer = csv.DictWriter(file, fieldnames=fieldnames)
+                    writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction=extrasaction)
                     writer.writeheader()
                     writer.writerows(data)
                 os.replace(temp_file, self.file_path)
-            return True
-        except Exception as e:
-            logger.error(f"Error writing to CSV: {str(e)}")
+        except Exception:
             if os.path.exists(temp_file):
                 try:
                     os.remove(temp_file)
-                except:
+                except OSError:
                     pass
             raise
+        CSV_ROWS.set(len(data), store=self.store_name)
+
+    def _locked(self, op_name):
+        """Acquire the cross-process lock or raise TimeoutError"""
+        if not self._acquire_file_lock(timeout=3.0, poll=0.02):
+            logger.warning(f"CSV lock busy: {op_name} timed out")
+            raise TimeoutError("Database is busy. Please try again.")
+
+    def write_all(self, data, fieldnames=None):
+        """Write all records to CSV file with backup creation"""
+        # Only release the lock file we created; on timeout it belongs to another writer
+        self._locked("write_all")
+        try:
+            with self.lock:
+                before = self.file_stat()
+                # Only parsed for listeners (free with snapshot reads)
+                previous = self._read_rows()[1] if self._listeners else ()
+                self._write_rows(data, fieldnames)
+                committed = self._publish_snapshot(fieldnames or (list(data[0].keys()) if data else []), data)
+                self._notify(ChangeEvent("replace", committed, before, self.file_stat(), previous=previous))
+            return True
+        except Exception as e:
+            logger.error(f"Error writing to CSV: {str(e)}")
+            raise
+        finally:
+            self._release_file_lock()
+
+    def update(self, key, changes, expected_version=None, fieldnames=None):
+        """Merge ``changes`` into the row with ``key`` under the write lock.
+
+        When ``expected_version`` is given it must equal the stored row
+        version, otherwise VersionConflictError is raised with the current
+        row. The version is incremented on success. Raises KeyError if the
+        row does not exist. Returns the updated row.
+        """
+        self._locked("update")
+        try:
+            with self.lock:
+                before = self.file_stat()
+                header, rows = self._read_rows()
+                for index, row in enumerate(rows):
+                    if row.get(self.key_field) == key:
+                        break
+                else:
+                    raise KeyError(key)
+                current = row_version(row, self.version_field)
+                if expected_version is not None and int(expected_version) != current:
+                    CSV_VERSION_CONFLICTS.inc(store=self.store_name)
+                    raise VersionConflictError(key, expected_version, dict(row))
+                old = dict(row)
+                # Change a copy: the original may be shared with readers of the snapshot
+                row = rows[index] = row.copy()
+                row.update(changes)
+                row[self.version_field] = str(current + 1)
+                fieldnames = self._fieldnames(fieldnames, header)
+                self._write_rows(rows, fieldnames, extrasaction='ignore')
+                committed = self._publish_snapshot(fieldnames, rows)
+                self._notify(ChangeEvent("update", committed, before, self.file_stat(), old=old, new=dict(row)))
+                return dict(row)
+        finally:
+            self._release_file_lock()
+
+    def update_many(self, updates, fieldnames=None, validate=None, unique_by=None, touch=None, atomic=False):
+        """Apply many keyed updates in one transaction: one lock, one backup, one write.
+
+        ``updates`` yields ``(key, changes, expected_version)``. Each one is
+        checked like ``update`` and additionally with ``validate(row)``
+        (a list of errors for the merged row) and ``unique_by(row)``, whose
+        non-empty value must not belong to another row. ``touch`` fields
+        (e.g. an UpdatedAt stamp) are set only on rows that really change.
+        With ``atomic`` nothing is written unless every update succeeds.
+
+        Returns one result per update, in order: ``{"key", "status",
+        "version", "errors", "row"}`` (``row`` is a copy of the stored row,
+        None if not found) where status is "updated", "unchanged",
+        "not_found", "conflict", "invalid", "duplicate", or "skipped" for
+        valid updates of a failed atomic batch.
+        """
+        self._locked("update_many")
+        try:
+            with self.lock:
+                before = self.file_stat()
+                header, rows = self._read_rows()
+                positions = {}
+                owners = {}
+                for i, row in enumerate(rows):
+                    key = row.get(self.key_field)
+                    positions.setdefault(key, i)
+                    value = unique_by(row) if unique_by else None
+                    if value:
+                        owners.setdefault(value, key)
+                results = []
+                changed = []
+                for key, changes, expected_version in updates:
+                    result = {"key": key, "status": "updated", "version": None, "errors": [], "row": None}
+                    results.append(result)
+                    index = positions.get(key)
+                    if index is None:
+                        result["status"] = "not_found"
+                        continue
+                    row = rows[index]
+                    current = row_version(row, self.version_field)
+                    result["version"] = current
+                    result["row"] = dict(row)
+                    if expected_version is not None and int(expected_version) != current:
+                        CSV_VERSION_CONFLICTS.inc(store=self.store_name)
+                        result["status"] = "conflict"
+                        continue
+                    if all(row.get(k) == v for k, v in changes.items()):
+                        result["status"] = "unchanged"
+                        continue
+                    merged = row.copy()
+                    merged.update(changes)
+                    errors = validate(merged) if validate else []
+                    if errors:
+                        result.update(status="invalid", errors=errors)
+                        continue
+                    if unique_by:
+                        old_value, value = unique_by(row), unique_by(merged)
+                        if value and owners.get(value, key) != key:
+                            result["status"] = "duplicate"
+                            continue
+                        if old_value and owners.get(old_value) == key:
+                            del owners[old_value]
+                        if value:
+                            owners[value] = key
+                    merged.update(touch or {})
+                    merged[self.version_field] = str(current + 1)
+                    # Replace rather than mutate: the old row may be shared with snapshot readers
+                    rows[index] = merged
+                    result["version"] = current + 1
+                    result["row"] = dict(merged)
+                    changed.append((row, merged, result))
+                if atomic and any(r["status"] not in ("updated", "unchanged") for r in results):
+                    for old, _, result in changed:
+                        result.update(status="skipped", version=row_version(old, self.version_field), row=dict(old))
+                    return results
+                if changed:
+                    fieldnames = self._fieldnames(fieldnames, header)
+                    self._write_rows(rows, fieldnames, extrasaction='ignore')
+                    committed = self._publish_snapshot(fieldnames, rows)
+                    self._notify(ChangeEvent("update_many", committed, before, self.file_stat(),
+                                             updated=[(dict(old), dict(new)) for old, new, _ in changed]))
+                return results
+        finally:
+            self._release_file_lock()
+
+    def merge(self, keep_key, drop_key, changes, expected_versions=(None, None), fieldnames=None):
+        """Fold the row ``drop_key`` into ``keep_key`` in one write: apply ``changes`` to the kept row, delete the other.
+
+        ``expected_versions`` are checked like ``update`` (VersionConflictError
+        names the first row that moved); KeyError if either row is missing.
+        Returns the kept row.
+        """
+        self._locked("merge")
+        try:
+            with self.lock:
+                before = self.file_stat()
+                header, rows = self._read_rows()
+                positions = {}
+                for i, row in enumerate(rows):
+                    positions.setdefault(row.get(self.key_field), i)
+                for key, expected in zip((keep_key, drop_key), expected_versions):
+                    if key not in positions:
+                        raise KeyError(key)
+                    row = rows[positions[key]]
+                    if expected is not None and int(expected) != row_version(row, self.version_field):
+                        CSV_VERSION_CONFLICTS.inc(store=self.store_name)
+                        raise VersionConflictError(key, expected, dict(row))
+                keep_index, drop_index = positions[keep_key], positions[drop_key]
+                old, removed = rows[keep_index], rows[drop_index]
+                kept = old.copy()
+                kept.update(changes)
+                kept[self.version_field] = str(row_version(old, self.version_field) + 1)
+                rows[keep_index] = kept
+                del rows[drop_index]
+                fieldnames = self._fieldnames(fieldnames, header)
+                self._write_rows(rows, fieldnames, extrasaction='ignore')
+                committed = self._publish_snapshot(fieldnames, rows)
+                self._notify(ChangeEvent("merge", committed, before, self.file_stat(),
+                                         old=dict(old), new=dict(kept), removed=[dict(removed)]))
+                return dict(kept)
+        finally:
+            self._release_file_lock()
+
+    def append(self, records, fieldnames=None, unique_by=None):
+        """Append records under the write lock and return those actually added.
+
+        ``unique_by(row)`` returns a key that must not already exist in the
+        file (or earlier in ``records``); colliding records are skipped.
+        New rows start at version 1.
+        """
+        self._locked("append")
+        try:
+            with self.lock:
+                before = self.file_stat()
+                header, rows = self._read_rows()
+                seen = {unique_by(r) for r in rows} if unique_by else set()
+                added = []
+                for record in records:
+                    if unique_by:
+                        value = unique_by(record)
+                        if value in seen:
+                            continue
+                        seen.add(value)
+                    record = dict(record)
+                    record[self.version_field] = "1"
+                    added.append(record)
+                if added:
+                    fieldnames = self._fieldnames(fieldnames or header or list(added[0]), header)
+                    self._write_rows(rows + added, fieldnames, extrasaction='ignore')
+                    committed = self._publish_snapshot(fieldnames, rows + added)
+                    self._notify(ChangeEvent("append", committed, before, self.file_stat(), added=added))
+                return added
         finally:
             self._release_file_lock()
+
+    def install(self, source_path, expected_stat):
+        """Atomically replace the file with ``source_path`` (same directory) under the write lock.
+
+        For offline tools that stream a rewritten copy without holding the
+        lock: the swap only happens if the file signature still equals
+        ``expected_stat``, i.e. nothing was written since the tool started
+        reading. Returns False (and leaves both files alone) otherwise.
+        Listeners get a "replace" event, as for ``write_all``.
+        """
+        self._locked("install")
+        try:
+            with self.lock:
+                if self.file_stat() != expected_stat:
+                    return False
+                previous = self._read_rows()[1] if self._listeners else ()
+                self.create_backup()
+                os.replace(source_path, self.file_path)
+                # Next read parses the installed file
+                self._snapshot = None
+                if self._listeners:
+                    self._notify(ChangeEvent("replace", self._read_rows()[1], expected_stat, self.file_stat(),
+                                             previous=previous))
+                return True
+        finally:
+            self._release_file_lock()
+
+    def _fieldnames(self, fieldnames, header):
+        fieldnames = list(fieldnames or header)
+        if self.version_field not in fieldnames:
+            fieldnames.append(self.version_field)
+        return fieldnames
     
     def create_backup(self, custom_name=None):
         """Create a timestamped backup of the CSV file"""
@@ -104,7 +555,7 @@ class CSVDatabase:
             backup_name = custom_name or f"backup_{timestamp}.csv"
             backup_path = os.path.join(self.backup_dir, backup_name)
             
-            with self.lock:
+            with self.lock, CSV_BACKUP_SECONDS.time(store=self.store_name):
                 shutil.copy2(self.file_path, backup_path)
                 
             logger.info(f"Created backup: {backup_path}")
@@ -0,0 +1,157 @@
+import csv
+import json
+import mmap
+import os
+import time
+import logging
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CSV_INDEX_BUILD_SECONDS = metrics.histogram("csv_index_build_seconds", "Time spent scanning the CSV file to build the row-offset index", ("store",))
+CSV_INDEX_LOOKUPS = metrics.counter("csv_index_lookups_total", "Point lookups served from the row-offset index", ("store", "source"))
+
+INDEX_FORMAT = 1
+_BOM = b"\xef\xbb\xbf"
+
+
+class RowOffsetIndex:
+    """Byte offsets of CSV records keyed by selected columns, persisted next to the file.
+
+    ``fields`` maps a column name to an optional normalizer (e.g. phone
+    digits only). Lookups memory-map the file, seek to the stored offset and
+    parse that one record. The index (in memory and in the ``<file>.idx``
+    sidecar) carries the signature of the file it was built from: inode,
+    size and mtime. Any rewrite changes it, and the next lookup rebuilds
+    with one scan that also refreshes the sidecar, so cold workers and CLI
+    tools reuse a single scan between writes.
+    """
+
+    def __init__(self, file_path: str, fields: dict, store_name: str = None):
+        self.file_path = file_path
+        self.sidecar_path = f"{file_path}.idx"
+        self.fields = dict(fields)
+        self.store_name = store_name or os.path.basename(file_path)
+        # (stat, header, offsets) swapped as one tuple so concurrent lookups see a consistent index
+        self._state = (None, [], {})
+
+    def _normalize(self, field, value):
+        normalizer = self.fields[field]
+        value = value or ""
+        return normalizer(value) if normalizer else value
+
+    # --- building -------------------------------------------------------
+    def _scan(self, mm):
+        """Parse every record once, recording where each starts. First occurrence wins."""
+        offsets = {field: {} for field in self.fields}
+        start = len(_BOM) if mm[:len(_BOM)] == _BOM else 0
+        mm.seek(start)
+        # csv.reader pulls lines only as needed, so mm.tell() before each
+        # record is its first byte even for quoted fields spanning lines
+        reader = csv.reader(_lines(mm))
+        header = next(reader, [])
+        columns = [(header.index(field), self.fields[field], offsets[field]) for field in self.fields if field in header]
+        tell = mm.tell
+        offset = tell()
+        for values in reader:
+            for col, normalizer, keys in columns:
+                if col < len(values):
+                    key = values[col]
+                    if normalizer and key:
+                        key = normalizer(key)
+                    if key and key not in keys:
+                        keys[key] = offset
+            offset = tell()
+        return header, offsets
+
+    def _build(self, mm, stat):
+        started = time.perf_counter()
+        with CSV_INDEX_BUILD_SECONDS.time(store=self.store_name):
+            header, offsets = self._scan(mm)
+        self._state = (stat, header, offsets)
+        logger.debug(f"Built row index for {self.store_name}: {sum(len(o) for o in offsets.values())} keys "
+                    f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+        self._save(stat, header, offsets)
+        return self._state
+
+    def _save(self, stat, header, offsets):
+        temp = f"{self.sidecar_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp, "w", encoding="utf-8") as f:
+                json.dump({
+                    "format": INDEX_FORMAT,
+                    "stat": list(stat),
+                    "header": header,
+                    "fields": sorted(self.fields),
+                    "offsets": offsets,
+                }, f, separators=(",", ":"))
+            os.replace(temp, self.sidecar_path)
+        except OSError as e:
+            # The sidecar is only an accelerator; lookups keep working from memory
+            logger.warning(f"Could not persist row index {self.sidecar_path}: {e}")
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+
+    def _load(self, stat):
+        """Adopt the sidecar if it was built from exactly this file version."""
+        try:
+            with open(self.sidecar_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (data.get("format") != INDEX_FORMAT or tuple(data.get("stat") or ()) != stat
+                or data.get("fields") != sorted(self.fields)):
+            return None
+        self._state = (stat, data["header"], data["offsets"])
+        return self._state
+
+    # --- lookups --------------------------------------------------------
+    def _read_record(self, mm, offset):
+        mm.seek(offset)
+        return next(csv.reader(_lines(mm)), None)
+
+    def lookup(self, field: str, value: str):
+        """Return ``(header, values)`` of the first record whose ``field`` matches, or None."""
+        key = self._normalize(field, value)
+        if not key:
+            return None
+        try:
+            f = open(self.file_path, "rb")
+        except FileNotFoundError:
+            return None
+        with f:
+            st = os.fstat(f.fileno())
+            if st.st_size == 0:
+                return None
+            # Signature of the open file: a concurrent os.replace cannot change what we map
+            stat = (st.st_ino, st.st_size, st.st_mtime_ns)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                state, source = self._state, "memory"
+                if state[0] != stat:
+                    state, source = self._load(stat), "sidecar"
+                    if state is None:
+                        state, source = self._build(mm, stat), "scan"
+                CSV_INDEX_LOOKUPS.inc(store=self.store_name, source=source)
+                _, header, offsets = state
+                offset = offsets.get(field, {}).get(key)
+                if offset is None or field not in header:
+                    return None
+                values = self._read_record(mm, offset)
+                col = header.index(field)
+                if values is None or col >= len(values) or self._normalize(field, values[col]) != key:
+                    # Should not happen for a matching signature; never trust a bad offset
+                    logger.warning(f"Row index for {self.store_name} is inconsistent; rebuilding")
+                    _, header, offsets = self._build(mm, stat)
+                    offset = offsets.get(field, {}).get(key)
+                    if offset is None:
+                        return None
+                    values = self._read_record(mm, offset)
+                return header, values
+
+
+def _lines(mm):
+    """Lazily decoded lines from the current position; safe because UTF-8 never embeds a newline byte."""
+    return map(bytes.decode, iter(mm.readline, b""))
@@ -0,0 +1,273 @@
+"""Fuzzy duplicate-guest detection with blocking keys.
+
+Import-light like ``guests.py``: pure functions over row dicts plus a small
+cached review store, usable from scripts as well as the admin pages.
+
+Comparing every pair of N guests is O(N²) (50 million pairs at 10k guests),
+so each row is first given a few *blocking keys*: its normalized email, a
+phonetic key of its name, and (rarest institution token, sound of one name
+word, initial of another) triples, which still pair "R. Kumar" with
+"Ramesh Kumar" at the same place.
+Only rows sharing a key are scored. Blocks larger than ``max_block`` are
+too unspecific to be useful and are skipped (and counted) rather than
+compared exhaustively.
+"""
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from difflib import SequenceMatcher
+from itertools import combinations
+import logging
+
+from app.services import file_lock
+
+logger = logging.getLogger(__name__)
+
+NAME_TITLES = {"dr", "prof", "mr", "mrs", "ms", "miss", "shri", "sri", "smt", "sir", "md"}
+INSTITUTION_STOPWORDS = {
+    "of", "the", "and", "for", "in", "at", "de", "la",
+    "institute", "institution", "college", "university", "hospital", "medical", "sciences", "science",
+    "centre", "center", "research", "dept", "department", "school", "govt", "government", "national",
+}
+_SOUNDEX_CODES = {c: str(d) for d, letters in enumerate(("aeiouyhw", "bfpv", "cgjkqsxz", "dt", "l", "mn", "r")) for c in letters}
+_WORD = re.compile(r"[a-z0-9]+")
+
+DEFAULT_MIN_SCORE = 0.6
+DEFAULT_MAX_BLOCK = 100
+
+
+# --- normalization ------------------------------------------------------
+def _ascii_lower(value: str) -> str:
+    return unicodedata.normalize("NFKD", value or "").encode("ascii", "ignore").decode("ascii").lower()
+
+
+def normalize_email(email: str) -> str:
+    """Lowercase, without a ``+tag``; Gmail addresses also without dots in the local part"""
+    local, _, domain = (email or "").strip().lower().rpartition("@")
+    if not local or not domain:
+        return ""
+    local = local.split("+", 1)[0]
+    if domain in ("gmail.com", "googlemail.com"):
+        local, domain = local.replace(".", ""), "gmail.com"
+    return f"{local}@{domain}"
+
+
+def name_tokens(name: str) -> list:
+    """Words of a name without titles and single-letter initials"""
+    return [t for t in _WORD.findall(_ascii_lower(name)) if len(t) > 1 and t not in NAME_TITLES]
+
+
+def name_initials(name: str) -> set:
+    """First letters of every word of a name (titles excluded), initials included"""
+    return {t[0] for t in _WORD.findall(_ascii_lower(name)) if t not in NAME_TITLES}
+
+
+def soundex(word: str) -> str:
+    """American Soundex: ``Mohammed`` and ``Muhammad`` both give ``M530``"""
+    word = "".join(c for c in word.lower() if c.isalpha())
+    if not word:
+        return ""
+    code, last = word[0].upper(), _SOUNDEX_CODES.get(word[0], "")
+    for c in word[1:]:
+        digit = _SOUNDEX_CODES.get(c, "")
+        if digit and digit != "0" and digit != last:
+            code += digit
+            if len(code) == 4:
+                break
+        if c not in "hw":
+            last = digit
+    return code.ljust(4, "0")
+
+
+def phonetic_key(name: str) -> str:
+    """Order-independent sound of a full name (``Kumar Ramesh`` == ``Ramesh Kumaar``)"""
+    return " ".join(sorted({soundex(t) for t in name_tokens(name)}))
+
+
+def institution_tokens(institution: str) -> set:
+    return {t for t in _WORD.findall(_ascii_lower(institution)) if len(t) > 2 and t not in INSTITUTION_STOPWORDS}
+
+
+def _phone_tail(phone: str) -> str:
+    digits = re.sub(r"\D", "", phone or "")
+    return digits[-10:] if len(digits) >= 7 else ""
+
+
+class _Features:
+    """Per-row values computed once, so scoring a pair does no normalization"""
+
+    __slots__ = ("row", "email", "name", "chars", "words", "initials", "institution", "phone")
+
+    def __init__(self, row):
+        self.row = row
+        self.email = normalize_email(row.get('Email', ''))
+        tokens = name_tokens(row.get('Name', ''))
+        self.name = " ".join(sorted(tokens))
+        self.chars = Counter(self.name)
+        self.words = [(soundex(t), t[0]) for t in tokens]
+        self.initials = name_initials(row.get('Name', ''))
+        self.institution = institution_tokens(row.get('Institution', ''))
+        self.phone = _phone_tail(row.get('Phone', ''))
+
+    def blocking_keys(self, institution_token: str = None):
+        if self.email:
+            yield f"e:{self.email}"
+        if self.words:
+            yield f"n:{' '.join(sorted({sound for sound, _ in self.words}))}"
+        if institution_token:
+            for sound, first in self.words:
+                for initial in self.initials - {first} or {""}:
+                    yield f"i:{institution_token}:{sound}:{initial}"
+
+
+# --- scoring ------------------------------------------------------------
+EMAIL_WEIGHT, NAME_WEIGHT, INSTITUTION_WEIGHT, PHONE_WEIGHT = 0.35, 0.45, 0.2, 0.3
+
+
+def score_pair(a: _Features, b: _Features, floor: float = 0.0):
+    """``(score in [0, 1], reasons)`` for two rows; None as soon as the score cannot reach ``floor``"""
+    reasons = []
+    score = 0.0
+    if a.email and a.email == b.email:
+        score += EMAIL_WEIGHT
+        reasons.append("same email")
+    if a.phone and a.phone == b.phone:
+        score += PHONE_WEIGHT
+        reasons.append("same phone")
+    overlap = 0.0
+    if a.institution and b.institution:
+        overlap = len(a.institution & b.institution) / len(a.institution | b.institution)
+        score += INSTITUTION_WEIGHT * overlap
+    # Most candidates end here, before any string matching
+    if score + NAME_WEIGHT < floor:
+        return None
+    if a.name and b.name:
+        if a.name == b.name:
+            similarity = 1.0
+        else:
+            # Shared characters bound ratio() from above (difflib's quick_ratio) without building a matcher
+            total = len(a.name) + len(b.name)
+            needed = (floor - score) / NAME_WEIGHT * total / 2
+            if min(len(a.name), len(b.name)) < needed or sum((a.chars & b.chars).values()) < needed:
+                return None
+            similarity = SequenceMatcher(None, a.name, b.name, autojunk=False).ratio()
+        score += NAME_WEIGHT * similarity
+        if similarity >= 0.75:
+            reasons.append("same name" if similarity == 1.0 else f"similar name ({similarity:.0%})")
+    if overlap:
+        reasons.append("same institution" if overlap == 1.0 else f"institution overlap ({overlap:.0%})")
+    if score < floor:
+        return None
+    return min(score, 1.0), reasons
+
+
+def find_duplicates(rows, min_score: float = DEFAULT_MIN_SCORE, max_block: int = DEFAULT_MAX_BLOCK,
+                    key_field: str = 'ID', exclude=frozenset()) -> dict:
+    """Candidate duplicate pairs among ``rows``, best first.
+
+    ``exclude`` holds ``(id, id)`` pairs (sorted) already reviewed as
+    distinct people. Returns ``{"pairs": [{"a", "b", "score", "reasons"}],
+    "compared", "skipped_blocks", "seconds"}``.
+    """
+    started = time.perf_counter()
+    features = [_Features(row) for row in rows]
+    # A common token ("delhi", "regional") would make huge blocks; the rarest one is the most telling
+    frequency = Counter(token for f in features for token in f.institution)
+    blocks = {}
+    for index, f in enumerate(features):
+        rarest = min(f.institution, key=lambda t: (frequency[t], t)) if f.institution else None
+        for key in f.blocking_keys(rarest):
+            blocks.setdefault(key, []).append(index)
+    candidates = set()
+    skipped = 0
+    for members in blocks.values():
+        if len(members) < 2:
+            continue
+        if len(members) > max_block:
+            skipped += 1
+            continue
+        candidates.update(combinations(members, 2))
+    pairs = []
+    for i, j in candidates:
+        a, b = features[i], features[j]
+        ids = tuple(sorted((a.row.get(key_field, ''), b.row.get(key_field, ''))))
+        if ids in exclude or ids[0] == ids[1]:
+            continue
+        scored = score_pair(a, b, min_score)
+        if scored is not None:
+            pairs.append({"a": a.row, "b": b.row, "score": round(scored[0], 3), "reasons": scored[1]})
+    pairs.sort(key=lambda p: (-p["score"], p["a"].get(key_field, ''), p["b"].get(key_field, '')))
+    return {"pairs": pairs, "compared": len(candidates), "skipped_blocks": skipped,
+            "seconds": time.perf_counter() - started}
+
+
+def merge_changes(keep: dict, drop: dict, fields) -> dict:
+    """Fields of ``keep`` that are empty and can be filled from ``drop``"""
+    return {f: drop[f] for f in fields if not (keep.get(f) or '').strip() and (drop.get(f) or '').strip()}
+
+
+class DuplicateReview:
+    """Cached detection results for a CSVDatabase plus the pairs dismissed by admins.
+
+    Results are recomputed only when the guest file or the dismissed list
+    changed, so reopening the review page is free after the first scan.
+    """
+
+    def __init__(self, db, dismissed_path: str, min_score: float = DEFAULT_MIN_SCORE, max_block: int = DEFAULT_MAX_BLOCK):
+        self.db = db
+        self.dismissed_path = dismissed_path
+        self.min_score = min_score
+        self.max_block = max_block
+        self._lock = threading.Lock()
+        self._cached = None  # (file stat, dismissed count, result)
+
+    def _dismissed(self) -> set:
+        try:
+            with open(self.dismissed_path, encoding="utf-8") as f:
+                return {tuple(pair) for pair in json.load(f)}
+        except FileNotFoundError:
+            return set()
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read dismissed duplicates: {e}")
+            return set()
+
+    def dismiss(self, a: str, b: str):
+        """Remember the pair; raises TimeoutError if another worker holds the list's lock too long.
+
+        The read-modify-write runs under a lock file shared by all workers,
+        so concurrent dismissals from different processes are all kept.
+        """
+        os.makedirs(os.path.dirname(self.dismissed_path) or ".", exist_ok=True)
+        lock_path = f"{self.dismissed_path}.lock"
+        with self._lock:
+            token = file_lock.acquire(lock_path, timeout=3.0, poll=0.02, stale_seconds=30.0)
+            if token is None:
+                raise TimeoutError("Dismissed duplicates list is busy. Please try again.")
+            try:
+                dismissed = self._dismissed()
+                dismissed.add(tuple(sorted((a, b))))
+                temp = f"{self.dismissed_path}.{os.getpid()}.tmp"
+                with open(temp, "w", encoding="utf-8") as f:
+                    json.dump(sorted(dismissed), f)
+                os.replace(temp, self.dismissed_path)
+            finally:
+                file_lock.release(lock_path, token)
+
+    def candidates(self) -> dict:
+        with self._lock:
+            stat = self.db.file_stat()
+            dismissed = self._dismissed()
+            cached = self._cached
+            if cached is not None and cached[0] == stat and cached[1] == len(dismissed):
+                return cached[2]
+            rows = self.db.read_all()
+            result = find_duplicates(rows, self.min_score, self.max_block, self.db.key_field, dismissed)
+            result["rows"] = len(rows)
+            self._cached = (stat, len(dismissed), result)
+            logger.info(f"Duplicate scan: {len(rows)} guests, {result['compared']} pairs compared, "
+                        f"{len(result['pairs'])} candidates in {result['seconds'] * 1000:.0f} ms")
+            return result
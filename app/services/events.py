@@ -0,0 +1,169 @@
+"""Events of a multi-event deployment and their lazily loaded service containers.
+
+Each event is a directory below ``[EVENTS] Root`` named after its slug,
+holding its guest store, backups, settings, uploads, history and check-in
+log. An optional ``event.ini`` adds::
+
+    [EVENT]
+    Hosts = conf2027.example.org, www.conf2027.example.org
+    AdminPassword = ...
+
+The configured paths (``[DATABASE] CSVPath`` etc.) remain the default
+event, always loaded. Other events are loaded on their first request and
+dropped again when idle or when more than ``max_loaded`` are in memory, so
+memory follows the number of *active* events, not the number on disk.
+"""
+import configparser
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import logging
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+EVENTS_LOADED = metrics.gauge("events_loaded", "Event service containers held in memory (besides the default event)")
+EVENT_LOADS = metrics.counter("event_loads_total", "Event service containers built on demand")
+EVENT_EVICTIONS = metrics.counter("event_evictions_total", "Event service containers dropped", ("reason",))
+EVENT_LOAD_SECONDS = metrics.histogram("event_load_seconds", "Time to build an event's service container")
+
+SLUG_RE = re.compile(r"^[a-z0-9][a-z0-9-]{0,62}$")
+
+
+class EventSpec:
+    """Where one event's data lives and how requests find it"""
+
+    __slots__ = ("slug", "root", "hosts", "admin_password")
+
+    def __init__(self, slug: str, root: str, hosts=(), admin_password: str = ""):
+        self.slug = slug
+        self.root = root
+        self.hosts = tuple(hosts)
+        self.admin_password = admin_password
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+
+def _normalize_host(host: str) -> str:
+    host = (host or "").strip().lower()
+    if host.startswith("["):  # IPv6 literal
+        return host.partition("]")[0] + "]"
+    return host.partition(":")[0]
+
+
+def scan_events(root: str) -> dict:
+    """``{slug: EventSpec}`` for every event directory below ``root``"""
+    events = {}
+    if not os.path.isdir(root):
+        return events
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if not SLUG_RE.match(name) or not os.path.isdir(path):
+            continue
+        parser = configparser.ConfigParser()
+        try:
+            parser.read(os.path.join(path, "event.ini"))
+        except configparser.Error as e:
+            logger.error(f"Ignoring unreadable event.ini of event {name}: {e}")
+        hosts = [_normalize_host(h) for h in parser.get("EVENT", "Hosts", fallback="").split(",") if h.strip()]
+        events[name] = EventSpec(name, path, hosts, parser.get("EVENT", "AdminPassword", fallback=""))
+    return events
+
+
+class EventRegistry:
+    """Resolves requests to events and holds the loaded events' services.
+
+    ``build(spec, auth)`` creates an event's ``Services``. Sessions are kept
+    apart from the rest of an event (``auth`` is handed back on reload), so
+    evicting an idle event frees its guest rows and caches without logging
+    anyone out. Idle events are swept at most every ``sweep_seconds``, on
+    the request path; there is no background thread.
+    """
+
+    def __init__(self, root: str, build, default_slug: str = "main", idle_seconds: float = 1800,
+                 max_loaded: int = 16, sweep_seconds: float = 60, rescan_seconds: float = 10, path_prefix: str = "/e"):
+        self.root = root
+        self.default_slug = default_slug
+        self.path_prefix = path_prefix.rstrip("/")
+        self.idle_seconds = idle_seconds
+        self.max_loaded = max(1, max_loaded)
+        self.sweep_seconds = sweep_seconds
+        self.rescan_seconds = rescan_seconds
+        self._build = build
+        self._lock = threading.Lock()
+        self._loaded = OrderedDict()  # slug -> [services, last used], least recently used first
+        self._auth = {}
+        self._swept_at = time.monotonic()
+        self._scanned_at = 0.0
+        self._events, self._hosts = {}, {}
+        self.rescan()
+        EVENTS_LOADED.set_function(lambda: len(self._loaded))
+
+    def rescan(self):
+        """Pick up events created or removed on disk"""
+        events = scan_events(self.root)
+        hosts = {host: spec.slug for spec in events.values() for host in spec.hosts}
+        with self._lock:
+            self._events, self._hosts = events, hosts
+            self._scanned_at = time.monotonic()
+        logger.info(f"Events: {len(events)} found in {self.root}")
+
+    def for_host(self, host: str):
+        """Slug of the event served on ``host``, or None"""
+        return self._hosts.get(_normalize_host(host))
+
+    def exists(self, slug: str) -> bool:
+        if slug in self._events:
+            return True
+        # A new event directory is found without a restart, but unknown slugs cannot force a scan per request
+        if SLUG_RE.match(slug or "") and time.monotonic() - self._scanned_at > self.rescan_seconds:
+            self.rescan()
+        return slug in self._events
+
+    def sessions(self) -> list:
+        """Session stores of every event seen so far (for the active-sessions gauge)"""
+        return list(self._auth.values())
+
+    def get(self, slug: str):
+        """The event's services, built on first use; None for an unknown event"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._swept_at >= self.sweep_seconds:
+                self._sweep(now)
+            entry = self._loaded.get(slug)
+            if entry is not None:
+                entry[1] = now
+                self._loaded.move_to_end(slug)
+                return entry[0]
+            spec = self._events.get(slug)
+            if spec is None:
+                return None
+            start = time.perf_counter()
+            services = self._build(spec, self._auth.get(slug))
+            EVENT_LOAD_SECONDS.observe(time.perf_counter() - start)
+            EVENT_LOADS.inc()
+            self._auth[slug] = services.auth
+            self._loaded[slug] = [services, now]
+            while len(self._loaded) > self.max_loaded:
+                evicted, _ = self._loaded.popitem(last=False)
+                EVENT_EVICTIONS.inc(reason="capacity")
+                logger.info(f"Event {evicted} unloaded: more than {self.max_loaded} events loaded")
+            logger.info(f"Event {slug} loaded in {(time.perf_counter() - start) * 1000:.1f} ms")
+            return services
+
+    def _sweep(self, now: float):
+        """Drop events without requests for ``idle_seconds``; caller holds the lock."""
+        self._swept_at = now
+        for slug, (_, last_used) in list(self._loaded.items()):
+            if now - last_used >= self.idle_seconds:
+                del self._loaded[slug]
+                EVENT_EVICTIONS.inc(reason="idle")
+                logger.info(f"Event {slug} unloaded after {now - last_used:.0f} s idle")
+
+    def loaded(self) -> list:
+        with self._lock:
+            return list(self._loaded)
@@ -0,0 +1,345 @@
+"""ZIP exports of guests' uploaded files, streamed without building the archive.
+
+Creating an export job fixes the file list and the archive layout: every
+entry's offset and compressed size, and so the archive's total length. The
+archive itself is generated on each download, straight from the upload
+directories, with memory independent of its size. Because the layout is
+fixed, a download that breaks off can continue with an HTTP ``Range``
+request: entries before the offset are skipped without being read.
+
+Already-compressed formats (slides, PDFs, images, video, archives) are
+stored as they are; everything else is deflated. Entries carry a data
+descriptor, and ZIP64 records are added only when sizes or offsets need them.
+"""
+import json
+import os
+import re
+import secrets
+import struct
+import time
+import zlib
+from datetime import datetime
+import logging
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BYTES = metrics.counter("export_bytes_total", "ZIP export bytes sent")
+EXPORT_JOBS = metrics.counter("export_jobs_total", "ZIP export jobs created")
+
+JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+BLOCK = 1024 * 1024
+ZIP64_LIMIT = 0xFFFFFFFF
+DEFLATE_LEVEL = 6
+
+# Compressing these again costs CPU and saves (almost) nothing
+STORED_EXTENSIONS = {
+    ".pptx", ".ppsx", ".docx", ".xlsx", ".odp", ".odt", ".ods", ".key", ".pdf",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".avif",
+    ".mp4", ".m4v", ".mov", ".avi", ".mkv", ".webm", ".mp3", ".m4a", ".aac", ".ogg",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar",
+}
+
+STORED, DEFLATED = 0, 8
+FLAGS = 0x0808  # sizes in a data descriptor; UTF-8 names
+
+
+class ExportChanged(Exception):
+    """A file of the export changed after the job was created"""
+
+
+def _safe_part(value: str, limit: int = 60) -> str:
+    cleaned = re.sub(r"[^\w.-]+", "_", value or "", flags=re.UNICODE).strip("._")
+    return cleaned[:limit] or "guest"
+
+
+def _dos_time(mtime_ns: int):
+    t = time.localtime(max(mtime_ns // 1_000_000_000, 315532800))  # ZIP dates start in 1980
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+def _deflate_file(path: str):
+    """(crc, compressed size) of the file as the export deflates it"""
+    crc, size = 0, 0
+    compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -15)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(BLOCK), b""):
+            crc = zlib.crc32(block, crc)
+            size += len(compressor.compress(block))
+    return crc, size + len(compressor.flush())
+
+
+def _crc_file(path: str) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(BLOCK), b""):
+            crc = zlib.crc32(block, crc)
+    return crc
+
+
+# --- ZIP records ----------------------------------------------------------
+def _local_header(entry: dict) -> bytes:
+    name = entry["name"].encode("utf-8")
+    zip64 = entry["size"] >= ZIP64_LIMIT
+    extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0) if zip64 else b""
+    mod_time, mod_date = _dos_time(entry["mtime_ns"])
+    return struct.pack(
+        "<IHHHHHIIIHH", 0x04034B50, 45 if zip64 else 20, FLAGS, entry["method"], mod_time, mod_date,
+        0, ZIP64_LIMIT if zip64 else 0, ZIP64_LIMIT if zip64 else 0, len(name), len(extra),
+    ) + name + extra
+
+
+def _descriptor(entry: dict, crc: int) -> bytes:
+    if entry["size"] >= ZIP64_LIMIT:
+        return struct.pack("<IIQQ", 0x08074B50, crc, entry["csize"], entry["size"])
+    return struct.pack("<IIII", 0x08074B50, crc, entry["csize"], entry["size"])
+
+
+def _descriptor_length(entry: dict) -> int:
+    return 24 if entry["size"] >= ZIP64_LIMIT else 16
+
+
+def _central_header(entry: dict, crc: int) -> bytes:
+    name = entry["name"].encode("utf-8")
+    zip64_fields = [v for v in (entry["size"], entry["csize"], entry["offset"]) if v >= ZIP64_LIMIT]
+    extra = struct.pack(f"<HH{len(zip64_fields)}Q", 0x0001, 8 * len(zip64_fields), *zip64_fields) if zip64_fields else b""
+    version = 45 if zip64_fields else 20
+    mod_time, mod_date = _dos_time(entry["mtime_ns"])
+    return struct.pack(
+        "<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | version, version, FLAGS, entry["method"], mod_time, mod_date,
+        crc, min(entry["csize"], ZIP64_LIMIT), min(entry["size"], ZIP64_LIMIT),
+        len(name), len(extra), 0, 0, 0, 0o100644 << 16, min(entry["offset"], ZIP64_LIMIT),
+    ) + name + extra
+
+
+def _central_header_length(entry: dict) -> int:
+    overflowing = sum(1 for v in (entry["size"], entry["csize"], entry["offset"]) if v >= ZIP64_LIMIT)
+    return 46 + len(entry["name"].encode("utf-8")) + (4 + 8 * overflowing if overflowing else 0)
+
+
+def _end_records(count: int, cd_offset: int, cd_size: int) -> bytes:
+    records = b""
+    if count >= 0xFFFF or cd_offset >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT:
+        zip64_end = cd_offset + cd_size
+        records += struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, cd_size, cd_offset)
+        records += struct.pack("<IIQI", 0x07064B50, 0, zip64_end, 1)
+        count, cd_offset, cd_size = min(count, 0xFFFF), min(cd_offset, ZIP64_LIMIT), min(cd_size, ZIP64_LIMIT)
+    return records + struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, count, count, cd_size, cd_offset, 0)
+
+
+def _end_records_length(count: int, cd_offset: int, cd_size: int) -> int:
+    return len(_end_records(count, cd_offset, cd_size))
+
+
+class FileExports:
+    """Export jobs of one event, kept as JSON files in ``job_dir``.
+
+    A job lists ``(guest, file)`` entries with their stat at creation; a
+    download fails with ``ExportChanged`` if one was replaced since, as the
+    bytes would no longer match the promised layout. CRCs of stored entries
+    are only known once read, so they are appended to ``<job>.crc`` as a
+    download passes them, for a resumed download that starts past them.
+    """
+
+    def __init__(self, job_dir: str, upload_root: str, expire_seconds: float = 86400, sweep_seconds: float = 600):
+        self.job_dir = job_dir
+        self.upload_root = upload_root
+        self.expire_seconds = expire_seconds
+        self.sweep_seconds = sweep_seconds
+        self._swept_at = 0.0
+        os.makedirs(job_dir, exist_ok=True)
+
+    def _job_path(self, job_id: str, suffix: str = ".json") -> str:
+        return os.path.join(self.job_dir, f"{job_id}{suffix}")
+
+    def create(self, guests, filters: dict = None, extensions=None) -> dict:
+        """Fix the files of ``guests`` (``(id, name)`` pairs) and the archive layout.
+
+        ``extensions`` (e.g. ``{".pdf"}``) limits the files exported.
+        """
+        self._sweep()
+        started = time.perf_counter()
+        entries, offset = [], 0
+        for guest_id, name in guests:
+            folder = f"{_safe_part(guest_id, 40)}_{_safe_part(name)}"
+            try:
+                with os.scandir(os.path.join(self.upload_root, guest_id)) as it:
+                    files = sorted((f for f in it if f.is_file() and not f.name.endswith(".part")), key=lambda f: f.name)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            for f in files:
+                ext = os.path.splitext(f.name)[1].lower()
+                if extensions and ext not in extensions:
+                    continue
+                st = f.stat()
+                entry = {
+                    "name": f"{folder}/{f.name}", "path": os.path.join(guest_id, f.name),
+                    "size": st.st_size, "mtime_ns": st.st_mtime_ns, "method": STORED, "csize": st.st_size, "crc": None,
+                }
+                if ext not in STORED_EXTENSIONS and st.st_size:
+                    crc, csize = _deflate_file(f.path)
+                    # Keep the deflated form only when it is smaller
+                    entry["crc"] = crc
+                    if csize < st.st_size:
+                        entry["method"], entry["csize"] = DEFLATED, csize
+                elif not st.st_size:
+                    entry["crc"] = 0
+                entry["offset"] = offset
+                offset += len(_local_header(entry)) + entry["csize"] + _descriptor_length(entry)
+                entries.append(entry)
+        cd_size = sum(_central_header_length(e) for e in entries)
+        job = {
+            "id": secrets.token_hex(16),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "filters": filters or {},
+            "files": len(entries),
+            "guests": len({e["name"].split("/", 1)[0] for e in entries}),
+            "cd_offset": offset,
+            "cd_size": cd_size,
+            "total": offset + cd_size + _end_records_length(len(entries), offset, cd_size),
+            "entries": entries,
+        }
+        temp = self._job_path(job["id"], ".json.tmp")
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(job, f)
+        os.replace(temp, self._job_path(job["id"]))
+        EXPORT_JOBS.inc()
+        logger.info(f"Export {job['id']}: {job['files']} files of {job['guests']} guests, "
+                    f"{job['total']} bytes, prepared in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return job
+
+    def get(self, job_id: str):
+        if not JOB_ID_RE.match(job_id or ""):
+            return None
+        try:
+            with open(self._job_path(job_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def changed(self, job: dict) -> list:
+        """Names of entries whose file is gone or differs from the job"""
+        changed = []
+        for entry in job["entries"]:
+            try:
+                st = os.stat(os.path.join(self.upload_root, entry["path"]))
+            except FileNotFoundError:
+                changed.append(entry["name"])
+                continue
+            if st.st_size != entry["size"] or st.st_mtime_ns != entry["mtime_ns"]:
+                changed.append(entry["name"])
+        return changed
+
+    # --- streaming ------------------------------------------------------
+    def _known_crcs(self, job: dict) -> dict:
+        crcs = {i: e["crc"] for i, e in enumerate(job["entries"]) if e["crc"] is not None}
+        try:
+            with open(self._job_path(job["id"], ".crc"), encoding="utf-8") as f:
+                for line in f:
+                    index, _, crc = line.partition(" ")
+                    if crc.strip():
+                        crcs[int(index)] = int(crc)
+        except FileNotFoundError:
+            pass
+        return crcs
+
+    def _remember_crc(self, job: dict, index: int, crc: int):
+        fd = os.open(self._job_path(job["id"], ".crc"), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, f"{index} {crc}\n".encode("ascii"))
+        finally:
+            os.close(fd)
+
+    def _open(self, entry: dict):
+        f = open(os.path.join(self.upload_root, entry["path"]), "rb")
+        st = os.fstat(f.fileno())
+        if st.st_size != entry["size"] or st.st_mtime_ns != entry["mtime_ns"]:
+            f.close()
+            raise ExportChanged(entry["name"])
+        return f
+
+    def _entry_pieces(self, job: dict, index: int, entry: dict, data_start: int, skip: int, crcs: dict):
+        """``(offset, bytes)`` of an entry's data from about ``skip`` on, then its descriptor"""
+        with self._open(entry) as f:
+            position = data_start
+            if entry["method"] == DEFLATED:
+                # Deflated again from the start (same input, same output); only this one file is redone
+                compressor = zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -15)
+                for block in iter(lambda: f.read(BLOCK), b""):
+                    out = compressor.compress(block)
+                    if out:
+                        yield position, out
+                        position += len(out)
+                out = compressor.flush()
+                yield position, out
+                position += len(out)
+                crc = crcs[index]
+            else:
+                # Without a known CRC the skipped part is read as well (not sent) to compute it
+                computing = index not in crcs
+                crc = 0 if computing else crcs[index]
+                if not computing:
+                    position += min(skip, entry["size"])
+                    f.seek(position - data_start)
+                for block in iter(lambda: f.read(BLOCK), b""):
+                    if computing:
+                        crc = zlib.crc32(block, crc)
+                    yield position, block
+                    position += len(block)
+                if computing and position - data_start == entry["csize"]:
+                    crcs[index] = crc
+                    self._remember_crc(job, index, crc)
+            if position - data_start != entry["csize"]:
+                raise ExportChanged(entry["name"])
+        yield position, _descriptor(entry, crc)
+
+    def _pieces(self, job: dict, start: int):
+        """``(offset, bytes)`` covering the archive from ``start``; earlier entries are not read"""
+        crcs = self._known_crcs(job)
+        for index, entry in enumerate(job["entries"]):
+            header = _local_header(entry)
+            data_start = entry["offset"] + len(header)
+            if data_start + entry["csize"] + _descriptor_length(entry) <= start:
+                continue
+            yield entry["offset"], header
+            yield from self._entry_pieces(job, index, entry, data_start, max(0, start - data_start), crcs)
+        # The central directory needs every CRC; entries no download has passed yet are read for it
+        position, batch = job["cd_offset"], bytearray()
+        for index, entry in enumerate(job["entries"]):
+            if index not in crcs:
+                self._open(entry).close()
+                crcs[index] = _crc_file(os.path.join(self.upload_root, entry["path"]))
+                self._remember_crc(job, index, crcs[index])
+            batch += _central_header(entry, crcs[index])
+            if len(batch) >= BLOCK:
+                yield position, bytes(batch)
+                position += len(batch)
+                batch = bytearray()
+        yield position, bytes(batch) + _end_records(len(job["entries"]), job["cd_offset"], job["cd_size"])
+
+    def stream(self, job: dict, start: int = 0, end: int = None):
+        """Archive bytes ``start``..``end`` (inclusive), generated from the upload directories"""
+        end = job["total"] - 1 if end is None else min(end, job["total"] - 1)
+        for offset, data in self._pieces(job, start):
+            if offset > end:
+                return
+            chunk = data[max(0, start - offset):end - offset + 1]
+            if chunk:
+                EXPORT_BYTES.inc(len(chunk))
+                yield chunk
+            if offset + len(data) > end:
+                return
+
+    # --- housekeeping ---------------------------------------------------
+    def _sweep(self):
+        """Remove jobs older than ``expire_seconds``"""
+        now = time.monotonic()
+        if now - self._swept_at < self.sweep_seconds:
+            return
+        self._swept_at = now
+        cutoff = time.time() - self.expire_seconds
+        with os.scandir(self.job_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.stat().st_mtime < cutoff and JOB_ID_RE.match(entry.name.split(".")[0]):
+                    os.remove(entry.path)
@@ -0,0 +1,106 @@
+"""Lock files shared by worker processes.
+
+A lock is a file created with ``O_CREAT | O_EXCL`` that holds
+``<pid> <epoch seconds> <token>``. A holder that crashes or is killed
+cannot remove it, so a waiter takes the lock over once the recorded
+process no longer exists or the lock is older than ``stale_seconds``.
+Releasing removes the file only while it still holds the releaser's token.
+"""
+import os
+import secrets
+import time
+import logging
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+LOCK_TAKEOVERS = metrics.counter("lock_file_takeovers_total", "Lock files taken over from a dead or stuck holder", ("lock",))
+
+
+def _read(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except (FileNotFoundError, UnicodeDecodeError):
+        return None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def _is_stale(path: str, content: str, stale_seconds: float) -> bool:
+    parts = content.split()
+    try:
+        pid, since = int(parts[0]), float(parts[1])
+    except (IndexError, ValueError):
+        # Older "locked <iso time>" files: only their age tells
+        pid = None
+        try:
+            since = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return False
+    if pid is not None and not _pid_alive(pid):
+        return True
+    return time.time() - since > stale_seconds
+
+
+def _break(path: str, content: str) -> bool:
+    """Remove the stale lock holding ``content``; False if it was replaced meanwhile"""
+    moved = f"{path}.stale.{os.getpid()}.{secrets.token_hex(4)}"
+    try:
+        os.rename(path, moved)
+    except FileNotFoundError:
+        return True
+    if _read(moved) != content:
+        # Another waiter took the lock over first and this rename moved its new lock: put it back
+        try:
+            os.link(moved, path)
+        except FileExistsError:
+            pass
+        os.remove(moved)
+        return False
+    os.remove(moved)
+    return True
+
+
+def acquire(path: str, timeout: float, poll: float, stale_seconds: float):
+    """Create the lock file; returns the holder token, or None after ``timeout``"""
+    token = secrets.token_hex(8)
+    start = time.time()
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            content = _read(path)
+            if content is not None and _is_stale(path, content, stale_seconds) and _break(path, content):
+                LOCK_TAKEOVERS.inc(lock=os.path.basename(path))
+                logger.warning(f"Took over stale lock {path} ({content.strip() or 'empty'})")
+                continue
+        else:
+            with os.fdopen(fd, "w") as f:
+                f.write(f"{os.getpid()} {time.time():.3f} {token}\n")
+            return token
+        if time.time() - start >= timeout:
+            return None
+        time.sleep(poll)
+
+
+def release(path: str, token: str):
+    """Remove the lock file if it is still ours (it may have been taken over as stale)"""
+    content = _read(path)
+    if content is None or content.split()[2:3] != [token]:
+        if content is not None:
+            logger.warning(f"Lock {path} was taken over while held; leaving the new holder's lock")
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,153 @@
+"""Compact in-memory representation of guest rows.
+
+``csv.DictReader`` gives every row its own dict: a hash table sized for
+the 13 keys plus pointers to the key strings. ``GuestRecord`` stores the
+same values in fixed ``__slots__`` instead and interns values that repeat
+across many guests (institution, the optional fields, version), so a large
+resident guest list costs a fraction of the memory. Records behave like a
+mutable mapping (``rec['Name']``, ``rec.get``, ``{**rec}``, ``dict(rec)``)
+and Jinja's ``guest.Name`` reads the slot directly, so routes and templates
+do not need to know which representation they got.
+"""
+import sys
+from collections.abc import MutableMapping
+from functools import lru_cache, partial
+
+from app.services.guests import GUEST_FIELDS
+
+# Low-cardinality columns: one shared string object per distinct value
+INTERNED_FIELDS = frozenset(['Institution', 'Field1', 'Field2', 'Field3', 'Field4', 'Field5', 'Version'])
+
+_FIELD_SET = frozenset(GUEST_FIELDS)
+
+
+class GuestRecord(MutableMapping):
+    """A guest row with one slot per ``GUEST_FIELDS`` column.
+
+    A field whose slot is unset is absent, exactly like a missing dict key.
+    Columns outside ``GUEST_FIELDS`` (older or hand-edited files) go into a
+    lazily created ``_extra`` dict so nothing read from disk is dropped.
+    """
+
+    __slots__ = tuple(GUEST_FIELDS) + ('_extra',)
+
+    def __init__(self, data=(), **kwargs):
+        self._extra = None
+        if data or kwargs:
+            self.update(data, **kwargs)
+
+    @classmethod
+    def from_row(cls, header, values):
+        """Build a record from a ``csv.reader`` row; avoids the intermediate dict."""
+        rec = cls.__new__(cls)
+        rec._extra = None
+        setter = object.__setattr__
+        for key, value in zip(header, values):
+            if key in _FIELD_SET:
+                setter(rec, key, sys.intern(value) if key in INTERNED_FIELDS else value)
+            else:
+                if rec._extra is None:
+                    rec._extra = {}
+                rec._extra[key] = value
+        return rec
+
+    @classmethod
+    def row_builder(cls, header):
+        """Return a fast ``values -> record`` function for rows under ``header``.
+
+        For the usual header (only known, distinct columns) the function is
+        generated once per header as straight-line slot assignments, which
+        parses faster than ``csv.DictReader``; anything else, or a row of the
+        wrong length, falls back to ``from_row``.
+        """
+        return _row_builder(cls, tuple(header))
+
+    # --- mapping protocol ----------------------------------------------
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            try:
+                return object.__getattribute__(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in _FIELD_SET:
+            if key in INTERNED_FIELDS and type(value) is str:
+                value = sys.intern(value)
+            object.__setattr__(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in _FIELD_SET:
+            try:
+                object.__delattr__(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for key in GUEST_FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        if key in _FIELD_SET:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    # Faster than the MutableMapping fallbacks, which go through __getitem__ and KeyError
+    def get(self, key, default=None):
+        if key in _FIELD_SET:
+            return getattr(self, key, default)
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def copy(self):
+        return type(self)(self)
+
+    def to_dict(self) -> dict:
+        return dict(self.items())
+
+    def __reduce__(self):
+        return (type(self), (self.to_dict(),))
+
+    def __repr__(self):
+        return f"GuestRecord({self.to_dict()!r})"
+
+
+@lru_cache(maxsize=32)
+def _row_builder(cls, header):
+    slow = partial(cls.from_row, header)
+    if not header or not set(header) <= _FIELD_SET or len(set(header)) != len(header):
+        return slow
+    # Names come from GUEST_FIELDS (checked above), so the generated source is fixed
+    targets = ", ".join(f"rec.{key}" for key in header)
+    interns = "".join(f"    rec.{key} = intern(rec.{key})\n" for key in header if key in INTERNED_FIELDS)
+    source = (
+        "def build(values):\n"
+        f"    if len(values) != {len(header)}:\n"
+        "        return slow(values)\n"
+        "    rec = new(cls)\n"
+        "    rec._extra = None\n"
+        f"    {targets}, = values\n"
+        f"{interns}"
+        "    return rec\n"
+    )
+    namespace = {"new": cls.__new__, "cls": cls, "intern": sys.intern, "slow": slow}
+    exec(source, namespace)
+    return namespace["build"]
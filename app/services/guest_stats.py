@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Top-level upload dirs that do not belong to a single guest
+SHARED_UPLOAD_DIRS = {"presentations", "profile_photos"}
+
+
+class GuestStats:
+    """Dashboard aggregates kept up to date incrementally from store mutations.
+
+    Registers itself as a CSVDatabase listener: appends and updates adjust
+    the counters by their delta, so the admin dashboard never re-parses the
+    guest file. Writes made by other worker processes are detected through
+    the file signature and trigger a single full rebuild. ``version`` is
+    bumped on every change so streaming clients can tell when to push.
+    """
+
+    def __init__(self, db, upload_root: str, hours: int = 24, top_institutions: int = 10,
+                 upload_rescan_seconds: float = 60.0):
+        self.db = db
+        self.upload_root = upload_root
+        self.hours = hours
+        self.top_institutions = top_institutions
+        self.upload_rescan_seconds = upload_rescan_seconds
+        self._lock = threading.Lock()
+        self._synced_stat = False  # file signature the counters reflect; False = never loaded
+        self._total = 0
+        self._per_hour = Counter()
+        self._institutions = Counter()
+        self._uploads = 0
+        self._uploads_scanned_at = None
+        self.version = 0
+        db.add_listener(self._on_change)
+
+    # --- counters -------------------------------------------------------
+    def _apply(self, row: dict, sign: int):
+        self._total += sign
+        hour = (row.get('CreatedAt') or '')[:13]
+        if hour:
+            _bump(self._per_hour, hour, sign)
+        institution = (row.get('Institution') or '').strip()
+        if institution:
+            _bump(self._institutions, institution, sign)
+
+    def _reset(self, rows, stat):
+        self._total = 0
+        self._per_hour.clear()
+        self._institutions.clear()
+        for row in rows:
+            self._apply(row, 1)
+        self._synced_stat = stat
+        self.version += 1
+
+    def _on_change(self, event):
+        with self._lock:
+            if event.op == "replace" or event.before_stat != self._synced_stat:
+                # First load, full rewrite, or another process wrote since we last synced
+                self._reset(event.rows, event.after_stat)
+                return
+            if event.op == "append":
+                for row in event.added:
+                    self._apply(row, 1)
+            elif event.op == "update":
+                self._apply(event.old, -1)
+                self._apply(event.new, 1)
+            elif event.op == "update_many":
+                for old, new in event.updated:
+                    self._apply(old, -1)
+                    self._apply(new, 1)
+            elif event.op == "merge":
+                self._apply(event.old, -1)
+                self._apply(event.new, 1)
+                for row in event.removed:
+                    self._apply(row, -1)
+            self._synced_stat = event.after_stat
+            self.version += 1
+
+    def refresh(self):
+        """Rebuild if the file changed outside this process; cheap (one stat) otherwise."""
+        stat = self.db.file_stat()
+        with self._lock:
+            if stat == self._synced_stat:
+                return
+        # Signature taken before the read: a write racing the read only causes another rebuild later
+        rows = self.db.read_all()
+        with self._lock:
+            self._reset(rows, stat)
+
+    # --- uploads --------------------------------------------------------
+    def _scan_uploads(self) -> int:
+        count = 0
+        try:
+            with os.scandir(self.upload_root) as guests:
+                for entry in guests:
+                    if entry.is_dir() and entry.name not in SHARED_UPLOAD_DIRS:
+                        count += sum(1 for f in os.scandir(entry.path) if f.is_file())
+        except FileNotFoundError:
+            pass
+        return count
+
+    def record_upload(self):
+        """Count a newly stored guest file (replacing an existing name is not a new upload)"""
+        with self._lock:
+            self._uploads += 1
+            self.version += 1
+
+    def _refresh_uploads(self):
+        now = time.monotonic()
+        if self._uploads_scanned_at is not None and now - self._uploads_scanned_at < self.upload_rescan_seconds:
+            return
+        # Periodic rescan picks up files stored by other workers
+        count = self._scan_uploads()
+        with self._lock:
+            self._uploads_scanned_at = now
+            if count != self._uploads:
+                self._uploads = count
+                self.version += 1
+
+    # --- views ----------------------------------------------------------
+    def snapshot(self) -> dict:
+        self.refresh()
+        self._refresh_uploads()
+        now = datetime.now().replace(minute=0, second=0, microsecond=0)
+        hours = [(now - timedelta(hours=i)).strftime("%Y-%m-%dT%H") for i in range(self.hours - 1, -1, -1)]
+        with self._lock:
+            return {
+                "version": self.version,
+                "total": self._total,
+                "uploads": self._uploads,
+                "last_hour": self._per_hour.get(hours[-1], 0),
+                "per_hour": [{"hour": h, "count": self._per_hour.get(h, 0)} for h in hours],
+                "institutions": [
+                    {"name": name, "count": count}
+                    for name, count in self._institutions.most_common(self.top_institutions)
+                ],
+                "institution_count": len(self._institutions),
+            }
+
+
+def _bump(counter: Counter, key, sign: int):
+    counter[key] += sign
+    if counter[key] <= 0:
+        del counter[key]
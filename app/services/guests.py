@@ -0,0 +1,35 @@
+"""Guest record schema and validation shared by routes and scripts.
+
+Import-light on purpose: no config, storage or framework imports, so
+command-line tools can use it without bringing up the web app.
+"""
+import re
+from typing import List
+
+GUEST_FIELDS = [
+    'ID', 'Name', 'Email', 'Institution', 'Phone',
+    'Field1', 'Field2', 'Field3', 'Field4', 'Field5',
+    'CreatedAt', 'UpdatedAt', 'Version'
+]
+
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+def normalize_phone(phone: str) -> str:
+    return re.sub(r"\D", "", phone or "")
+
+
+def validate_guest(name: str, email: str, institution: str, phone: str, extra: List[str]) -> List[str]:
+    errors = []
+    if not name or len(name.strip()) < 2:
+        errors.append("Name is required (min 2 characters).")
+    if not email or not EMAIL_RE.match(email):
+        errors.append("Valid email is required.")
+    if not institution or len(institution.strip()) < 2:
+        errors.append("Institution is required.")
+    phone_n = normalize_phone(phone)
+    if not phone_n or len(phone_n) < 7:
+        errors.append("Valid phone number is required.")
+    if len(extra) < 5:
+        errors.append("Internal error: extra fields missing.")
+    return errors
@@ -0,0 +1,247 @@
+"""Per-row change history of a CSVDatabase and point-in-time rebuilds.
+
+Every committed mutation is appended to a JSON-lines log as one entry per
+changed row::
+
+    {"at": "2026-10-19T14:03:07.512345", "op": "update", "key": "3f2a...",
+     "actor": "admin", "old": {"Email": "a@x.org", "Version": "3"},
+     "new": {"Email": "a@y.org", "Version": "4"}}
+
+``op`` is "insert" (``new`` is the whole row), "update" (only the fields
+that changed) or "delete" (``old`` is the whole row). That keeps the log a
+small fraction of one full backup per write, and a guest's history is a
+handful of lines instead of a grep through every copy in ``data/backups``.
+
+The full copies stay useful as snapshots: ``rebuild`` starts from the
+newest backup taken before the requested time and replays the log from
+there. Entries hold absolute values, so replaying one that a snapshot
+already contains changes nothing.
+"""
+import csv
+import json
+import os
+import threading
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+import logging
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+HISTORY_ENTRIES = metrics.counter("history_entries_total", "Row changes written to the change log", ("store", "op"))
+
+BACKUP_PREFIX, BACKUP_SUFFIX, BACKUP_TIME_FORMAT = "backup_", ".csv", "%Y%m%d%H%M%S"
+
+# Who is changing data in the current request; set by the auth helpers of the routes
+_current_actor = ContextVar("change_actor", default="system")
+
+
+def set_actor(actor: str):
+    """Record ``actor`` on every change made by the current request (or script)"""
+    _current_actor.set(actor)
+
+
+def current_actor() -> str:
+    return _current_actor.get()
+
+
+def _timestamp() -> str:
+    return datetime.now().isoformat(timespec="microseconds")
+
+
+def _entry_time(line: bytes) -> str:
+    """``at`` of a log line without parsing it (every line starts with it)"""
+    return line[7:33].decode("ascii", "replace") if line.startswith(b'{"at":"') else ""
+
+
+def row_diff(old, new):
+    """``(old values, new values)`` of the fields that differ between two rows"""
+    before, after = {}, {}
+    for field in dict.fromkeys([*old, *new]):
+        a, b = old.get(field, ""), new.get(field, "")
+        if (a or "") != (b or ""):
+            before[field], after[field] = a, b
+    return before, after
+
+
+class ChangeLog:
+    """Append-only change log fed by the database's change events.
+
+    Entries are written while the database still holds its write lock, so
+    the log is in commit order across workers. Like the check-in log, each
+    worker folds in only the bytes appended since its last look and keeps
+    ``{key: [line offsets]}``, so one guest's history reads just their lines.
+    """
+
+    def __init__(self, db, log_path: str):
+        self.db = db
+        self.log_path = log_path
+        self.key_field = db.key_field
+        self._lock = threading.Lock()
+        self._offsets = {}
+        self._offset = 0
+        self._partial = b""
+        db.add_listener(self._on_change)
+
+    # --- recording ------------------------------------------------------
+    def _entries(self, event):
+        key = self.key_field
+        if event.op == "append":
+            for row in event.added:
+                yield {"op": "insert", "key": row.get(key, ""), "new": dict(row)}
+        elif event.op in ("update", "update_many", "merge"):
+            pairs = [(event.old, event.new)] if event.op != "update_many" else event.updated
+            for old, new in pairs:
+                before, after = row_diff(old, new)
+                if after:
+                    yield {"op": "update", "key": new.get(key, ""), "old": before, "new": after}
+            for row in event.removed:
+                yield {"op": "delete", "key": row.get(key, ""), "old": dict(row), "merged_into": event.new.get(key, "")}
+        elif event.op == "replace":
+            # Full rewrites (imports, restores, repairs) are logged as the row changes they amount to
+            previous = {row.get(key): row for row in event.previous}
+            for row in event.rows:
+                old = previous.pop(row.get(key), None)
+                if old is None:
+                    yield {"op": "insert", "key": row.get(key, ""), "new": dict(row)}
+                    continue
+                before, after = row_diff(old, row)
+                if after:
+                    yield {"op": "update", "key": row.get(key, ""), "old": before, "new": after}
+            for old in previous.values():
+                yield {"op": "delete", "key": old.get(key, ""), "old": dict(old)}
+
+    def _on_change(self, event):
+        at, actor = _timestamp(), current_actor()
+        lines = []
+        for entry in self._entries(event):
+            # "at" first: readers compare times without parsing whole lines
+            lines.append(json.dumps({"at": at, **entry, "actor": actor}, ensure_ascii=False, separators=(",", ":")))
+            HISTORY_ENTRIES.inc(store=self.db.store_name, op=entry["op"])
+        if not lines:
+            return
+        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+        fd = os.open(self.log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, ("\n".join(lines) + "\n").encode("utf-8"))
+        finally:
+            os.close(fd)
+
+    # --- reading --------------------------------------------------------
+    def _sync(self):
+        """Index lines appended since the last call; caller holds the lock."""
+        try:
+            f = open(self.log_path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size < self._offset:
+                self._offsets.clear()
+                self._offset, self._partial = 0, b""
+            if size == self._offset:
+                return
+            start = self._offset - len(self._partial)
+            f.seek(self._offset)
+            data = self._partial + f.read(size - self._offset)
+            self._offset = size
+        *lines, self._partial = data.split(b"\n")
+        for line in lines:
+            try:
+                key = json.loads(line)["key"]
+            except (ValueError, KeyError):
+                logger.warning("Skipping malformed change log line")
+            else:
+                self._offsets.setdefault(key, []).append(start)
+            start += len(line) + 1
+
+    def history(self, key: str) -> list:
+        """Every change of one row, oldest first"""
+        with self._lock:
+            self._sync()
+            offsets = list(self._offsets.get(key, ()))
+        entries = []
+        if not offsets:
+            return entries
+        with open(self.log_path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                entries.append(json.loads(f.readline()))
+        return entries
+
+
+# --- point-in-time rebuild ------------------------------------------------
+def snapshots(backup_dir: str) -> list:
+    """``(taken at, path)`` of every full backup, oldest first"""
+    found = []
+    for name in os.listdir(backup_dir) if os.path.isdir(backup_dir) else ():
+        if name.startswith(BACKUP_PREFIX) and name.endswith(BACKUP_SUFFIX):
+            try:
+                taken = datetime.strptime(name[len(BACKUP_PREFIX):-len(BACKUP_SUFFIX)], BACKUP_TIME_FORMAT)
+            except ValueError:
+                continue
+            found.append((taken, os.path.join(backup_dir, name)))
+    return sorted(found)
+
+
+def _read_csv(path: str):
+    with open(path, mode="r", newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        rows = list(reader)
+        return list(reader.fieldnames or []), rows
+
+
+def rebuild(log_path: str, backup_dir: str, at: datetime, key_field: str = "ID") -> dict:
+    """The table as it was at ``at``: newest snapshot before it plus the logged changes up to ``at``.
+
+    A backup is written just before each write and named to the second, so
+    ``backup_<second>.csv`` holds the state before the *last* write within
+    that second. Only backups from a second that ended by ``at`` are
+    candidates, and replay starts at the beginning of the backup's second.
+    Returns ``{"fieldnames", "rows", "snapshot", "replayed"}``.
+    """
+    base, fieldnames, rows = None, [], {}
+    for taken, path in reversed(snapshots(backup_dir)):
+        if taken + timedelta(seconds=1) <= at:
+            base = (taken, path)
+            break
+    if base is not None:
+        fieldnames, base_rows = _read_csv(base[1])
+        rows = {row.get(key_field): row for row in base_rows}
+    since = base[0].isoformat(timespec="microseconds") if base else ""
+    until = at.isoformat(timespec="microseconds")
+    replayed = 0
+    try:
+        f = open(log_path, "rb")
+    except FileNotFoundError:
+        f = None
+    if f is not None:
+        with f:
+            for line in f:
+                at_text = _entry_time(line)
+                if at_text < since:
+                    continue
+                if at_text > until:
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logger.warning("Skipping malformed change log line")
+                    continue
+                key = entry["key"]
+                if entry["op"] == "delete":
+                    rows.pop(key, None)
+                elif entry["op"] == "insert":
+                    rows[key] = dict(entry["new"])
+                elif key in rows:
+                    rows[key] = {**rows[key], **entry["new"]}
+                else:
+                    logger.warning(f"Change log updates unknown row {key}; snapshot and log disagree")
+                    continue
+                for field in entry.get("new", ()):
+                    if field not in fieldnames:
+                        fieldnames.append(field)
+                replayed += 1
+    return {"fieldnames": fieldnames, "rows": list(rows.values()),
+            "snapshot": base[1] if base else None, "replayed": replayed}
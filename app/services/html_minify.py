@@ -0,0 +1,38 @@
+import re
+
+from jinja2.ext import Extension
+
+# Whitespace inside these elements is significant and is left untouched.
+_PROTECTED = re.compile(r"(<(pre|textarea)\b.*?</\2\s*>)", re.IGNORECASE | re.DOTALL)
+_LEADING_WS = re.compile(r"^[ \t]+", re.MULTILINE)
+_TRAILING_WS = re.compile(r"[ \t]+$", re.MULTILINE)
+_BLANK_LINES = re.compile(r"\n{2,}")
+
+
+def minify_whitespace(source: str) -> str:
+    """Strip indentation, trailing spaces and blank lines outside <pre>/<textarea>.
+
+    Line breaks are kept, so inline elements keep their separating
+    whitespace and inline scripts keep their statement boundaries.
+    """
+    parts = _PROTECTED.split(source)
+    out = []
+    # split() with two groups yields: text, whole-match, tag-name, text, ...
+    for i in range(0, len(parts), 3):
+        text = parts[i]
+        text = _LEADING_WS.sub("", text)
+        text = _TRAILING_WS.sub("", text)
+        text = _BLANK_LINES.sub("\n", text)
+        out.append(text)
+        if i + 1 < len(parts):
+            out.append(parts[i + 1])
+    return "".join(out)
+
+
+class HTMLWhitespaceExtension(Extension):
+    """Jinja extension that minifies template source once, at compile time."""
+
+    def preprocess(self, source, name, filename=None):
+        if name and not name.endswith(".html"):
+            return source
+        return minify_whitespace(source)
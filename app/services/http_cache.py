@@ -0,0 +1,71 @@
+"""Entity tags and conditional-request helpers (RFC 9110 section 13).
+
+Handlers compute a cheap validator for the resource *before* building the
+body; when the client's ``If-None-Match`` already names it they answer 304
+with no payload at all.
+"""
+import hashlib
+
+from fastapi import Request
+from fastapi.responses import Response
+
+# Clients may keep a copy but must revalidate it on every use
+REVALIDATE = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag hashed from the parts that determine the representation"""
+    digest = hashlib.sha1("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(header_value: str, etag: str) -> bool:
+    """Weak comparison as used for If-None-Match (the compression middleware weakens our tags)"""
+    if not header_value:
+        return False
+    if header_value.strip() == "*":
+        return True
+    wanted = _opaque(etag)
+    return any(_opaque(tag) == wanted for tag in header_value.split(","))
+
+
+def not_modified(request: Request, etag: str, cache_control: str = REVALIDATE, extra_headers=None):
+    """A 304 response if the request's If-None-Match matches ``etag``, else None"""
+    if not etag_matches(request.headers.get("if-none-match", ""), etag):
+        return None
+    headers = {"ETag": etag, "Cache-Control": cache_control, **(extra_headers or {})}
+    return Response(status_code=304, headers=headers)
+
+
+def cache_headers(etag: str, cache_control: str = REVALIDATE) -> dict:
+    return {"ETag": etag, "Cache-Control": cache_control}
+
+
+def byte_range(request: Request, etag: str, total: int):
+    """``(start, end)`` of a single-range ``Range`` request, or None for the whole body.
+
+    Ignored when ``If-Range`` names another representation (the client then
+    gets it from the start). Raises ``ValueError`` for a range past the end.
+    """
+    header = request.headers.get("range", "")
+    if not header.startswith("bytes=") or "," in header:
+        return None
+    if_range = request.headers.get("if-range")
+    if if_range and if_range.strip() != etag:
+        return None
+    first, _, last = header[6:].strip().partition("-")
+    try:
+        if first:
+            start, end = int(first), int(last) if last else total - 1
+        else:
+            start, end = max(0, total - int(last)), total - 1
+    except ValueError:
+        return None
+    if start >= total or end < start:
+        raise ValueError(f"range starts past {total} bytes")
+    return start, min(end, total - 1)
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import threading
+import uuid
+import logging
+
+try:  # Optional: without Pillow the original file is served unchanged
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - depends on environment
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+SOURCE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+FORMATS = {
+    "webp": ("WEBP", "image/webp", ".webp"),
+    "jpeg": ("JPEG", "image/jpeg", ".jpg"),
+}
+
+
+class ImageService:
+    """Resized / WebP variants of static images, generated on first request.
+
+    Variants are cached on disk as ``<cache_dir>/<hh>/<sha256>-<width>.<ext>``,
+    keyed by the source content hash so a replaced photo never serves a stale
+    thumbnail. Only files below ``allowed_prefixes`` of the static dir are
+    eligible, and only the configured widths can be requested, so the cache
+    cannot be grown arbitrarily from outside.
+    """
+
+    def __init__(self, static_dir, cache_dir, widths=(320, 640, 960, 1280),
+                 allowed_prefixes=("images/", "raw_id_card/", "uploads/profile_photos/"),
+                 webp_quality=75, jpeg_quality=80):
+        self.static_dir = os.path.abspath(static_dir)
+        self.cache_dir = cache_dir
+        self.widths = tuple(sorted(widths))
+        self.allowed_prefixes = tuple(allowed_prefixes)
+        self.webp_quality = webp_quality
+        self.jpeg_quality = jpeg_quality
+        self._lock = threading.Lock()
+        self._digests = {}  # rel path -> (size, mtime, sha256)
+
+    @property
+    def available(self) -> bool:
+        return Image is not None
+
+    def source_path(self, rel_path: str):
+        """Resolve a request path to a file inside the static dir, or None."""
+        rel_path = rel_path.lstrip("/").replace("\\", "/")
+        if not rel_path.startswith(self.allowed_prefixes):
+            return None
+        if os.path.splitext(rel_path)[1].lower() not in SOURCE_EXTENSIONS:
+            return None
+        path = os.path.abspath(os.path.join(self.static_dir, rel_path))
+        if not path.startswith(self.static_dir + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def digest(self, rel_path: str):
+        """Content hash of a source image, memoized by size and mtime; None if it is gone."""
+        path = self.source_path(rel_path)
+        if path is None:
+            return None
+        try:
+            st = os.stat(path)
+            with self._lock:
+                cached = self._digests.get(rel_path)
+            if cached and cached[0] == st.st_size and cached[1] == st.st_mtime:
+                return cached[2]
+            h = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    h.update(chunk)
+        except FileNotFoundError:
+            return None
+        digest = h.hexdigest()
+        with self._lock:
+            self._digests[rel_path] = (st.st_size, st.st_mtime, digest)
+        return digest
+
+    def closest_width(self, width: int) -> int:
+        for w in self.widths:
+            if w >= width:
+                return w
+        return self.widths[-1]
+
+    def variant(self, rel_path: str, width: int, fmt: str):
+        """Return (file_path, media_type, source digest) of the variant, generating it if needed.
+
+        Returns None when the source is not an eligible image or has disappeared.
+        """
+        source = self.source_path(rel_path)
+        if source is None:
+            return None
+        pil_format, media_type, ext = FORMATS[fmt]
+        digest = self.digest(rel_path)
+        if digest is None:
+            return None
+        target = os.path.join(self.cache_dir, digest[:2], f"{digest}-{width}{ext}")
+        if os.path.exists(target):
+            return target, media_type, digest
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with Image.open(source) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.width > width:
+                height = max(1, round(img.height * width / img.width))
+                img = img.resize((width, height), Image.LANCZOS)
+            if pil_format == "JPEG" and img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            options = {"quality": self.webp_quality, "method": 4} if pil_format == "WEBP" else {
+                "quality": self.jpeg_quality, "optimize": True, "progressive": True}
+            # Unique temp name: concurrent first requests may race to create the same variant
+            tmp = f"{target}.{uuid.uuid4().hex}.tmp"
+            img.save(tmp, pil_format, **options)
+        os.replace(tmp, target)
+        logger.info(f"Generated image variant {rel_path} @{width}px ({fmt})")
+        return target, media_type, digest
+
+    def url(self, rel_path: str, width: int) -> str:
+        rel_path = rel_path.lstrip("/")
+        digest = self.digest(rel_path) if self.available else None
+        if digest is None:
+            return f"/static/{rel_path}"
+        return f"/img/{rel_path}?w={width}&v={digest[:10]}"
+
+    def srcset(self, rel_path: str) -> str:
+        """``srcset`` attribute value covering every configured width."""
+        if not self.available or self.source_path(rel_path) is None:
+            return ""
+        return ", ".join(f"{self.url(rel_path, w)} {w}w" for w in self.widths)
+
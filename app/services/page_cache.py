@@ -0,0 +1,73 @@
+import threading
+from collections import OrderedDict
+import logging
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_REQUESTS = metrics.counter("page_cache_requests_total", "Rendered-page cache outcomes", ("page", "result"))
+
+
+class GuestPageCache:
+    """Bounded LRU of rendered per-guest pages, keyed by guest ID.
+
+    Each entry carries the validator (ETag) it was rendered for, so a hit is
+    only served while the guest row, their uploads and the conference
+    settings are unchanged; a write from another worker simply shows up as a
+    validator mismatch. Writes in this process also drop entries eagerly via
+    the database listener and ``invalidate()``, so stale pages do not hold
+    memory until they age out.
+    """
+
+    def __init__(self, db, max_entries: int = 500, page: str = "guest_dashboard"):
+        self.max_entries = max_entries
+        self.page = page
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        db.add_listener(self._on_change)
+
+    def get(self, guest_id: str, etag: str):
+        """Cached body rendered for exactly ``etag``, or None"""
+        with self._lock:
+            entry = self._entries.get(guest_id)
+            if entry is not None and entry[0] == etag:
+                self._entries.move_to_end(guest_id)
+                PAGE_CACHE_REQUESTS.inc(page=self.page, result="hit")
+                return entry[1]
+        PAGE_CACHE_REQUESTS.inc(page=self.page, result="miss")
+        return None
+
+    def put(self, guest_id: str, etag: str, body: bytes):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[guest_id] = (etag, body)
+            self._entries.move_to_end(guest_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, guest_id: str = None):
+        """Drop one guest's page, or every page when ``guest_id`` is None"""
+        with self._lock:
+            if guest_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(guest_id, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _on_change(self, event):
+        if event.op == "update":
+            self.invalidate(event.new.get('ID'))
+        elif event.op == "update_many":
+            for _, new in event.updated:
+                self.invalidate(new.get('ID'))
+        elif event.op == "merge":
+            self.invalidate(event.new.get('ID'))
+            for row in event.removed:
+                self.invalidate(row.get('ID'))
+        elif event.op == "replace":
+            self.invalidate()
+        # "append" only adds guests, who cannot have a cached page yet
@@ -0,0 +1,216 @@
+"""Per-request span timings, the slow-request log and on-demand cProfile captures.
+
+Code paths mark interesting work with ``with span("csv_parse"): ...``. The
+profiling middleware gives every request a ``RequestTrace`` through a context
+variable, so spans cost two clock reads and a dict update; outside a request
+(CLI tools, startup) they do nothing.
+"""
+import cProfile
+import hashlib
+import hmac
+import io
+import json
+import os
+import pstats
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+import logging
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUESTS = metrics.counter("slow_requests_total", "Requests slower than the slow-request threshold", ("route",))
+PROFILED_REQUESTS = metrics.counter("profiled_requests_total", "Requests captured with cProfile", ("trigger",))
+
+PROFILE_HEADER = "x-profile-token"
+# Never profiled through arming: static files, the metrics scrape and the profiler's own pages
+UNPROFILED_PREFIXES = ("/static", "/metrics", "/admin/profiling")
+_DEFAULT_SECRET = "generate_random_secret_key_here"
+_PROFILE_NAME = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9]{3}-[A-Za-z0-9_.-]+\.prof$")
+
+_current_trace = ContextVar("request_trace", default=None)
+
+
+class RequestTrace:
+    """Accumulated seconds (and call counts) per span name for one request"""
+
+    __slots__ = ("spans",)
+
+    def __init__(self):
+        self.spans = {}
+
+    def add(self, name: str, seconds: float):
+        total, count = self.spans.get(name, (0.0, 0))
+        self.spans[name] = (total + seconds, count + 1)
+
+    def as_ms(self) -> dict:
+        return {name: {"ms": round(total * 1000, 2), "count": count} for name, (total, count) in self.spans.items()}
+
+
+@contextmanager
+def span(name: str):
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - started)
+
+
+def start_trace() -> tuple:
+    trace = RequestTrace()
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+
+class RequestProfiler:
+    """Decides which requests to profile and keeps the results.
+
+    Two triggers: an admin arms the next N requests of this worker, or a
+    client sends ``X-Profile-Token`` with a signed, expiring token (which
+    works on whichever worker picks the request up). cProfile hooks the
+    event-loop thread, so only one request is profiled at a time; while it
+    runs, other triggers are left for a later request.
+    """
+
+    def __init__(self, profile_dir: str, slow_log_path: str, slow_ms: float = 500.0,
+                 max_profiles: int = 50, secret: str = "", token_ttl_seconds: int = 3600, recent: int = 100):
+        self.profile_dir = profile_dir
+        self.slow_log_path = slow_log_path
+        self.slow_ms = slow_ms
+        self.max_profiles = max_profiles
+        self.token_ttl_seconds = token_ttl_seconds
+        if not secret or secret == _DEFAULT_SECRET:
+            # A publicly known key would let anyone trigger profiles; tokens then only work on this worker
+            logger.warning("SecretKey is not set; profile tokens are valid for this worker only")
+            secret = secrets.token_hex(32)
+        self._secret = secret.encode("utf-8")
+        self._lock = threading.Lock()
+        self._armed = 0
+        self._active = False
+        self._recent_slow = deque(maxlen=recent)
+
+    # --- triggers -------------------------------------------------------
+    def arm(self, count: int):
+        with self._lock:
+            self._armed = max(0, count)
+        logger.info(f"Profiler armed for the next {self._armed} requests")
+
+    @property
+    def armed(self) -> int:
+        return self._armed
+
+    def _sign(self, expires: int) -> str:
+        return hmac.new(self._secret, f"profile:{expires}".encode("ascii"), hashlib.sha256).hexdigest()[:32]
+
+    def make_token(self) -> str:
+        expires = int(time.time()) + self.token_ttl_seconds
+        return f"{expires}.{self._sign(expires)}"
+
+    def verify_token(self, token: str) -> bool:
+        expires, _, signature = (token or "").strip().partition(".")
+        if not expires.isdigit() or int(expires) < time.time():
+            return False
+        return hmac.compare_digest(signature, self._sign(int(expires)))
+
+    def claim(self, path: str, headers: dict):
+        """A started cProfile.Profile if this request should be profiled, else None"""
+        token = headers.get(PROFILE_HEADER)
+        trigger = "token" if token and self.verify_token(token) else None
+        with self._lock:
+            if self._active:
+                return None
+            if trigger is None:
+                if self._armed <= 0 or path.startswith(UNPROFILED_PREFIXES):
+                    return None
+                self._armed -= 1
+                trigger = "armed"
+            self._active = True
+        PROFILED_REQUESTS.inc(trigger=trigger)
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    # --- results --------------------------------------------------------
+    def finish(self, method: str, path: str, route: str, status: int, seconds: float, trace: RequestTrace, profile=None):
+        elapsed_ms = seconds * 1000
+        if profile is not None:
+            profile.disable()
+            try:
+                self._save_profile(profile, method, route, elapsed_ms)
+            finally:
+                with self._lock:
+                    self._active = False
+        if elapsed_ms >= self.slow_ms:
+            self._log_slow({
+                "at": datetime.now().isoformat(timespec="milliseconds"),
+                "method": method,
+                "path": path,
+                "route": route,
+                "status": status,
+                "ms": round(elapsed_ms, 2),
+                "spans": trace.as_ms(),
+            })
+
+    def _save_profile(self, profile, method: str, route: str, elapsed_ms: float):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", route.strip("/")) or "root"
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')[:19]}-{method}-{slug[:60]}-{int(elapsed_ms)}ms.prof"
+        profile.dump_stats(os.path.join(self.profile_dir, name))
+        logger.info(f"Saved request profile {name}")
+        for old in self.list_profiles()[self.max_profiles:]:
+            try:
+                os.remove(os.path.join(self.profile_dir, old["name"]))
+            except OSError:
+                pass
+
+    def _log_slow(self, entry: dict):
+        SLOW_REQUESTS.inc(route=entry["route"])
+        self._recent_slow.append(entry)
+        spans = ", ".join(f"{k}={v['ms']}ms" for k, v in entry["spans"].items())
+        logger.warning(f"Slow request {entry['method']} {entry['path']} {entry['status']} took {entry['ms']} ms ({spans})")
+        try:
+            os.makedirs(os.path.dirname(self.slow_log_path) or ".", exist_ok=True)
+            with self._lock, open(self.slow_log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            logger.error(f"Could not write slow-request log: {e}")
+
+    def recent_slow(self) -> list:
+        return list(reversed(self._recent_slow))
+
+    def list_profiles(self) -> list:
+        """Saved profiles, newest first"""
+        try:
+            entries = [e for e in os.scandir(self.profile_dir) if e.is_file() and _PROFILE_NAME.match(e.name)]
+        except FileNotFoundError:
+            return []
+        return [{"name": e.name, "size": e.stat().st_size} for e in sorted(entries, key=lambda e: e.name, reverse=True)]
+
+    def profile_path(self, name: str):
+        """Path of a saved profile; None for anything that is not one (no traversal)"""
+        if not _PROFILE_NAME.match(name or ""):
+            return None
+        path = os.path.join(self.profile_dir, name)
+        return path if os.path.isfile(path) else None
+
+    def profile_text(self, name: str, limit: int = 60):
+        path = self.profile_path(name)
+        if path is None:
+            return None
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
@@ -0,0 +1,203 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+import logging
+
+from fastapi import Request, HTTPException, Depends
+
+from app.config import Config
+from app.services import file_lock
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_REJECTIONS = metrics.counter("rate_limit_rejections_total", "Requests rejected by the login rate limiter", ("scope", "key"))
+RATE_LIMIT_FAIL_OPEN = metrics.counter("rate_limit_fail_open_total", "Attempts allowed unchecked because the shared bucket store was busy", ("store",))
+
+
+class MemoryBucketStore:
+    """Per-process bucket state; bounded so a spray of IPs cannot grow it without limit."""
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, key, capacity, rate, now, cost=1):
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (capacity, now))
+            allowed, tokens, retry_after = _take(tokens, last, capacity, rate, now, cost)
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return allowed, retry_after
+
+
+class FileBucketStore:
+    """Bucket state shared by all workers through a small JSON file.
+
+    Uses the same lock files as CSVDatabase (``app.services.file_lock``),
+    so a lock left by a killed worker is taken over once it is older than
+    ``stale_lock_seconds``. If the lock still cannot be taken quickly the
+    attempt is allowed (fail open) rather than locking legitimate users out;
+    each such attempt is logged and counted in ``rate_limit_fail_open_total``.
+    """
+
+    def __init__(self, path: str, lock_timeout: float = 0.2, stale_lock_seconds: float = 5.0):
+        self.path = path
+        self.lock_file = f"{path}.lock"
+        self.lock_timeout = lock_timeout
+        self.stale_lock_seconds = stale_lock_seconds
+        self.store_name = os.path.basename(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def take(self, key, capacity, rate, now, cost=1):
+        token = file_lock.acquire(self.lock_file, self.lock_timeout, 0.005, self.stale_lock_seconds)
+        if token is None:
+            RATE_LIMIT_FAIL_OPEN.inc(store=self.store_name)
+            logger.warning(f"Rate limit store {self.store_name} busy; allowing attempt unchecked")
+            return True, 0.0
+        try:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    buckets = json.load(f)
+            except (FileNotFoundError, ValueError):
+                buckets = {}
+            tokens, last = buckets.get(key, (capacity, now))
+            allowed, tokens, retry_after = _take(tokens, last, capacity, rate, now, cost)
+            buckets[key] = (tokens, now)
+            # Drop buckets that have refilled completely; they carry no state
+            buckets = {k: v for k, v in buckets.items() if v[0] + (now - v[1]) * rate < capacity or k == key}
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(buckets, f)
+            os.replace(tmp, self.path)
+            return allowed, retry_after
+        finally:
+            file_lock.release(self.lock_file, token)
+
+
+def _take(tokens, last, capacity, rate, now, cost=1):
+    tokens = min(capacity, tokens + max(0.0, now - last) * rate)
+    if tokens >= 1:
+        return True, tokens - cost, 0.0
+    return False, tokens, (1 - tokens) / rate
+
+
+class TokenBucketLimiter:
+    """Token bucket: ``capacity`` attempts in a burst, refilled over ``window_seconds``."""
+
+    def __init__(self, capacity: int, window_seconds: float, store=None):
+        self.capacity = max(1, capacity)
+        self.rate = self.capacity / max(1.0, window_seconds)
+        self.store = store or MemoryBucketStore()
+
+    def hit(self, key: str):
+        """Consume one token for key; returns (allowed, retry_after_seconds)."""
+        return self.store.take(key, self.capacity, self.rate, time.time())
+
+    def check(self, key: str):
+        """Like ``hit`` but without consuming a token."""
+        return self.store.take(key, self.capacity, self.rate, time.time(), cost=0)
+
+
+def _build_store(config: Config, name: str):
+    if config.get('SECURITY', 'RateLimitStore', fallback='memory').strip().lower() == 'file':
+        base = config.get('SECURITY', 'RateLimitPath', fallback='./data/rate_limits.json')
+        root, ext = os.path.splitext(base)
+        return FileBucketStore(f"{root}.{name}{ext or '.json'}")
+    return MemoryBucketStore()
+
+
+class LoginRateLimits:
+    """Limiters for login-style endpoints, built from the [SECURITY] section."""
+
+    def __init__(self, config: Config):
+        window = config.getint('SECURITY', 'LoginWindowSeconds', fallback=60) or 60
+        # Per account (phone, or the admin account per client IP): SECURITY.MaxLoginAttempts per window.
+        self.subject = TokenBucketLimiter(
+            config.getint('SECURITY', 'MaxLoginAttempts', fallback=3) or 3, window, _build_store(config, 'subject')
+        )
+        # Per client IP, shared by guest login, registration and the API session
+        # endpoint: generous, since a venue NAT puts many guests behind one address.
+        self.ip = TokenBucketLimiter(
+            config.getint('SECURITY', 'MaxAttemptsPerIP', fallback=300) or 300, window, _build_store(config, 'ip')
+        )
+        self.trust_forwarded = config.getboolean('SECURITY', 'TrustForwardedFor', fallback=False)
+        self.proxy_hops = max(1, config.getint('SECURITY', 'TrustedProxyHops', fallback=1) or 1)
+
+    def client_ip(self, request: Request) -> str:
+        if self.trust_forwarded:
+            # Each proxy appends the address it received the request from, so
+            # only the last TrustedProxyHops entries are not client-supplied.
+            hops = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+            if hops:
+                return hops[-min(self.proxy_hops, len(hops))]
+        return request.client.host if request.client else "unknown"
+
+
+def _reject(scope: str, key: str, retry_after: float):
+    RATE_LIMIT_REJECTIONS.inc(scope=scope, key=key)
+    logger.warning(f"Rate limit hit for {scope} by {key}")
+    raise HTTPException(
+        status_code=429,
+        detail="Too many attempts. Please wait a minute and try again.",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+def charge_failure(request: Request):
+    """Count a failed attempt against the subject bucket of a ``failures_only`` limit."""
+    charge = getattr(request.state, "rate_limit_failure", None)
+    if charge:
+        request.state.rate_limit_failure = None
+        charge()
+
+
+def rate_limit(scope: str, subject_field: str = None, normalize=None, failures_only: bool = False):
+    """FastAPI dependency factory limiting attempts per client IP and per subject.
+
+    ``subject_field`` names a form field or JSON body key (e.g. ``phone``)
+    whose normalized value is limited separately; without it the subject is
+    the scope's single account (the event's admin) as seen from the client IP,
+    so one address cannot lock the admin out everywhere. Subjects are kept
+    per event. With ``failures_only`` the subject bucket is only checked here
+    and the handler charges it by calling ``charge_failure(request)``. Runs
+    before the route handler, so rejected attempts never touch the guest store.
+    """
+    from app.services.container import get_services  # container imports this module
+
+    async def dependency(request: Request, services=Depends(get_services)):
+        limits = services.rate_limits
+        client_ip = limits.client_ip(request)
+        allowed, retry_after = limits.ip.hit(f"{scope}:ip:{client_ip}")
+        if not allowed:
+            _reject(scope, "ip", retry_after)
+        if subject_field:
+            if request.headers.get("content-type", "").startswith("application/json"):
+                try:
+                    body = await request.json()
+                except ValueError:
+                    body = None
+                subject = str(body.get(subject_field) or "") if isinstance(body, dict) else ""
+            else:
+                form = await request.form()
+                subject = str(form.get(subject_field) or "")
+            subject = normalize(subject) if normalize else subject.strip().lower()
+            if not subject:
+                return
+        else:
+            subject = client_ip
+        key = f"{scope}:subject:{services.event.slug if services.event else ''}:{subject}"
+        if failures_only:
+            allowed, retry_after = limits.subject.check(key)
+            request.state.rate_limit_failure = lambda: limits.subject.hit(key)
+        else:
+            allowed, retry_after = limits.subject.hit(key)
+        if not allowed:
+            _reject(scope, "subject", retry_after)
+
+    return dependency
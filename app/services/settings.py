@@ -37,9 +37,7 @@ class SettingsService:
         self._lock = threading.RLock()
         self._cache = None
         self._mtime = None
-        os.makedirs(os.path.dirname(self.path), exist_ok=True)
-        if not os.path.exists(self.path):
-            self._write(self.DEFAULTS)
+        # The file is created with defaults on first get(), not at construction
 
     def _read(self):
         try:
@@ -50,6 +48,7 @@ class SettingsService:
             return dict(self.DEFAULTS)
 
     def _write(self, data: dict):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
         tmp = f"{self.path}.tmp"
         with open(tmp, "w", encoding="utf-8") as f:
             json.dump(data, f, indent=2, ensure_ascii=False)
@@ -68,6 +67,11 @@ class SettingsService:
                 self._mtime = mtime
             return self._cache
 
+    def version(self):
+        """Changes whenever the settings file is rewritten; cheap enough for per-request validators"""
+        self.get()
+        return self._mtime
+
     def _coerce_bool(self, value) -> bool:
         if isinstance(value, bool):
             return value
@@ -93,6 +97,3 @@ class SettingsService:
             logger.info(f"Settings updated at {datetime.now().isoformat()}")
             return data
 
-
-# Singleton
-settings_service = SettingsService()
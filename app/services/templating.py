@@ -0,0 +1,46 @@
+import re
+from datetime import datetime
+
+from fastapi.templating import Jinja2Templates
+
+from app.services.html_minify import HTMLWhitespaceExtension
+from app.services.profiling import span
+
+
+def normalize_dashes(value: str) -> str:
+    """Jinja filter: fix common dash mojibake and normalize ranges to an en dash."""
+    if not isinstance(value, str):
+        return value
+    s = value
+    # Fix common UTF-8 -> cp1252 mojibake for dashes
+    s = s.replace("â€“", "–").replace("â€”", "—")
+    # If a stray 'â' accidentally split a range like 12â14, correct to en dash
+    s = re.sub(r"(?<=\d)â(?=\d)", "–", s)
+    # Normalize all long dashes to an en dash
+    s = s.replace("—", "–")
+    # Collapse spaces around dashes used as ranges
+    s = re.sub(r"\s*–\s*", "–", s)
+    return s
+
+
+class TracedTemplates(Jinja2Templates):
+    """Jinja2Templates whose renders show up as the ``template_render`` span"""
+
+    def TemplateResponse(self, *args, **kwargs):
+        with span("template_render"):
+            return super().TemplateResponse(*args, **kwargs)
+
+
+def build_templates(config, assets, images, checkin) -> Jinja2Templates:
+    """The single Jinja environment used by every router and error handler."""
+    templates = TracedTemplates(directory=config.get('PATHS', 'TemplatesDir'))
+    templates.env.globals["now"] = datetime.now()
+    templates.env.globals["asset_url"] = assets.url
+    templates.env.globals["img_url"] = images.url
+    templates.env.globals["img_srcset"] = images.srcset
+    templates.env.globals["badge_code"] = checkin.badge_code
+    templates.env.globals["badge_images"] = checkin.images_available
+    templates.env.filters["normalize_dashes"] = normalize_dashes
+    if config.getboolean('COMPRESSION', 'MinifyHTML', fallback=False):
+        templates.env.add_extension(HTMLWhitespaceExtension)
+    return templates
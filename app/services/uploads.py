@@ -0,0 +1,268 @@
+"""Resumable chunked uploads for files too large for one form post.
+
+A client declares the file (name and size), then sends it in chunks, each
+at the offset the server reports, and finally asks for it to be stored::
+
+    POST  .../uploads                  {"filename", "size"}   -> {"id", "offset": 0, "chunk_size", ...}
+    PATCH .../uploads/<id>             Upload-Offset: <n>, raw bytes as the body
+    GET   .../uploads/<id>             -> {"offset", ...}      (where to resume after a disconnect)
+    POST  .../uploads/<id>/complete    {"sha256"}             -> stored file
+
+Chunks are written to the staging file as they arrive, so memory does not
+depend on file or chunk size, and bytes received before a disconnect are
+kept. A running SHA-256 makes completion a rename: the file is not read
+again unless another worker took part in the upload (or the process
+restarted), in which case it is hashed from disk in blocks.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import os
+import re
+import secrets
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+import logging
+
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CHUNKED_UPLOAD_BYTES = metrics.counter("chunked_upload_bytes_total", "Bytes received by resumable uploads")
+CHUNKED_UPLOADS = metrics.counter("chunked_uploads_total", "Resumable uploads by outcome", ("result",))
+
+UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+HASH_BLOCK = 1024 * 1024
+
+
+class UploadError(Exception):
+    """A request the upload cannot accept; ``status`` says why, ``offset`` where to continue"""
+
+    def __init__(self, status: str, detail: str, offset: int = None):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+        self.offset = offset
+
+
+def _parse_checksum(value: str):
+    """Digest from ``Upload-Checksum: sha256 <base64>`` (the tus convention), or None"""
+    if not value:
+        return None
+    algorithm, _, encoded = value.strip().partition(" ")
+    if algorithm.lower() != "sha256":
+        raise UploadError("invalid", "Only sha256 chunk checksums are supported")
+    try:
+        return base64.b64decode(encoded.strip(), validate=True)
+    except (binascii.Error, ValueError):
+        raise UploadError("invalid", "Malformed Upload-Checksum header")
+
+
+class ChunkedUploads:
+    """Staged uploads of one event, one directory per upload below ``staging_dir``.
+
+    ``limits`` maps a role (``guest``, ``admin``) to its largest file in
+    bytes. Uploads without a chunk for ``expire_seconds`` are removed, at
+    most every ``sweep_seconds``, when a new upload starts.
+    """
+
+    def __init__(self, staging_dir: str, limits: dict, chunk_size: int = 4 * 1024 * 1024,
+                 expire_seconds: float = 86400, sweep_seconds: float = 600):
+        self.staging_dir = staging_dir
+        self.limits = limits
+        self.chunk_size = chunk_size
+        self.expire_seconds = expire_seconds
+        self.sweep_seconds = sweep_seconds
+        self._lock = threading.Lock()
+        self._active = set()
+        # upload id -> (offset, running sha256 of bytes [0, offset)), for uploads this worker received in order
+        self._hashes = {}
+        self._swept_at = 0.0
+        os.makedirs(staging_dir, exist_ok=True)
+
+    # --- paths and metadata ---------------------------------------------
+    def _dir(self, upload_id: str) -> str:
+        return os.path.join(self.staging_dir, upload_id)
+
+    def _part(self, upload_id: str) -> str:
+        return os.path.join(self._dir(upload_id), "data.part")
+
+    def _meta(self, upload_id: str, owner: str) -> dict:
+        if not UPLOAD_ID_RE.match(upload_id or ""):
+            raise UploadError("not_found", "Upload not found")
+        try:
+            with open(os.path.join(self._dir(upload_id), "upload.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            raise UploadError("not_found", "Upload not found")
+        # Another guest's upload ID reads as unknown
+        if meta.get("owner") != owner:
+            raise UploadError("not_found", "Upload not found")
+        return meta
+
+    def _status(self, meta: dict, offset: int) -> dict:
+        return {
+            "id": meta["id"],
+            "filename": meta["filename"],
+            "size": meta["size"],
+            "offset": offset,
+            "chunk_size": self.chunk_size,
+            "expires_at": (datetime.now() + timedelta(seconds=self.expire_seconds)).isoformat(timespec="seconds"),
+        }
+
+    def max_size(self, role: str) -> int:
+        return self.limits.get(role, 0)
+
+    # --- protocol -------------------------------------------------------
+    def create(self, owner: str, role: str, filename: str, size: int) -> dict:
+        """Start an upload of ``size`` bytes for ``owner`` (a guest ID)"""
+        self._sweep()
+        name = os.path.basename((filename or "").replace("\\", "/")).strip()
+        if not name or name.startswith("."):
+            raise UploadError("invalid", "A file name is required")
+        if size < 0:
+            raise UploadError("invalid", "Size must not be negative")
+        limit = self.max_size(role)
+        if size > limit:
+            raise UploadError("too_large", f"File exceeds the {limit // (1024 * 1024)} MB limit")
+        upload_id = secrets.token_hex(16)
+        meta = {
+            "id": upload_id, "owner": owner, "role": role, "filename": name, "size": size,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        os.makedirs(self._dir(upload_id))
+        with open(self._part(upload_id), "wb"):
+            pass
+        with open(os.path.join(self._dir(upload_id), "upload.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        self._hashes[upload_id] = (0, hashlib.sha256())
+        logger.info(f"Upload {upload_id} started for {owner}: {name} ({size} bytes)")
+        return self._status(meta, 0)
+
+    def status(self, upload_id: str, owner: str) -> dict:
+        meta = self._meta(upload_id, owner)
+        return self._status(meta, os.path.getsize(self._part(upload_id)))
+
+    async def append(self, upload_id: str, owner: str, offset: int, chunks, checksum: str = "") -> dict:
+        """Write the bytes of ``chunks`` (an async iterable) at ``offset``.
+
+        ``offset`` must equal the bytes received so far. With ``checksum``
+        a chunk is kept only if complete and matching; without it, bytes
+        received before a disconnect are kept and the client resumes from
+        the offset ``status`` reports.
+        """
+        meta = self._meta(upload_id, owner)
+        expected = _parse_checksum(checksum)
+        with self._lock:
+            if upload_id in self._active:
+                raise UploadError("busy", "A chunk for this upload is still being received")
+            self._active.add(upload_id)
+        try:
+            fd = os.open(self._part(upload_id), os.O_WRONLY)
+            try:
+                current = os.fstat(fd).st_size
+                if offset != current:
+                    raise UploadError("offset_mismatch", f"Expected offset {current}", current)
+                running = self._hashes.pop(upload_id, None)
+                file_hash = running[1] if running is not None and running[0] == offset else None
+                before = file_hash.copy() if file_hash is not None else None
+                chunk_hash = hashlib.sha256() if expected is not None else None
+                position, verified = offset, expected is None
+                try:
+                    async for data in chunks:
+                        if position + len(data) > meta["size"]:
+                            raise UploadError("too_large", "More bytes than the declared size", offset)
+                        os.pwrite(fd, data, position)
+                        position += len(data)
+                        for digest in (file_hash, chunk_hash):
+                            if digest is not None:
+                                digest.update(data)
+                    if chunk_hash is not None:
+                        verified = chunk_hash.digest() == expected
+                        if not verified:
+                            raise UploadError("checksum_mismatch", "Chunk checksum does not match; send it again", offset)
+                except BaseException as e:
+                    # A disconnect keeps what arrived, unless the chunk was to be verified
+                    if isinstance(e, UploadError) or not verified:
+                        os.ftruncate(fd, offset)
+                        position, file_hash = offset, before
+                    raise
+                finally:
+                    if file_hash is not None:
+                        self._hashes[upload_id] = (position, file_hash)
+                    CHUNKED_UPLOAD_BYTES.inc(position - offset)
+            finally:
+                os.close(fd)
+        finally:
+            with self._lock:
+                self._active.discard(upload_id)
+        return self._status(meta, position)
+
+    def complete(self, upload_id: str, owner: str, dest_dir: str, sha256: str = "") -> dict:
+        """Move the finished upload to ``dest_dir``; a given ``sha256`` (hex) must match"""
+        meta = self._meta(upload_id, owner)
+        part = self._part(upload_id)
+        size = os.path.getsize(part)
+        if size != meta["size"]:
+            raise UploadError("incomplete", f"Received {size} of {meta['size']} bytes", size)
+        running = self._hashes.get(upload_id)
+        if running is not None and running[0] == size:
+            digest = running[1].hexdigest()
+        else:
+            digest = self._hash_file(part)
+        if sha256 and not secrets.compare_digest(sha256.strip().lower(), digest):
+            self.cancel(upload_id, owner)
+            CHUNKED_UPLOADS.inc(result="checksum_mismatch")
+            raise UploadError("checksum_mismatch", "File checksum does not match; upload it again")
+        os.makedirs(dest_dir, exist_ok=True)
+        path = os.path.join(dest_dir, meta["filename"])
+        is_new = not os.path.exists(path)
+        try:
+            os.replace(part, path)
+        except OSError:
+            # Staging on another filesystem: copy in blocks, then swap in atomically
+            temp = f"{path}.{upload_id}.part"
+            shutil.copyfile(part, temp)
+            os.replace(temp, path)
+        self.cancel(upload_id, owner)
+        CHUNKED_UPLOADS.inc(result="completed")
+        logger.info(f"Upload {upload_id} completed: {path} ({size} bytes)")
+        return {"name": meta["filename"], "size": size, "sha256": digest, "new": is_new}
+
+    def cancel(self, upload_id: str, owner: str):
+        self._meta(upload_id, owner)
+        self._hashes.pop(upload_id, None)
+        shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+
+    # --- housekeeping ---------------------------------------------------
+    @staticmethod
+    def _hash_file(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _sweep(self):
+        """Remove uploads abandoned for ``expire_seconds`` (the part file's mtime is the last chunk)"""
+        now = time.monotonic()
+        if now - self._swept_at < self.sweep_seconds:
+            return
+        self._swept_at = now
+        cutoff = time.time() - self.expire_seconds
+        with os.scandir(self.staging_dir) as entries:
+            for entry in entries:
+                if not (entry.is_dir() and UPLOAD_ID_RE.match(entry.name)):
+                    continue
+                try:
+                    last_chunk = os.stat(os.path.join(entry.path, "data.part")).st_mtime
+                except FileNotFoundError:
+                    last_chunk = entry.stat().st_mtime
+                if last_chunk < cutoff:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                    self._hashes.pop(entry.name, None)
+                    CHUNKED_UPLOADS.inc(result="expired")
+                    logger.info(f"Upload {entry.name} removed after {self.expire_seconds / 3600:.0f} h without a chunk")
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Load-test and micro-benchmark suite for the guest flows.
+
+Runs the FastAPI app in-process (via the Starlette test client) against a
+synthetic guests.csv in a throwaway workspace and reports latency
+percentiles as JSON so runs can be compared between commits. Requests are
+issued one at a time by a single client, so ``sequential_rps`` is simply
+1 / mean latency, not the throughput of a loaded server.
+
+The ``startup`` scenario instead launches fresh interpreters and reports
+import time, lifespan (service initialization) time and first-request
+latency separately.
+
+The ``memory`` scenario loads the file once as ``csv.DictReader`` dicts and
+once as compact ``GuestRecord`` objects and reports the bytes each keeps
+resident (measured with tracemalloc) next to the parse time.
+
+Examples:
+    python scripts/benchmark.py --rows 1000 10000 --output bench.json
+    python scripts/benchmark.py --rows 1000 --compare bench.json
+    python scripts/benchmark.py --scenarios startup --startup-runs 10
+    python scripts/benchmark.py --scenarios memory --rows 10000 100000
+"""
+
+import argparse
+import csv
+import gc
+import io
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+
+INSTITUTIONS = [
+    "Kasturba Medical College", "AIIMS Delhi", "CMC Vellore", "JIPMER",
+    "KEM Hospital", "PGIMER Chandigarh", "St. John's Medical College",
+]
+
+HTTP_SCENARIOS = ["guest_login", "register", "guest_dashboard", "admin_guests", "bulk_upload"]
+MICRO_SCENARIOS = ["read_all", "write_all", "find_guest_by_phone"]
+STARTUP_SCENARIOS = ["startup"]
+MEMORY_SCENARIOS = ["memory"]
+WRITE_SCENARIOS = {"register", "bulk_upload", "write_all"}
+
+# Run in a fresh interpreter per sample so imports are really cold
+STARTUP_PROBE = """
+import json, time
+t0 = time.perf_counter()
+import app.main
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+t2 = time.perf_counter()
+with TestClient(app.main.app) as client:
+    t3 = time.perf_counter()
+    status = client.get("/login").status_code
+    t4 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "lifespan": t3 - t2, "first_request": t4 - t3, "status": status}))
+"""
+
+
+def synthetic_guest(i: int, rng: random.Random) -> dict:
+    return {
+        'ID': f"{i:08x}",
+        'Name': f"Guest {i} {rng.choice(['Rao', 'Shetty', 'Iyer', 'Khan', 'Das'])}",
+        'Email': f"guest{i}@example.org",
+        'Institution': rng.choice(INSTITUTIONS),
+        'Phone': str(9000000000 + i),
+        'Field1': rng.choice(["", "Delegate", "Faculty"]),
+        'Field2': "", 'Field3': "", 'Field4': "", 'Field5': "",
+        'CreatedAt': datetime(2025, 9, 1).isoformat(),
+        'UpdatedAt': "",
+    }
+
+
+def write_synthetic_csv(path: str, fieldnames, rows: int, seed: int = 42):
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+        writer.writeheader()
+        for i in range(rows):
+            writer.writerow(synthetic_guest(i, rng))
+
+
+def prepare_workspace(root: str):
+    """Create config.ini and directories so the app runs isolated from the repo data."""
+    for d in ("data/backups", "logs"):
+        os.makedirs(os.path.join(root, d), exist_ok=True)
+    shutil.copytree(os.path.join(REPO_ROOT, "static"), os.path.join(root, "static"),
+                    ignore=shutil.ignore_patterns("uploads"))
+    with open(os.path.join(root, "config.ini"), "w") as f:
+        f.write(
+            "[DEFAULT]\n"
+            "AdminPassword = bench-admin\n"
+            "Debug = False\n\n"
+            "[DATABASE]\n"
+            "CSVPath = ./data/guests.csv\n"
+            "BackupDir = ./data/backups\n\n"
+            "[PATHS]\n"
+            "StaticDir = ./static\n"
+            f"TemplatesDir = {os.path.join(REPO_ROOT, 'templates')}\n"
+            "LogsDir = ./logs\n\n"
+            "[SECURITY]\n"
+            "# Every simulated client shares one address; keep the login limiter out of the way\n"
+            "MaxLoginAttempts = 1000000\n"
+            "MaxAttemptsPerIP = 1000000\n"
+        )
+
+
+def summarize(name: str, rows: int, durations, extra=None) -> dict:
+    durations = sorted(durations)
+    n = len(durations)
+
+    def pct(p):
+        if not durations:
+            return 0.0
+        # Nearest rank: the smallest value with at least p% of samples at or below it
+        return durations[min(n - 1, max(0, math.ceil(p / 100.0 * n) - 1))]
+
+    total = sum(durations)
+    result = {
+        "name": name,
+        "rows": rows,
+        "requests": n,
+        "sequential_rps": round(n / total, 2) if total else 0.0,
+        "mean_ms": round(statistics.mean(durations) * 1000, 3) if n else 0.0,
+        "p50_ms": round(pct(50) * 1000, 3),
+        "p90_ms": round(pct(90) * 1000, 3),
+        "p99_ms": round(pct(99) * 1000, 3),
+        "max_ms": round(durations[-1] * 1000, 3) if n else 0.0,
+    }
+    if extra:
+        result.update(extra)
+    return result
+
+
+def timed(fn, iterations: int):
+    durations = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+class BenchmarkRunner:
+    def __init__(self, args):
+        self.args = args
+        # Imported lazily: the app reads config.ini from the working directory
+        import app.main as app_main
+        from app.routes import simple
+        from app.services.container import init_services
+        from app.services.csv_db import CSVDatabase
+        from app.services.guest_records import GuestRecord
+        from app.services.guests import GUEST_FIELDS
+        from fastapi.testclient import TestClient
+
+        self.simple = simple
+        self.fields = GUEST_FIELDS
+        self.csv_database = CSVDatabase
+        self.record_type = GuestRecord
+        self.services = init_services(app_main.app)
+        self.client = TestClient(app_main.app)
+        self.client.headers["Accept-Encoding"] = args.accept_encoding
+        self.rng = random.Random(args.seed)
+
+    def _session_cookie(self, user_id: str, role: str) -> dict:
+        return {"session_id": self.services.auth.create_session(user_id, role)}
+
+    def _clear_backups(self):
+        backup_dir = self.services.guests_db.backup_dir
+        for name in os.listdir(backup_dir):
+            os.remove(os.path.join(backup_dir, name))
+
+    def _reset(self, rows: int):
+        write_synthetic_csv(self.services.guests_db.file_path, self.fields, rows, self.args.seed)
+        self._clear_backups()
+
+    def _http(self, method, url, cookies=None, **kwargs):
+        self.client.cookies.clear()
+        for k, v in (cookies or {}).items():
+            self.client.cookies.set(k, v)
+        response = self.client.request(method, url, follow_redirects=False, **kwargs)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {url} returned {response.status_code}")
+        return response
+
+    def run_scenario(self, name: str, rows: int) -> dict:
+        iterations = self.args.write_requests if name in WRITE_SCENARIOS else self.args.requests
+        sizes, wire = [], []
+
+        def record(response):
+            sizes.append(len(response.content))
+            wire.append(response.num_bytes_downloaded)
+
+        if name == "guest_login":
+            def op(i):
+                phone = str(9000000000 + self.rng.randrange(rows))
+                record(self._http("POST", "/guest/login", data={"phone": phone}))
+        elif name == "register":
+            def op(i):
+                record(self._http("POST", "/register", data={
+                    "name": f"Bench Guest {i}", "email": f"bench{i}@example.org",
+                    "institution": "Benchmark Institute", "phone": str(8000000000 + i),
+                }))
+        elif name == "guest_dashboard":
+            def op(i):
+                guest_id = f"{self.rng.randrange(rows):08x}"
+                record(self._http("GET", "/guest", cookies=self._session_cookie(guest_id, "guest")))
+        elif name == "admin_guests":
+            admin = self._session_cookie("admin", "admin")
+            iterations = min(iterations, self.args.write_requests)
+
+            def op(i):
+                record(self._http("GET", "/admin/guests", cookies=admin))
+        elif name == "bulk_upload":
+            admin = self._session_cookie("admin", "admin")
+
+            def op(i):
+                buf = io.StringIO()
+                writer = csv.writer(buf)
+                writer.writerow(["Name", "Email", "Institution", "Phone"])
+                for j in range(self.args.bulk_rows):
+                    n = i * self.args.bulk_rows + j
+                    writer.writerow([f"Bulk Guest {n}", f"bulk{n}@example.org", "Bulk Institute", str(7000000000 + n)])
+                payload = buf.getvalue().encode("utf-8")
+                record(self._http("POST", "/admin/bulk_upload", cookies=admin,
+                                  files={"csv_file": ("guests.csv", payload, "text/csv")}))
+        elif name == "read_all":
+            def op(i):
+                self.services.guests_db.read_all()
+        elif name == "write_all":
+            self._reset(rows)
+            data = self.services.guests_db.read_all()
+
+            def op(i):
+                self.services.guests_db.write_all(data, fieldnames=self.fields)
+        elif name == "find_guest_by_phone":
+            def op(i):
+                # Alternate between a random hit and the worst case (last row)
+                idx = rows - 1 if i % 2 else self.rng.randrange(rows)
+                assert self.simple._find_guest_by_phone(self.services, str(9000000000 + idx))
+        else:
+            raise ValueError(f"Unknown scenario {name}")
+
+        self._reset(rows)
+        # One untimed warm-up call so template compilation is not measured
+        op(iterations)
+        self._reset(rows)
+        sizes.clear()
+        wire.clear()
+        durations = timed(op, iterations)
+        extra = {"kind": "http" if name in HTTP_SCENARIOS else "micro"}
+        if sizes:
+            extra["response_bytes_mean"] = int(statistics.mean(sizes))
+            extra["wire_bytes_mean"] = int(statistics.mean(wire))
+        return summarize(name, rows, durations, extra)
+
+
+    def run_memory(self, rows: int) -> list:
+        """Resident bytes and parse time of the guest list as dicts vs GuestRecords."""
+        self._reset(rows)
+        db = self.services.guests_db
+        results = []
+        for name, record_type in (("memory_dict", None), ("memory_record", self.record_type)):
+            store = self.csv_database(db.file_path, db.backup_dir, record_type=record_type)
+            gc.collect()
+            tracemalloc.start()
+            loaded = store.read_all()
+            resident, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            assert len(loaded) == rows
+            del loaded
+            durations = timed(lambda i: store.read_all(), max(1, self.args.write_requests))
+            results.append(summarize(name, rows, durations, {
+                "kind": "memory",
+                "resident_bytes": resident,
+                "peak_bytes": peak,
+                "bytes_per_row": round(resident / rows) if rows else 0,
+            }))
+        return results
+
+    def run_startup(self, rows: int) -> list:
+        """Cold-start samples: one result each for import, lifespan and first request."""
+        self._reset(rows)
+        env = {**os.environ, "PYTHONPATH": REPO_ROOT}
+        samples = []
+        # The first run also writes the precompressed asset cache; keep it out of the numbers
+        for i in range(self.args.startup_runs + 1):
+            out = subprocess.run([sys.executable, "-c", STARTUP_PROBE], cwd=os.getcwd(), env=env,
+                                 capture_output=True, text=True, check=True).stdout
+            sample = json.loads(out.strip().splitlines()[-1])
+            if sample["status"] != 200:
+                raise RuntimeError(f"GET /login returned {sample['status']} during startup probe")
+            if i:
+                samples.append(sample)
+        return [
+            summarize(f"startup_{phase}", rows, [s[phase] for s in samples], {"kind": "startup"})
+            for phase in ("import", "lifespan", "first_request")
+        ]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def _wire_kb(result: dict) -> str:
+    if "wire_bytes_mean" not in result:
+        return "-"
+    return f"{result['wire_bytes_mean'] / 1024:.1f}"
+
+
+def _memory_kb(result: dict) -> str:
+    if "resident_bytes" not in result:
+        return ""
+    return f" resident={result['resident_bytes'] / 1024:.0f}KB ({result['bytes_per_row']} B/row)"
+
+
+def compare(results: list, baseline_path: str, threshold: float) -> bool:
+    """Print per-scenario deltas against a baseline file; return True if any regressed."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["name"], r["rows"]): r for r in json.load(f)["results"]}
+    regressed = False
+    print(f"\n{'scenario':<22}{'rows':>8}{'p50 ms':>12}{'Δp50':>9}{'p99 ms':>12}{'Δp99':>9}{'wire KB':>10}")
+    for r in results:
+        base = baseline.get((r["name"], r["rows"]))
+        if not base:
+            print(f"{r['name']:<22}{r['rows']:>8}{r['p50_ms']:>12}{'new':>9}{r['p99_ms']:>12}{'new':>9}{_wire_kb(r):>10}")
+            continue
+        deltas = []
+        for key in ("p50_ms", "p99_ms"):
+            delta = (r[key] - base[key]) / base[key] if base[key] else 0.0
+            deltas.append(delta)
+            if delta > threshold:
+                regressed = True
+        flag = "  REGRESSION" if max(deltas) > threshold else ""
+        print(f"{r['name']:<22}{r['rows']:>8}{r['p50_ms']:>12}{deltas[0]:>+9.1%}{r['p99_ms']:>12}{deltas[1]:>+9.1%}{_wire_kb(r):>10}{flag}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000],
+                        help="guests.csv sizes to benchmark (e.g. 1000 10000 100000)")
+    parser.add_argument("--requests", type=int, default=200, help="iterations for read-only scenarios")
+    parser.add_argument("--write-requests", type=int, default=20,
+                        help="iterations for scenarios that rewrite the CSV or render every guest")
+    parser.add_argument("--bulk-rows", type=int, default=200, help="rows per bulk upload request")
+    parser.add_argument("--scenarios", nargs="+", choices=HTTP_SCENARIOS + MICRO_SCENARIOS + STARTUP_SCENARIOS + MEMORY_SCENARIOS,
+                        default=HTTP_SCENARIOS + MICRO_SCENARIOS + STARTUP_SCENARIOS + MEMORY_SCENARIOS)
+    parser.add_argument("--startup-runs", type=int, default=5, help="fresh interpreters per startup sample")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--accept-encoding", default="gzip, br",
+                        help="Accept-Encoding sent with HTTP scenarios ('identity' disables compression)")
+    parser.add_argument("--output", help="write JSON results to this file (default: stdout)")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare against a previous JSON result")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative p50/p99 increase treated as a regression (default 0.2)")
+    parser.add_argument("--keep-workspace", action="store_true")
+    args = parser.parse_args(argv)
+
+    workspace = tempfile.mkdtemp(prefix="guest-bench-")
+    prepare_workspace(workspace)
+    cwd = os.getcwd()
+    os.chdir(workspace)
+    try:
+        runner = BenchmarkRunner(args)
+        logging.getLogger().setLevel(logging.WARNING)
+        results = []
+        for rows in args.rows:
+            for name in args.scenarios:
+                if name in STARTUP_SCENARIOS:
+                    batch = runner.run_startup(rows)
+                elif name in MEMORY_SCENARIOS:
+                    batch = runner.run_memory(rows)
+                else:
+                    batch = [runner.run_scenario(name, rows)]
+                for result in batch:
+                    results.append(result)
+                    print(f"{result['name']:<22} rows={rows:<7} p50={result['p50_ms']:.2f}ms "
+                          f"p99={result['p99_ms']:.2f}ms {result['sequential_rps']:.1f} req/s sequential "
+                          f"wire={_wire_kb(result)}KB{_memory_kb(result)}", file=sys.stderr)
+    finally:
+        os.chdir(cwd)
+        if not args.keep_workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
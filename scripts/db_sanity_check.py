@@ -1,53 +1,396 @@
+#!/usr/bin/env python3
+"""
+Streaming integrity checker and repair tool for guests.csv.
+
+Reads the file row by row (memory grows only with the ID and phone hash
+sets) and checks it against GUEST_FIELDS:
+
+    header          missing or unknown columns
+    malformed_row   wrong number of fields
+    encoding        bytes that are not valid UTF-8, NUL bytes, mojibake
+    missing_id      empty ID
+    duplicate_id    ID already used by an earlier row
+    duplicate_phone normalized phone already used by an earlier row
+    phone           phone that is empty/too short, or not stored normalized
+    email           malformed email address
+    version         Version that is neither empty (legacy rows) nor a positive integer
+    orphaned_upload static/uploads/<id>/ with no matching guest
+
+With --repair a cleaned copy is streamed to a temp file next to the CSV
+and swapped in atomically (after a backup) only if nothing wrote to the
+file meanwhile, so it is safe to run while the app is serving. Rows that
+cannot be kept (exact duplicates, later rows reusing a phone) go to a
+rejects file instead of being dropped silently.
+
+Examples:
+    python scripts/db_sanity_check.py
+    python scripts/db_sanity_check.py --repair
+    python scripts/db_sanity_check.py --csv /tmp/guests.csv --repair --output /tmp/clean.csv --json
+    python scripts/db_sanity_check.py --quarantine-orphans ./data/orphaned_uploads
+"""
+
+import argparse
 import csv
+import json
 import os
-from app.config import Config
-from app.services.csv_db import CSVDatabase
-from app.models.guest import Guest
-from app.utils.helpers import generate_unique_id
-
-
-def run_sanity_check():
-    config = Config()
-    csv_path = config.get('DATABASE', 'CSVPath')
-    backup_dir = config.get('DATABASE', 'BackupDir')
-    db = CSVDatabase(csv_path, backup_dir)
-
-    # Determine required headers and defaults from Guest model
-    default_guest = Guest()
-    required_fields = list(default_guest.to_dict().keys())
-    default_values = default_guest.to_dict()
-
-    data = db.read_all()
-    updated = False
-    cleaned_rows = []
-    seen_ids = set()
-
-    for row in data:
-        # Remove unknown columns
-        row = {k: v for k, v in row.items() if k in required_fields}
-
-        # Add missing columns with defaults
-        for field in required_fields:
-            if field not in row or row[field] is None:
-                row[field] = default_values[field]
-                updated = True
-
-        # Ensure ID uniqueness (skip empty or duplicate)
-        gid = row.get('ID')
-        if not gid or gid in seen_ids:
-            # Generate a new ID if missing or duplicate
-            row['ID'] = generate_unique_id(list(seen_ids))
-            updated = True
-        seen_ids.add(row['ID'])
-
-        cleaned_rows.append(row)
-
-    if updated:
-        db.write_all(cleaned_rows, fieldnames=required_fields)
-        print(f"Database sanitized. {len(cleaned_rows)} records updated.")
+import re
+import shutil
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+
+from app.services.guests import GUEST_FIELDS, EMAIL_RE, normalize_phone  # noqa: E402
+from app.services.guest_stats import SHARED_UPLOAD_DIRS  # noqa: E402
+
+# Undecodable bytes survive reading as lone surrogates (errors='surrogateescape')
+SURROGATES_RE = re.compile("[\udc80-\udcff]+")
+# UTF-8 text that was decoded as cp1252 somewhere along the way ("Ã©", "â€“")
+MOJIBAKE_RE = re.compile("Ã.|Â.|â€")
+
+
+class Report:
+    def __init__(self, max_examples: int):
+        self.max_examples = max_examples
+        self.issues = Counter()
+        self.repaired = Counter()
+        self.examples = {}
+        self.rows = 0
+        self.rejected = 0
+
+    def issue(self, kind: str, line: int, detail: str, repaired: bool = False):
+        self.issues[kind] += 1
+        if repaired:
+            self.repaired[kind] += 1
+        examples = self.examples.setdefault(kind, [])
+        if len(examples) < self.max_examples:
+            examples.append({"line": line, "detail": detail, "repaired": repaired})
+
+
+def _fix_encoding(value: str):
+    """Return (fixed value, list of problems found)."""
+    problems = []
+    if "\x00" in value:
+        problems.append("NUL byte")
+        value = value.replace("\x00", "")
+    if SURROGATES_RE.search(value):
+        problems.append("invalid UTF-8")
+        # Spreadsheet exports are usually cp1252; decode the stray bytes that way
+        value = SURROGATES_RE.sub(
+            lambda m: m.group().encode("utf-8", "surrogateescape").decode("cp1252", "replace"), value
+        )
+    if MOJIBAKE_RE.search(value):
+        try:
+            fixed = value.encode("cp1252").decode("utf-8")
+        except UnicodeError:
+            fixed = None
+        if fixed and fixed != value:
+            problems.append("mojibake")
+            value = fixed
+    return value, problems
+
+
+def _new_id(seen_ids) -> str:
+    while True:
+        guest_id = uuid.uuid4().hex[:8]
+        if guest_id not in seen_ids:
+            return guest_id
+
+
+def check_rows(reader, fieldnames, report: Report, writer=None, rejects=None, progress=0):
+    """Stream rows from the ``csv.reader``; write repaired rows to ``writer`` when given. Returns the ID set."""
+    seen_ids = {}  # ID -> hash of the row's values, to tell exact duplicates apart
+    seen_phones = set()
+    for values in _progress(reader, progress):
+        # Physical line the record ends on; quoted fields may span several lines
+        line_no = reader.line_num
+        report.rows += 1
+        if len(values) != len(fieldnames):
+            report.issue("malformed_row", line_no, f"{len(values)} fields, header has {len(fieldnames)}",
+                         repaired=writer is not None)
+            values = (values + [""] * len(fieldnames))[:len(fieldnames)]
+        raw = dict(zip(fieldnames, values))
+        row = {}
+        for field in GUEST_FIELDS:
+            value, problems = _fix_encoding(raw.get(field) or "")
+            if problems:
+                report.issue("encoding", line_no, f"{field}: {', '.join(problems)}", repaired=writer is not None)
+            row[field] = value
+
+        phone = normalize_phone(row["Phone"])
+        if phone != row["Phone"]:
+            report.issue("phone", line_no, f"phone not normalized: {row['Phone']!r}", repaired=writer is not None)
+            row["Phone"] = phone
+        if len(phone) < 7:
+            report.issue("phone", line_no, f"invalid phone {phone!r}")
+
+        email = row["Email"].strip()
+        if not EMAIL_RE.match(email):
+            report.issue("email", line_no, f"malformed email {row['Email']!r}")
+        elif email != row["Email"]:
+            report.issue("email", line_no, "whitespace around email", repaired=writer is not None)
+            row["Email"] = email
+
+        version = row["Version"]
+        # Empty is the normal state of rows written before versioning (read as version 0)
+        if version and (not version.isdigit() or int(version) < 1):
+            report.issue("version", line_no, f"invalid Version {version!r}", repaired=writer is not None)
+            row["Version"] = "1"
+
+        guest_id = row["ID"].strip()
+        fingerprint = hash(tuple(row.values()))
+        if guest_id in seen_ids and seen_ids[guest_id] == fingerprint:
+            report.issue("duplicate_id", line_no, f"{guest_id}: exact duplicate row", repaired=rejects is not None)
+            if rejects is not None:
+                rejects.writerow({**row, "Reason": "duplicate_row"})
+                report.rejected += 1
+            continue
+        if len(phone) >= 7 and phone in seen_phones:
+            # Login matches the first row with a phone, so later ones are unreachable
+            report.issue("duplicate_phone", line_no, f"phone ...{phone[-4:]} already registered",
+                         repaired=rejects is not None)
+            if rejects is not None:
+                rejects.writerow({**row, "Reason": "duplicate_phone"})
+                report.rejected += 1
+                continue
+        seen_phones.add(phone)
+
+        if not guest_id:
+            row["ID"] = _new_id(seen_ids)
+            report.issue("missing_id", line_no, f"assigned {row['ID']}", repaired=writer is not None)
+        elif guest_id in seen_ids:
+            row["ID"] = _new_id(seen_ids)
+            report.issue("duplicate_id", line_no, f"{guest_id} reused; assigned {row['ID']}",
+                         repaired=writer is not None)
+        seen_ids[row["ID"]] = fingerprint
+        if writer is not None:
+            writer.writerow(row)
+    return set(seen_ids)
+
+
+def _read_ids(path: str) -> set:
+    with open(path, newline="", encoding="utf-8-sig", errors="surrogateescape") as f:
+        return {(row.get("ID") or "").strip() for row in csv.DictReader(f)}
+
+
+def quarantine_orphans(args, orphans, ids, ids_stat):
+    """Move orphaned upload dirs into a timestamped dir; returns (moved paths, target dir).
+
+    A guest who registered after the scan has an upload dir but was not in
+    ``ids``, so each ID is checked again against the current file (re-read
+    whenever it changed) right before its dir is moved.
+    """
+    target = os.path.join(args.quarantine_orphans, datetime.now().strftime("%Y%m%d%H%M%S"))
+    known = set(ids)
+    moved = []
+    for path in orphans:
+        stat = _file_stat(args.csv)
+        if stat != ids_stat:
+            known |= _read_ids(args.csv)
+            ids_stat = stat
+        if os.path.basename(path) in known:
+            continue
+        os.makedirs(target, exist_ok=True)
+        shutil.move(path, os.path.join(target, os.path.basename(path)))
+        moved.append(path)
+    return moved, target
+
+
+def find_orphans(upload_root: str, ids) -> list:
+    orphans = []
+    try:
+        with os.scandir(upload_root) as entries:
+            for entry in entries:
+                if entry.is_dir() and entry.name not in SHARED_UPLOAD_DIRS and entry.name not in ids:
+                    orphans.append(entry.path)
+    except FileNotFoundError:
+        pass
+    return sorted(orphans)
+
+
+def run(args) -> dict:
+    report = Report(args.max_examples)
+    size = os.path.getsize(args.csv)
+    start_stat = _file_stat(args.csv)
+    started = time.perf_counter()
+    out_path = args.output or args.csv
+    tmp_path = f"{out_path}.repair.tmp"
+    rejects_path = f"{out_path}.rejects.csv"
+    writer = rejects = None
+    out_file = rejects_file = None
+
+    with open(args.csv, newline="", encoding="utf-8-sig", errors="surrogateescape") as f:
+        reader = csv.reader(f)
+        try:
+            header = next(reader)
+        except StopIteration:
+            header = []
+        missing = [h for h in GUEST_FIELDS if h not in header]
+        unknown = [h for h in header if h not in GUEST_FIELDS]
+        if missing:
+            report.issue("header", 1, f"missing columns: {', '.join(missing)}", repaired=args.repair)
+        if unknown:
+            report.issue("header", 1, f"unknown columns dropped on repair: {', '.join(unknown)}", repaired=args.repair)
+        try:
+            if args.repair:
+                out_file = open(tmp_path, "w", newline="", encoding="utf-8")
+                writer = csv.DictWriter(out_file, fieldnames=GUEST_FIELDS)
+                writer.writeheader()
+                rejects_file = open(rejects_path, "w", newline="", encoding="utf-8")
+                rejects = csv.DictWriter(rejects_file, fieldnames=GUEST_FIELDS + ["Reason"])
+                rejects.writeheader()
+            ids = check_rows(reader, header, report, writer, rejects, args.progress)
+        except csv.Error as e:
+            report.issue("malformed_row", reader.line_num, f"unparseable CSV: {e}")
+            ids = None
+        finally:
+            for handle in (out_file, rejects_file):
+                if handle is not None:
+                    handle.close()
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "file": args.csv,
+        "rows": report.rows,
+        "bytes": size,
+        "elapsed_s": round(elapsed, 3),
+        "rows_per_s": round(report.rows / elapsed, 1) if elapsed else 0.0,
+        "mb_per_s": round(size / 1e6 / elapsed, 2) if elapsed else 0.0,
+        "issues": dict(report.issues),
+        "examples": report.examples,
+        "orphaned_uploads": [],
+    }
+
+    if ids is not None and os.path.isdir(args.uploads):
+        orphans = find_orphans(args.uploads, ids)
+        if orphans and args.quarantine_orphans:
+            orphans, target = quarantine_orphans(args, orphans, ids, start_stat)
+            report.repaired["orphaned_upload"] += len(orphans)
+            if orphans:
+                result["orphans_moved_to"] = target
+        result["orphaned_uploads"] = orphans
+        if orphans:
+            report.issues["orphaned_upload"] += len(orphans)
+            result["issues"] = dict(report.issues)
+
+    if args.repair:
+        result.update(_install(args, ids, tmp_path, rejects_path, out_path, start_stat, report))
+    elif report.repaired:
+        result["repaired"] = dict(report.repaired)
+    return result
+
+
+def _install(args, ids, tmp_path, rejects_path, out_path, start_stat, report) -> dict:
+    if report.rejected == 0 and os.path.exists(rejects_path):
+        os.remove(rejects_path)
+    outcome = {"repaired": dict(report.repaired), "rejected": report.rejected}
+    csv_repairs = sum(n for kind, n in report.repaired.items() if kind != "orphaned_upload")
+    if report.rejected:
+        outcome["rejects_file"] = rejects_path
+    if ids is None:
+        os.remove(tmp_path)
+        outcome["repair"] = "skipped: file could not be parsed"
+        return outcome
+    if out_path != args.csv:
+        os.replace(tmp_path, out_path)
+        outcome["repair"] = f"written to {out_path}"
+        return outcome
+    if not csv_repairs:
+        os.remove(tmp_path)
+        outcome["repair"] = "nothing to repair"
+        return outcome
+    # In place: go through the store's lock, and only if no one wrote meanwhile
+    from app.services.csv_db import CSVDatabase
+    from app.services.history import ChangeLog, set_actor
+    db = CSVDatabase(args.csv, args.backup_dir)
+    # Repairs show up in each guest's history like any other change
+    ChangeLog(db, args.history_log)
+    set_actor("db_sanity_check")
+    if db.install(tmp_path, start_stat):
+        outcome["repair"] = "installed (previous file backed up)"
+    else:
+        os.remove(tmp_path)
+        outcome["repair"] = "aborted: file changed while checking; run again"
+    return outcome
+
+
+def _file_stat(path):
+    st = os.stat(path)
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _progress(reader, every: int):
+    if not every:
+        yield from reader
+        return
+    started = time.perf_counter()
+    for i, row in enumerate(reader, start=1):
+        if i % every == 0:
+            elapsed = time.perf_counter() - started
+            print(f"  {i} rows, {i / elapsed:,.0f} rows/s", file=sys.stderr)
+        yield row
+
+
+def print_report(result: dict):
+    print(f"{result['file']}: {result['rows']} rows, {result['bytes'] / 1e6:.1f} MB in {result['elapsed_s']}s "
+          f"({result['rows_per_s']:,.0f} rows/s, {result['mb_per_s']} MB/s)")
+    if not result["issues"]:
+        print("OK: no integrity problems found")
+    for kind, count in sorted(result["issues"].items()):
+        fixed = result.get("repaired", {}).get(kind, 0)
+        print(f"{kind:<16} {count:>8}" + (f"  ({fixed} repaired)" if fixed else ""))
+        for example in result["examples"].get(kind, []):
+            print(f"    line {example['line']}: {example['detail']}")
+    for path in result["orphaned_uploads"][:20]:
+        print(f"    orphaned: {path}")
+    if "orphans_moved_to" in result:
+        print(f"orphaned upload dirs moved to {result['orphans_moved_to']}")
+    if "repair" in result:
+        print(f"repair: {result['repair']}")
+        if result.get("rejects_file"):
+            print(f"{result['rejected']} rows written to {result['rejects_file']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", default="config.ini", help="config file for default paths")
+    parser.add_argument("--csv", help="guests CSV (default: DATABASE.CSVPath)")
+    parser.add_argument("--uploads", help="guest upload root (default: PATHS.StaticDir/uploads)")
+    parser.add_argument("--backup-dir", help="backup dir for in-place repair (default: DATABASE.BackupDir)")
+    parser.add_argument("--history-log", help="change log for in-place repair (default: HISTORY.LogPath)")
+    parser.add_argument("--repair", action="store_true", help="write a repaired file")
+    parser.add_argument("--output", help="write the repaired file here instead of replacing --csv")
+    parser.add_argument("--quarantine-orphans", metavar="DIR", help="move orphaned upload dirs into DIR")
+    parser.add_argument("--max-examples", type=int, default=5, help="example lines reported per issue kind")
+    parser.add_argument("--progress", type=int, default=0, metavar="N", help="print throughput every N rows")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    if not (args.csv and args.uploads and args.backup_dir and args.history_log):
+        from app.config import Config
+        config = Config(args.config)
+        args.csv = args.csv or config.get('DATABASE', 'CSVPath')
+        args.uploads = args.uploads or os.path.join(config.get('PATHS', 'StaticDir'), 'uploads')
+        args.backup_dir = args.backup_dir or config.get('DATABASE', 'BackupDir')
+        args.history_log = args.history_log or config.get('HISTORY', 'LogPath', fallback='./data/guests_history.jsonl')
+    if not os.path.exists(args.csv):
+        print(f"{args.csv} does not exist", file=sys.stderr)
+        return 2
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
     else:
-        print("Database is already consistent. No changes made.")
+        print_report(result)
+    if result.get("repair", "").startswith("aborted"):
+        return 2
+    unrepaired = sum(result["issues"].values()) - sum(result.get("repaired", {}).values())
+    return 1 if unrepaired else 0
 
 
-if __name__ == '__main__':
-    run_sanity_check()
+if __name__ == "__main__":
+    sys.exit(main())
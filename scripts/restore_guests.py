@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Rebuild guests.csv as it was at a point in time.
+
+Starts from the newest full backup in DATABASE.BackupDir taken before
+--at and replays the per-row change log (HISTORY.LogPath) up to --at, so
+only one backup is read however many exist. Without --output or
+--install it only reports what the restore would change.
+
+With --install the rebuilt table replaces the live file through the
+store's lock (after a backup, and only if nothing wrote meanwhile), and
+the restore itself is recorded in the change log, so it can be undone
+the same way. If no backup predates --at, the table is rebuilt from the
+change log alone and lacks every guest created before logging began, so
+--install refuses unless --force is given.
+
+Examples:
+    python scripts/restore_guests.py --at "2026-10-18 14:00"
+    python scripts/restore_guests.py --at 2026-10-18T14:00:00 --output /tmp/guests_at_14.csv
+    python scripts/restore_guests.py --at "2026-10-18 14:00" --install
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPO_ROOT)
+
+from app.services.csv_db import CSVDatabase, row_version  # noqa: E402
+from app.services.history import ChangeLog, rebuild, row_diff, set_actor  # noqa: E402
+
+
+def _write_csv(path: str, fieldnames, rows):
+    with open(path, mode="w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _compare(current_rows, rows, key_field: str) -> dict:
+    current = {row.get(key_field): row for row in current_rows}
+    counts = {"added": 0, "changed": 0, "removed": 0}
+    for row in rows:
+        old = current.pop(row.get(key_field), None)
+        if old is None:
+            counts["added"] += 1
+        elif row_diff(old, row)[1]:
+            counts["changed"] += 1
+    counts["removed"] = len(current)
+    return counts
+
+
+def _bump_versions(current_rows, rows, key_field: str, version_field: str = "Version"):
+    """Give rows the restore changes a version above the current one, so edit forms opened before it conflict"""
+    current = {row.get(key_field): row for row in current_rows}
+    for row in rows:
+        old = current.get(row.get(key_field))
+        if old is not None and set(row_diff(old, row)[1]) - {version_field}:
+            row[version_field] = str(max(row_version(row, version_field), row_version(old, version_field)) + 1)
+
+
+def run(args) -> dict:
+    started = time.perf_counter()
+    db = CSVDatabase(args.csv, args.backup_dir)
+    start_stat = db.file_stat()
+    rebuilt = rebuild(args.log, args.backup_dir, args.at, db.key_field)
+    current_rows = db.read_all()
+    result = {
+        "at": args.at.isoformat(sep=" "),
+        "snapshot": rebuilt["snapshot"],
+        "replayed": rebuilt["replayed"],
+        "rows": len(rebuilt["rows"]),
+        "compared_to_current": _compare(current_rows, rebuilt["rows"], db.key_field),
+    }
+    _bump_versions(current_rows, rebuilt["rows"], db.key_field, db.version_field)
+    if rebuilt["snapshot"] is None:
+        result["warning"] = "no backup before --at; rebuilt from the change log alone"
+    if args.output:
+        _write_csv(args.output, rebuilt["fieldnames"], rebuilt["rows"])
+        result["restore"] = f"written to {args.output}"
+    elif args.install and rebuilt["snapshot"] is None and not args.force:
+        result["restore"] = ("refused: without a backup before --at, guests created before the change log "
+                             "began would be deleted; check it with --output, then use --install --force")
+    elif args.install:
+        tmp_path = f"{args.csv}.restore.tmp"
+        _write_csv(tmp_path, rebuilt["fieldnames"], rebuilt["rows"])
+        ChangeLog(db, args.log)
+        set_actor("restore")
+        if db.install(tmp_path, start_stat):
+            result["restore"] = "installed (previous file backed up)"
+        else:
+            os.remove(tmp_path)
+            result["restore"] = "aborted: file changed while rebuilding; run again"
+    result["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def _parse_time(value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not an ISO date/time: {value!r}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--at", required=True, type=_parse_time, help="point in time, e.g. '2026-10-18 14:00'")
+    parser.add_argument("--config", default="config.ini", help="config file for default paths")
+    parser.add_argument("--csv", help="guests CSV (default: DATABASE.CSVPath)")
+    parser.add_argument("--backup-dir", help="full backups (default: DATABASE.BackupDir)")
+    parser.add_argument("--log", help="change log (default: HISTORY.LogPath)")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--output", help="write the rebuilt table here")
+    target.add_argument("--install", action="store_true", help="replace the live CSV with the rebuilt table")
+    parser.add_argument("--force", action="store_true", help="install even if no backup predates --at")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args(argv)
+
+    if not (args.csv and args.backup_dir and args.log):
+        from app.config import Config
+        config = Config(args.config)
+        args.csv = args.csv or config.get('DATABASE', 'CSVPath')
+        args.backup_dir = args.backup_dir or config.get('DATABASE', 'BackupDir')
+        args.log = args.log or config.get('HISTORY', 'LogPath', fallback='./data/guests_history.jsonl')
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{args.csv} as of {result['at']}: {result['rows']} rows "
+              f"(snapshot {result['snapshot'] or 'none'}, {result['replayed']} changes replayed, {result['elapsed_s']}s)")
+        compared = result["compared_to_current"]
+        print(f"vs. current file: {compared['added']} rows to bring back, {compared['changed']} to change, "
+              f"{compared['removed']} to remove")
+        if "warning" in result:
+            print(f"warning: {result['warning']}")
+        if "restore" in result:
+            print(f"restore: {result['restore']}")
+    return 2 if result.get("restore", "").startswith(("aborted", "refused")) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
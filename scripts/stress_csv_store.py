@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Multi-process write-contention stress test for the CSV guest store.
+
+Spawns N worker processes that hammer one guests.csv with a mix of
+registrations, edits and full reads, then verifies the final file:
+no lost or duplicated rows, no corrupted rows, and no lost updates
+(each row's Version must equal its initial version plus the number of
+edits that workers saw succeed). Lock wait distributions, timeouts and
+version conflicts are reported per run.
+
+Modes:
+    store   call CSVDatabase.append/update/read_all directly (default)
+    legacy  read_all -> modify -> write_all, the pre-versioning pattern
+    app     drive the ASGI app (/register, /guest/update, admin edits)
+
+Examples:
+    python scripts/stress_csv_store.py --workers 8 --ops 200
+    python scripts/stress_csv_store.py --mode app --workers 4 --ops 50 --rows 5000
+    python scripts/stress_csv_store.py --mode legacy --workers 4   # expect lost updates
+    python scripts/stress_csv_store.py --stale-lock   # start behind a lock left by a killed writer
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(SCRIPTS_DIR)
+sys.path.append(REPO_ROOT)
+sys.path.append(SCRIPTS_DIR)
+
+from benchmark import prepare_workspace, write_synthetic_csv  # noqa: E402
+
+
+def _worker_phone(worker: int, i: int) -> str:
+    return f"6{worker:03d}{i:06d}"
+
+
+def _run_store_ops(worker, args, db, fields, rng, result):
+    from app.services.csv_db import VersionConflictError, row_version
+
+    for i in range(args.ops):
+        roll = rng.random()
+        start = time.perf_counter()
+        try:
+            if roll < args.register_ratio:
+                record = {f: "" for f in fields}
+                record.update({
+                    'ID': f"w{worker:03d}{i:05d}", 'Name': f"Stress {worker}-{i}",
+                    'Email': f"s{worker}-{i}@example.org", 'Institution': "Stress Institute",
+                    'Phone': _worker_phone(worker, i), 'CreatedAt': time.strftime("%Y-%m-%dT%H:%M:%S"),
+                })
+                if args.mode == "legacy":
+                    rows = db.read_all()
+                    rows.append({**record, 'Version': "1"})
+                    db.write_all(rows, fieldnames=fields)
+                    result["added"].append(record['ID'])
+                else:
+                    added = db.append([record], fieldnames=fields, unique_by=lambda r: r.get('Phone', ''))
+                    result["added"].extend(r['ID'] for r in added)
+                result["ops"]["register"] += 1
+            elif roll < args.register_ratio + args.update_ratio:
+                target = f"{rng.randrange(args.rows):08x}"
+                marker = f"w{worker}-{i}"
+                if args.mode == "legacy":
+                    rows = db.read_all()
+                    for row in rows:
+                        if row['ID'] == target:
+                            row['Field5'] = marker
+                            row['Version'] = str(row_version(row) + 1)
+                    db.write_all(rows, fieldnames=fields)
+                else:
+                    # Read-then-CAS like a form round trip; retry on conflict
+                    for _attempt in range(5):
+                        current = next((r for r in db.read_all() if r['ID'] == target), None)
+                        try:
+                            db.update(target, {'Field5': marker}, expected_version=row_version(current), fieldnames=fields)
+                            break
+                        except VersionConflictError:
+                            result["conflicts"] += 1
+                    else:
+                        result["gave_up"] += 1
+                        continue
+                result["updates"][target] += 1
+                result["ops"]["update"] += 1
+            else:
+                rows = db.read_all()
+                if any(len(r) != len(fields) or None in r for r in rows):
+                    result["corrupt_reads"] += 1
+                result["ops"]["read"] += 1
+        except TimeoutError:
+            result["timeouts"] += 1
+        result["latencies"].append(time.perf_counter() - start)
+
+
+def _run_app_ops(worker, args, fields, rng, result):
+    from fastapi.testclient import TestClient
+    import app.main as app_main
+    from app.services.container import init_services
+
+    client = TestClient(app_main.app)
+    admin_sid = init_services(app_main.app).auth.create_session("admin", "admin")
+    my_guests = []  # (phone, session id)
+    for i in range(args.ops):
+        roll = rng.random()
+        start = time.perf_counter()
+        client.cookies.clear()
+        if roll < args.register_ratio or not my_guests:
+            phone = _worker_phone(worker, i)
+            r = client.post("/register", data={
+                "name": f"Stress {worker}-{i}", "email": f"s{worker}-{i}@example.org",
+                "institution": "Stress Institute", "phone": phone,
+            }, follow_redirects=False)
+            if r.status_code == 303:
+                result["added_phones"].append(phone)
+                my_guests.append((phone, r.cookies.get("session_id")))
+            elif r.status_code == 503:
+                result["timeouts"] += 1
+            result["ops"]["register"] += 1
+        elif roll < args.register_ratio + args.update_ratio / 2:
+            phone, sid = rng.choice(my_guests)
+            client.cookies.set("session_id", sid)
+            r = client.post("/guest/update", data={
+                "name": f"Stress {worker}-{i}", "email": f"s{worker}-{i}@example.org",
+                "institution": "Stress Institute Edited",
+            }, follow_redirects=False)
+            if r.status_code == 303:
+                result["updates"]["phone:" + phone] += 1
+            elif r.status_code == 503:
+                result["timeouts"] += 1
+            result["ops"]["guest_update"] += 1
+        elif roll < args.register_ratio + args.update_ratio:
+            target = f"{rng.randrange(args.rows):08x}"
+            client.cookies.set("session_id", admin_sid)
+            r = client.post(f"/admin/guest/{target}/update", data={
+                "name": f"Seed {target}", "email": f"{target}@example.org",
+                "institution": "Seed Institute", "phone": str(9000000000 + int(target, 16)),
+            }, follow_redirects=False)
+            if r.status_code == 303:
+                result["updates"][target] += 1
+            elif r.status_code == 503:
+                result["timeouts"] += 1
+            result["ops"]["admin_update"] += 1
+        else:
+            client.cookies.set("session_id", admin_sid)
+            r = client.get("/admin/guests")
+            result["ops"]["admin_list"] += 1
+        result["latencies"].append(time.perf_counter() - start)
+
+
+def crashed_writer(workspace: str):
+    """Take the store's lock file and die without releasing it, like a killed worker"""
+    os.chdir(workspace)
+    sys.path.insert(0, REPO_ROOT)
+    from app.services import file_lock
+
+    file_lock.acquire("./data/guests.csv.lock", 1.0, 0.02, 30.0)
+    os._exit(1)
+
+
+def worker_main(worker: int, workspace: str, args, queue):
+    os.chdir(workspace)
+    sys.path.insert(0, REPO_ROOT)
+    import logging
+    logging.disable(logging.WARNING)
+    from app.services.csv_db import CSVDatabase
+    from app.services.metrics import metrics
+
+    result = {
+        "worker": worker, "ops": Counter(), "added": [], "added_phones": [], "updates": Counter(),
+        "timeouts": 0, "conflicts": 0, "gave_up": 0, "corrupt_reads": 0, "latencies": [],
+    }
+    rng = random.Random(args.seed + worker)
+    fields = args.fields
+    try:
+        if args.mode == "app":
+            _run_app_ops(worker, args, fields, rng, result)
+        else:
+            db = CSVDatabase("./data/guests.csv", "./data/backups")
+            _run_store_ops(worker, args, db, fields, rng, result)
+    except Exception as e:  # reported, not raised: the parent still verifies the file
+        result["error"] = f"{type(e).__name__}: {e}"
+    wait = metrics.get("csv_lock_wait_seconds")
+    timeouts = metrics.get("csv_lock_timeouts_total")
+    takeovers = metrics.get("lock_file_takeovers_total")
+    result["lock_wait"] = {op: wait.snapshot(store="guests.csv", op=op) for op in ("write", "read")} if wait else {}
+    result["lock_timeouts"] = {op: timeouts.value(store="guests.csv", op=op) for op in ("write", "read")} if timeouts else {}
+    result["lock_takeovers"] = takeovers.value(lock="guests.csv.lock") if takeovers else 0
+    queue.put(result)
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+def verify(path: str, fields, seed_rows: int, results) -> dict:
+    """Check the final CSV against what workers saw succeed."""
+    problems = []
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        header = reader.fieldnames or []
+        rows = list(reader)
+    if header != list(fields):
+        problems.append(f"header mismatch: {header}")
+    corrupt = [r.get('ID') for r in rows if None in r or any(v is None for v in r.values())]
+    if corrupt:
+        problems.append(f"{len(corrupt)} malformed rows (e.g. {corrupt[:3]})")
+
+    ids = Counter(r['ID'] for r in rows)
+    phones = Counter(r['Phone'] for r in rows)
+    dup_ids = [k for k, n in ids.items() if n > 1]
+    dup_phones = [k for k, n in phones.items() if n > 1]
+    if dup_ids:
+        problems.append(f"{len(dup_ids)} duplicated IDs (e.g. {dup_ids[:3]})")
+    if dup_phones:
+        problems.append(f"{len(dup_phones)} duplicated phones (e.g. {dup_phones[:3]})")
+
+    missing_seed = [f"{i:08x}" for i in range(seed_rows) if f"{i:08x}" not in ids]
+    added = [i for r in results for i in r["added"]]
+    added_phones = [p for r in results for p in r["added_phones"]]
+    lost = [i for i in added if i not in ids] + [p for p in added_phones if p not in phones]
+    if missing_seed:
+        problems.append(f"{len(missing_seed)} seed rows lost")
+    if lost:
+        problems.append(f"{len(lost)} acknowledged registrations lost (e.g. {lost[:3]})")
+
+    expected = Counter()
+    for r in results:
+        expected.update(r["updates"])
+    by_id = {r['ID']: r for r in rows}
+    by_phone = {r['Phone']: r for r in rows}
+    lost_updates = 0
+    for key, n in expected.items():
+        row = by_phone.get(key[6:]) if key.startswith("phone:") else by_id.get(key)
+        if row is None:
+            continue
+        version = int(row.get('Version') or 0)
+        if version < 1 + n:
+            lost_updates += (1 + n) - version
+    if lost_updates:
+        problems.append(f"{lost_updates} acknowledged updates lost")
+    return {"rows": len(rows), "problems": problems}
+
+
+def merge_lock_waits(results):
+    merged = {}
+    for r in results:
+        for op, snap in r.get("lock_wait", {}).items():
+            m = merged.setdefault(op, {"count": 0, "sum": 0.0, "buckets": Counter()})
+            m["count"] += snap["count"]
+            m["sum"] += snap["sum"]
+            for bound, n in snap["buckets"].items():
+                m["buckets"][bound] += n
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["store", "legacy", "app"], default="store")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--ops", type=int, default=100, help="operations per worker")
+    parser.add_argument("--rows", type=int, default=1000, help="seed rows in guests.csv")
+    parser.add_argument("--register-ratio", type=float, default=0.4)
+    parser.add_argument("--update-ratio", type=float, default=0.4)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--stale-lock", action="store_true",
+                        help="leave the lock file of a killed writer behind before the workers start")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--keep-workspace", action="store_true")
+    args = parser.parse_args(argv)
+
+    workspace = tempfile.mkdtemp(prefix="guest-stress-")
+    prepare_workspace(workspace)
+    sys.path.insert(0, REPO_ROOT)
+    from app.services.guests import GUEST_FIELDS
+    args.fields = list(GUEST_FIELDS)
+    csv_path = os.path.join(workspace, "data", "guests.csv")
+    write_synthetic_csv(csv_path, args.fields, args.rows, args.seed)
+    # Seed rows start at version 1 so expected versions are easy to compute
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        seed = list(csv.DictReader(f))
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=args.fields)
+        writer.writeheader()
+        writer.writerows({**r, 'Version': "1"} for r in seed)
+
+    ctx = multiprocessing.get_context("spawn")
+    if args.stale_lock:
+        crashed = ctx.Process(target=crashed_writer, args=(workspace,))
+        crashed.start()
+        crashed.join()
+    queue = ctx.Queue()
+    started = time.perf_counter()
+    procs = [ctx.Process(target=worker_main, args=(w, workspace, args, queue)) for w in range(args.workers)]
+    for p in procs:
+        p.start()
+    results = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - started
+
+    report = verify(csv_path, args.fields, args.rows, results)
+    latencies = [x for r in results for x in r["latencies"]]
+    ops = Counter()
+    for r in results:
+        ops.update(r["ops"])
+    report.update({
+        "mode": args.mode,
+        "workers": args.workers,
+        "elapsed_s": round(elapsed, 3),
+        "ops": dict(ops),
+        "ops_per_s": round(sum(ops.values()) / elapsed, 1) if elapsed else 0.0,
+        "op_latency_ms": {p: round(_percentile(latencies, p) * 1000, 2) for p in (50, 90, 99)},
+        "timeouts": sum(r["timeouts"] for r in results),
+        "lock_timeouts": dict(sum((Counter(r.get("lock_timeouts", {})) for r in results), Counter())),
+        "version_conflicts": sum(r["conflicts"] for r in results),
+        "gave_up": sum(r["gave_up"] for r in results),
+        "corrupt_reads": sum(r["corrupt_reads"] for r in results),
+        "worker_errors": [r["error"] for r in results if r.get("error")],
+        "stale_lock_file": os.path.exists(csv_path + ".lock"),
+        "lock_takeovers": sum(r.get("lock_takeovers", 0) for r in results),
+    })
+    waits = merge_lock_waits(results)
+    report["lock_wait"] = {
+        op: {
+            "count": w["count"],
+            "mean_ms": round(w["sum"] / w["count"] * 1000, 2) if w["count"] else 0.0,
+            "cumulative": {("+Inf" if b == float("inf") else f"<={b * 1000:g}ms"): n for b, n in sorted(w["buckets"].items())},
+        }
+        for op, w in waits.items()
+    }
+    if report["stale_lock_file"]:
+        report["problems"].append("lock file left behind")
+    if args.stale_lock and report["lock_takeovers"] != 1:
+        report["problems"].append(f"killed writer's lock taken over {report['lock_takeovers']} times (expected once)")
+    if report["worker_errors"]:
+        report["problems"].append(f"{len(report['worker_errors'])} workers crashed")
+
+    if args.keep_workspace:
+        report["workspace"] = workspace
+    else:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"mode={report['mode']} workers={args.workers} ops={report['ops']} in {report['elapsed_s']}s "
+              f"({report['ops_per_s']} ops/s)")
+        print(f"op latency p50/p90/p99: {report['op_latency_ms'][50]}/{report['op_latency_ms'][90]}/{report['op_latency_ms'][99]} ms")
+        print(f"timeouts={report['timeouts']} lock_timeouts={report['lock_timeouts']} "
+              f"conflicts={report['version_conflicts']} gave_up={report['gave_up']} corrupt_reads={report['corrupt_reads']} "
+              f"lock_takeovers={report['lock_takeovers']}")
+        for op, w in report["lock_wait"].items():
+            print(f"lock wait [{op}] n={w['count']} mean={w['mean_ms']}ms")
+            for bound, n in w["cumulative"].items():
+                print(f"    {bound:>12} {n}")
+        print(f"final rows={report['rows']}")
+        if report["problems"]:
+            print("FAILED:")
+            for problem in report["problems"]:
+                print(f"  - {problem}")
+        else:
+            print("OK: no lost, duplicated or corrupted rows; no lost updates")
+    return 1 if report["problems"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+// static/js/admin_dashboard.js
+/**
+ * Live admin dashboard counters.
+ * Subscribes to /admin/stats/stream (Server-Sent Events) and updates the
+ * counters, the per-hour chart and the institution list in place.
+ */
+(function () {
+    'use strict';
+
+    const panel = document.getElementById('liveStats');
+    if (!panel || typeof EventSource === 'undefined') {
+        return;
+    }
+    const statusEl = panel.querySelector('[data-stat="status"]');
+    let chart = null;
+
+    function setText(name, value) {
+        document.querySelectorAll('[data-stat="' + name + '"]').forEach(function (el) {
+            el.textContent = value;
+        });
+    }
+
+    function renderInstitutions(items) {
+        const list = panel.querySelector('[data-stat="institutions"]');
+        list.replaceChildren();
+        if (!items.length) {
+            const empty = document.createElement('li');
+            empty.className = 'list-group-item px-0 text-muted';
+            empty.textContent = 'No registrations yet';
+            list.appendChild(empty);
+            return;
+        }
+        items.forEach(function (item) {
+            const li = document.createElement('li');
+            li.className = 'list-group-item d-flex justify-content-between px-0';
+            const name = document.createElement('span');
+            name.textContent = item.name;
+            const badge = document.createElement('span');
+            badge.className = 'badge bg-primary rounded-pill';
+            badge.textContent = item.count;
+            li.append(name, badge);
+            list.appendChild(li);
+        });
+    }
+
+    function renderChart(perHour) {
+        const canvas = document.getElementById('registrationsChart');
+        if (!canvas || typeof Chart === 'undefined') {
+            return;
+        }
+        const labels = perHour.map(function (p) { return p.hour.slice(11) + ':00'; });
+        const counts = perHour.map(function (p) { return p.count; });
+        if (chart) {
+            chart.data.labels = labels;
+            chart.data.datasets[0].data = counts;
+            chart.update('none');
+            return;
+        }
+        chart = new Chart(canvas, {
+            type: 'bar',
+            data: { labels: labels, datasets: [{ label: 'Registrations', data: counts, backgroundColor: '#0d6efd' }] },
+            options: {
+                animation: false,
+                plugins: { legend: { display: false } },
+                scales: { y: { beginAtZero: true, ticks: { precision: 0 } } }
+            }
+        });
+    }
+
+    function render(stats) {
+        setText('total', stats.total);
+        setText('last_hour', stats.last_hour);
+        setText('uploads', stats.uploads);
+        setText('institution_count', stats.institution_count);
+        renderInstitutions(stats.institutions);
+        renderChart(stats.per_hour);
+    }
+
+    const initial = document.getElementById('initialStats');
+    if (initial) {
+        render(JSON.parse(initial.textContent));
+    }
+
+    const source = new EventSource(panel.dataset.streamUrl);
+    source.addEventListener('stats', function (event) {
+        render(JSON.parse(event.data));
+        statusEl.textContent = 'Live';
+    });
+    source.onerror = function () {
+        // EventSource reconnects on its own; just tell the organizer
+        statusEl.textContent = 'Reconnecting…';
+    };
+    window.addEventListener('pagehide', function () { source.close(); });
+})();
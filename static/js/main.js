@@ -12,9 +12,11 @@ document.addEventListener('DOMContentLoaded', function() {
     initializeHelpSystem();
     handleSearchForm();
     initHeaderFX();
+    initializeOfflineSupport();
+    initializeChunkedUploads();
     
     // Initialize any data tables
-    if (typeof $.fn.DataTable !== 'undefined') {
+    if (typeof window.$ !== 'undefined' && typeof $.fn.DataTable !== 'undefined') {
         initializeDataTables();
     }
     
@@ -302,11 +304,11 @@ function updateSearchResults(results) {
  * @param {string} type - Toast type (success, error, warning, info)
  */
 function showToast(title, message, type = 'info') {
-    const toastContainer = document.querySelector('.toast-container');
+    let toastContainer = document.querySelector('.toast-container');
     if (!toastContainer) {
-        const container = document.createElement('div');
-        container.className = 'toast-container';
-        document.body.appendChild(container);
+        toastContainer = document.createElement('div');
+        toastContainer.className = 'toast-container';
+        document.body.appendChild(toastContainer);
     }
     
     const toastId = `toast-${Date.now()}`;
@@ -355,6 +357,188 @@ function showToast(title, message, type = 'info') {
     });
 }
 
+/**
+ * Register the service worker (static/js/sw.js, served as /sw.js) and
+ * report what it does with edits made while offline
+ */
+function initializeOfflineSupport() {
+    if (!('serviceWorker' in navigator)) return;
+
+    navigator.serviceWorker.register('/sw.js').catch(error => {
+        console.warn('Service worker registration failed:', error);
+    });
+
+    const messages = {
+        sent: ['Saved', 'Your changes made offline have been saved.', 'success'],
+        conflict: ['Not saved', 'Your offline changes were not saved because your details were changed elsewhere. Please review and save again.', 'warning'],
+        signed_out: ['Not saved', 'Your session ended before your offline changes could be sent. Please log in and save again.', 'warning'],
+        other_guest: ['Not saved', 'Offline changes made by another guest on this device were discarded.', 'warning'],
+        rejected: ['Not saved', 'Your offline changes could not be saved. Please review and save again.', 'error']
+    };
+    navigator.serviceWorker.addEventListener('message', event => {
+        const data = event.data || {};
+        if (data.type !== 'edit-sync') return;
+        const [title, message, type] = messages[data.status] || messages.rejected;
+        showToast(title, message, type);
+        if (data.status === 'sent' && window.location.pathname === '/guest') {
+            setTimeout(() => window.location.reload(), 1500);
+        }
+    });
+
+    const params = new URLSearchParams(window.location.search);
+    if (params.has('queued')) {
+        showToast('Saved on this device', 'You are offline. Your changes will be sent as soon as the connection is back.', 'info');
+        params.delete('queued');
+        const query = params.toString();
+        window.history.replaceState(null, '', window.location.pathname + (query ? `?${query}` : ''));
+    }
+
+    // Browsers without Background Sync: send queued edits when the connection returns
+    const flush = () => {
+        if (navigator.onLine && navigator.serviceWorker.controller) {
+            navigator.serviceWorker.controller.postMessage({ type: 'flush' });
+        }
+    };
+    window.addEventListener('online', () => {
+        toggleOfflineNotice(false);
+        flush();
+    });
+    window.addEventListener('offline', () => toggleOfflineNotice(true));
+    toggleOfflineNotice(!navigator.onLine);
+    flush();
+}
+
+/**
+ * Show or hide the notice that the page may be a saved copy
+ * @param {boolean} offline - Whether the browser is offline
+ */
+function toggleOfflineNotice(offline) {
+    let notice = document.getElementById('offlineNotice');
+    if (!offline) {
+        if (notice) notice.remove();
+        return;
+    }
+    if (notice) return;
+    const main = document.querySelector('main');
+    if (!main) return;
+    notice = document.createElement('div');
+    notice.id = 'offlineNotice';
+    notice.className = 'alert alert-warning';
+    notice.innerHTML = '<i class="fas fa-wifi me-2"></i>You are offline. This may be a saved copy; changes are sent when you are back online.';
+    main.prepend(notice);
+}
+
+/**
+ * Send files chosen in forms marked data-chunked-upload="<api url>" in
+ * chunks (app/services/uploads.py). A dropped connection resumes from the
+ * offset the server reports, also after a page reload, so large slide decks
+ * survive flaky Wi-Fi. Without JavaScript the form posts normally.
+ */
+function initializeChunkedUploads() {
+    document.querySelectorAll('form[data-chunked-upload]').forEach(form => {
+        form.addEventListener('submit', async event => {
+            const input = form.querySelector('input[type="file"]');
+            const file = input && input.files[0];
+            if (!file) return;
+            event.preventDefault();
+            const button = form.querySelector('button[type="submit"]');
+            const progress = uploadProgressBar(form);
+            if (button) button.disabled = true;
+            try {
+                await chunkedUpload(form.dataset.chunkedUpload, file, fraction => {
+                    progress.style.width = `${Math.round(fraction * 100)}%`;
+                    progress.textContent = `${Math.round(fraction * 100)}%`;
+                });
+                window.location.reload();
+            } catch (error) {
+                showToast('Upload failed', error.message, 'error');
+                if (button) button.disabled = false;
+            }
+        });
+    });
+}
+
+function uploadProgressBar(form) {
+    let bar = form.querySelector('.upload-progress .progress-bar');
+    if (!bar) {
+        const wrapper = document.createElement('div');
+        wrapper.className = 'progress upload-progress mb-3';
+        wrapper.innerHTML = '<div class="progress-bar" role="progressbar" style="width: 0%">0%</div>';
+        form.appendChild(wrapper);
+        bar = wrapper.firstElementChild;
+    }
+    return bar;
+}
+
+async function uploadRequest(url, options) {
+    const response = await fetch(url, { credentials: 'same-origin', ...options });
+    const body = response.status === 204 ? {} : await response.json().catch(() => ({}));
+    return { response, body };
+}
+
+async function chunkedUpload(baseUrl, file, onProgress) {
+    const resumeKey = `upload:${baseUrl}:${file.name}:${file.size}:${file.lastModified}`;
+    let upload = null;
+    const savedId = localStorage.getItem(resumeKey);
+    if (savedId) {
+        const { response, body } = await uploadRequest(`${baseUrl}/${savedId}`);
+        if (response.ok) upload = body;
+    }
+    if (!upload) {
+        const { response, body } = await uploadRequest(baseUrl, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size })
+        });
+        if (!response.ok) throw new Error(body.detail || `Server answered ${response.status}`);
+        upload = body;
+        localStorage.setItem(resumeKey, upload.id);
+    }
+
+    const url = `${baseUrl}/${upload.id}`;
+    let offset = upload.offset;
+    let retries = 0;
+    while (offset < file.size) {
+        onProgress(offset / file.size);
+        const chunk = file.slice(offset, offset + upload.chunk_size);
+        const headers = { 'Upload-Offset': String(offset), 'Content-Type': 'application/offset+octet-stream' };
+        if (window.crypto && crypto.subtle) {
+            const digest = await crypto.subtle.digest('SHA-256', await chunk.arrayBuffer());
+            headers['Upload-Checksum'] = `sha256 ${btoa(String.fromCharCode(...new Uint8Array(digest)))}`;
+        }
+        try {
+            const { response, body } = await uploadRequest(url, { method: 'PATCH', headers, body: chunk });
+            if (response.ok || (response.status === 409 && body.offset !== undefined)) {
+                // 409 with an offset: an earlier attempt got further than we knew; continue from there
+                offset = body.offset;
+                retries = 0;
+                continue;
+            }
+            if (response.status < 500 && response.status !== 409 && response.status !== 422) {
+                localStorage.removeItem(resumeKey);
+                throw new Error(body.detail || `Server answered ${response.status}`);
+            }
+        } catch (error) {
+            if (!(error instanceof TypeError)) throw error;  // TypeError: network failure
+        }
+        // Network failure, busy server or damaged chunk: wait, then ask where to continue
+        retries += 1;
+        if (retries > 8) throw new Error('The connection keeps failing. Choose the file again later to resume.');
+        await new Promise(resolve => setTimeout(resolve, Math.min(30000, 1000 * 2 ** retries)));
+        const { response, body } = await uploadRequest(url).catch(() => ({ response: { ok: false }, body: {} }));
+        if (response.ok) offset = body.offset;
+    }
+    onProgress(1);
+    const { response, body } = await uploadRequest(`${url}/complete`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({})
+    });
+    localStorage.removeItem(resumeKey);
+    if (!response.ok) throw new Error(body.detail || `Server answered ${response.status}`);
+    return body;
+}
+
 // Export functions for global use
 window.Utils = Utils;
 window.showToast = showToast;
@@ -0,0 +1,239 @@
+// static/js/sw.js
+// Service worker. Served as /sw.js (app/routes/media.py), which puts
+// `self.SW_CONFIG = {version, precache}` in front of this file so the
+// precache list carries this deploy's fingerprinted asset URLs.
+
+const CONFIG = self.SW_CONFIG || { version: 'dev', precache: [] };
+const STATIC_CACHE = `static-${CONFIG.version}`;
+const PAGE_CACHE = 'guest-pages';
+const RUNTIME_CACHE = 'runtime';
+const RUNTIME_MAX_ENTRIES = 60;
+const NETWORK_TIMEOUT_MS = 3000;
+
+// Personal pages and queued edits kept for offline use; cleared on login/logout so the next person never sees or sends them
+const PAGE_PATHS = ['/guest', '/api/v1/me', '/api/v1/me/files'];
+const SESSION_PATHS = ['/login', '/logout', '/guest/login', '/admin/login', '/register'];
+const QUEUED_FORMS = ['/guest/update'];
+const CDN_HOSTS = ['cdn.jsdelivr.net', 'cdnjs.cloudflare.com'];
+
+const SYNC_TAG = 'guest-edits';
+const QUEUE_DB = 'offline-queue';
+const QUEUE_STORE = 'edits';
+
+const precached = new Set(CONFIG.precache.map(url => new URL(url, self.location.origin).href));
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(STATIC_CACHE)
+            .then(cache => cache.addAll(CONFIG.precache))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(keys
+                .filter(key => key.startsWith('static-') && key !== STATIC_CACHE)
+                .map(key => caches.delete(key))))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+    const sameOrigin = url.origin === self.location.origin;
+
+    if (sameOrigin && SESSION_PATHS.includes(url.pathname)) {
+        // Let the browser handle it; only forget the previous person's pages and unsent edits
+        event.waitUntil(Promise.all([caches.delete(PAGE_CACHE), queueRequest('readwrite', store => store.clear())]));
+        return;
+    }
+    if (request.method === 'POST' && sameOrigin && QUEUED_FORMS.includes(url.pathname)) {
+        event.respondWith(submitOrQueue(request));
+        return;
+    }
+    if (request.method !== 'GET') return;
+
+    if (sameOrigin && PAGE_PATHS.includes(url.pathname)) {
+        event.respondWith(networkFirst(event, request));
+    } else if (precached.has(request.url)) {
+        event.respondWith(cacheFirst(request));
+    } else if ((sameOrigin && (url.pathname.startsWith('/static/') || url.pathname.startsWith('/img/')))
+               || CDN_HOSTS.includes(url.hostname)) {
+        event.respondWith(staleWhileRevalidate(event, request));
+    }
+});
+
+self.addEventListener('sync', event => {
+    if (event.tag === SYNC_TAG) {
+        // Rejecting makes the browser retry later
+        event.waitUntil(flushQueue(true));
+    }
+});
+
+self.addEventListener('message', event => {
+    if (event.data && event.data.type === 'flush') {
+        event.waitUntil(flushQueue(false));
+    }
+});
+
+/* --- caching strategies --- */
+
+function cacheable(response) {
+    return response && response.ok && !response.redirected && (response.type === 'basic' || response.type === 'cors');
+}
+
+async function cacheFirst(request) {
+    const cached = await caches.match(request);
+    return cached || fetch(request);
+}
+
+/**
+ * Fresh page when the network answers in time; otherwise the last copy.
+ * The server revalidates with ETags, so a fresh fetch is usually a 304.
+ */
+async function networkFirst(event, request) {
+    const cache = await caches.open(PAGE_CACHE);
+    const network = fetch(request).then(async response => {
+        if (cacheable(response)) {
+            await cache.put(request, response.clone());
+        }
+        return response;
+    });
+    // The cache still gets updated when the slow response arrives
+    event.waitUntil(network.catch(() => null));
+    const timeout = new Promise(resolve => setTimeout(resolve, NETWORK_TIMEOUT_MS));
+    try {
+        const response = await Promise.race([network, timeout]);
+        if (response) return response;
+        const cached = await cache.match(request, { ignoreSearch: true });
+        return cached || await network;
+    } catch (error) {
+        const cached = await cache.match(request, { ignoreSearch: true });
+        return cached || offlineResponse(request);
+    }
+}
+
+async function staleWhileRevalidate(event, request) {
+    const cache = await caches.open(RUNTIME_CACHE);
+    const cached = await cache.match(request);
+    const network = fetch(request).then(async response => {
+        // Cross-origin <link>/<script> requests give opaque responses; keep those too
+        if (cacheable(response) || response.type === 'opaque') {
+            await cache.put(request, response.clone());
+            await trimCache(cache, RUNTIME_MAX_ENTRIES);
+        }
+        return response;
+    });
+    if (cached) {
+        event.waitUntil(network.catch(() => null));
+        return cached;
+    }
+    return network;
+}
+
+async function trimCache(cache, maxEntries) {
+    const keys = await cache.keys();
+    // Oldest entries first (insertion order)
+    await Promise.all(keys.slice(0, Math.max(0, keys.length - maxEntries)).map(key => cache.delete(key)));
+}
+
+function offlineResponse(request) {
+    if (request.mode !== 'navigate') {
+        return new Response(JSON.stringify({ detail: 'Offline' }), {
+            status: 503, headers: { 'Content-Type': 'application/json' }
+        });
+    }
+    return new Response(
+        '<!DOCTYPE html><meta charset="utf-8"><meta name="viewport" content="width=device-width, initial-scale=1">'
+        + '<title>Offline</title><p style="font-family:sans-serif;padding:2rem">'
+        + 'You are offline and this page has not been saved on this device yet. Please try again when connected.</p>',
+        { status: 503, headers: { 'Content-Type': 'text/html; charset=utf-8' } }
+    );
+}
+
+/* --- offline edit queue --- */
+
+function openQueue() {
+    return new Promise((resolve, reject) => {
+        const open = indexedDB.open(QUEUE_DB, 1);
+        open.onupgradeneeded = () => open.result.createObjectStore(QUEUE_STORE, { keyPath: 'url' });
+        open.onsuccess = () => resolve(open.result);
+        open.onerror = () => reject(open.error);
+    });
+}
+
+async function queueRequest(mode, operation) {
+    const db = await openQueue();
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(QUEUE_STORE, mode);
+        const request = operation(tx.objectStore(QUEUE_STORE));
+        tx.oncomplete = () => { db.close(); resolve(request.result); };
+        tx.onerror = () => { db.close(); reject(tx.error); };
+    });
+}
+
+/**
+ * Send a profile edit, or keep it on the device when the network is down.
+ * Only the latest edit per form is kept: it carries the version the guest
+ * saw and their `guest_id`, so the server still rejects it if the record
+ * changed meanwhile or another guest is signed in when it is sent.
+ */
+async function submitOrQueue(request) {
+    const body = await request.clone().text();
+    try {
+        return await fetch(request);
+    } catch (error) {
+        await queueRequest('readwrite', store => store.put({
+            url: request.url,
+            guestId: new URLSearchParams(body).get('guest_id') || '',
+            body: body,
+            contentType: request.headers.get('Content-Type') || 'application/x-www-form-urlencoded',
+            queuedAt: Date.now()
+        }));
+        if (self.registration.sync) {
+            await self.registration.sync.register(SYNC_TAG).catch(() => null);
+        }
+        return Response.redirect('/guest?queued=1', 303);
+    }
+}
+
+async function flushQueue(rethrow) {
+    const edits = await queueRequest('readonly', store => store.getAll());
+    for (const edit of edits) {
+        let response;
+        try {
+            response = await fetch(edit.url, {
+                method: 'POST',
+                body: edit.body,
+                headers: { 'Content-Type': edit.contentType },
+                credentials: 'same-origin',
+                redirect: 'manual'
+            });
+        } catch (error) {
+            if (rethrow) throw error;
+            return;
+        }
+        if (response.status >= 500) {
+            // Busy server: keep the edit for the next attempt
+            if (rethrow) throw new Error(`Server answered ${response.status}`);
+            return;
+        }
+        // A saved edit answers with a redirect back to the dashboard
+        const status = response.type === 'opaqueredirect' || response.ok ? 'sent'
+            : response.status === 409 ? 'conflict'
+            : response.status === 401 ? 'signed_out'
+            : response.status === 403 ? 'other_guest'
+            : 'rejected';
+        await queueRequest('readwrite', store => store.delete(edit.url));
+        await caches.open(PAGE_CACHE).then(cache => cache.delete('/guest'));
+        await notifyClients({ type: 'edit-sync', status: status });
+    }
+}
+
+async function notifyClients(message) {
+    const clients = await self.clients.matchAll({ type: 'window' });
+    clients.forEach(client => client.postMessage(message));
+}